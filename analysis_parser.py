@@ -0,0 +1,469 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI分析结果解析器
+将豆包模型返回的JSON文本（可能带有代码块标记、尾随文字或被截断）
+解析为紧凑的违规记录，字段与 client/src/types/index.ts 保持一致
+"""
+
+import re
+import json
+import time
+from typing import Dict, List, Any, Optional, Tuple, Iterable, Iterator
+
+# 代码块标记，与 routes/analyze.js 中 parseAIResponse 的清理规则一致
+_FENCE_RE = re.compile(r'```(?:json)?\n?')
+# 尾随逗号（模型常见错误）："a": 1, } / [1, 2, ]
+_TRAILING_COMMA_RE = re.compile(r',\s*([}\]])')
+# 扫描器在字符串外/内需要关注的字符
+_STRUCT_RE = re.compile(r'["{}\[\]]')
+_STRING_RE = re.compile(r'["\\]')
+
+_DECODER = json.JSONDecoder()
+
+
+class Regulation:
+    """法规条例"""
+
+    __slots__ = ('code', 'article', 'content')
+
+    def __init__(self, code: str = '', article: str = '', content: str = ''):
+        self.code = code
+        self.article = article
+        self.content = content
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'Regulation':
+        if not isinstance(data, dict):
+            return cls(content=_as_str(data))
+        return cls(_as_str(data.get('code')), _as_str(data.get('article')), _as_str(data.get('content')))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'code': self.code, 'article': self.article, 'content': self.content}
+
+    def __repr__(self):
+        return f"Regulation({self.code!r}, {self.article!r})"
+
+
+class Violation:
+    """违规行为"""
+
+    __slots__ = ('type', 'category', 'description', 'coordinates',
+                 'regulations', 'suggestions', 'severity', 'risk_level')
+
+    def __init__(self, type: str = '一般违规', category: str = '', description: str = '',
+                 coordinates: Optional[Tuple[int, int, int, int]] = None,
+                 regulations: Optional[List[Regulation]] = None,
+                 suggestions: Optional[List[str]] = None,
+                 severity: str = 'medium', risk_level: str = ''):
+        self.type = type
+        self.category = category
+        self.description = description
+        self.coordinates = coordinates
+        self.regulations = regulations or []
+        self.suggestions = suggestions or []
+        self.severity = severity
+        self.risk_level = risk_level
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Violation':
+        vtype = _as_str(data.get('type')) or '一般违规'
+        severity = _as_str(data.get('severity'))
+        if severity not in ('high', 'medium', 'low'):
+            severity = 'high' if vtype == '严重违规' else 'medium'
+        regulations = data.get('regulations') or []
+        if not isinstance(regulations, list):
+            regulations = [regulations]
+        suggestions = data.get('suggestions') or []
+        if not isinstance(suggestions, list):
+            suggestions = [suggestions]
+        return cls(
+            type=vtype,
+            category=_as_str(data.get('category')),
+            description=_as_str(data.get('description')),
+            coordinates=parse_coordinates(data.get('coordinates')),
+            regulations=[Regulation.from_dict(r) for r in regulations],
+            suggestions=[_as_str(s) for s in suggestions if s is not None],
+            severity=severity,
+            risk_level=_as_str(data.get('risk_level')),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'type': self.type,
+            'category': self.category,
+            'description': self.description,
+            'coordinates': list(self.coordinates) if self.coordinates else [],
+            'regulations': [r.to_dict() for r in self.regulations],
+            'suggestions': list(self.suggestions),
+            'severity': self.severity,
+            'risk_level': self.risk_level,
+        }
+
+    def __repr__(self):
+        return f"Violation({self.type!r}, {self.category!r}, {self.coordinates!r})"
+
+
+class Summary:
+    """分析摘要"""
+
+    __slots__ = ('severe_count', 'normal_count', 'total_score',
+                 'overall_assessment', 'priority_actions')
+
+    def __init__(self, severe_count: int = 0, normal_count: int = 0, total_score: int = 100,
+                 overall_assessment: str = '未能生成评估报告',
+                 priority_actions: Optional[List[str]] = None):
+        self.severe_count = severe_count
+        self.normal_count = normal_count
+        self.total_score = total_score
+        self.overall_assessment = overall_assessment
+        self.priority_actions = priority_actions or []
+
+    @classmethod
+    def from_dict(cls, data: Any) -> 'Summary':
+        if not isinstance(data, dict):
+            return cls()
+        actions = data.get('priority_actions') or []
+        if not isinstance(actions, list):
+            actions = [actions]
+        return cls(
+            severe_count=_as_int(data.get('severe_count')),
+            normal_count=_as_int(data.get('normal_count')),
+            total_score=_as_int(data.get('total_score')),
+            overall_assessment=_as_str(data.get('overall_assessment')) or '未能生成评估报告',
+            priority_actions=[_as_str(a) for a in actions if a is not None],
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'severe_count': self.severe_count,
+            'normal_count': self.normal_count,
+            'total_score': self.total_score,
+            'overall_assessment': self.overall_assessment,
+            'priority_actions': list(self.priority_actions),
+        }
+
+
+class AnalysisResult:
+    """AI分析结果"""
+
+    __slots__ = ('violations', 'summary', 'repaired')
+
+    def __init__(self, violations: List[Violation], summary: Summary, repaired: bool = False):
+        self.violations = violations
+        self.summary = summary
+        # 是否经过截断/格式修复
+        self.repaired = repaired
+
+    def to_dict(self) -> Dict[str, Any]:
+        """转换为报告生成器使用的字典结构"""
+        return {
+            'violations': [v.to_dict() for v in self.violations],
+            'summary': self.summary.to_dict(),
+        }
+
+
+def _as_str(value: Any) -> str:
+    if value is None:
+        return ''
+    return value if isinstance(value, str) else str(value)
+
+
+def _as_int(value: Any) -> int:
+    try:
+        return int(round(float(value)))
+    except (TypeError, ValueError):
+        return 0
+
+
+def parse_coordinates(value: Any) -> Optional[Tuple[int, int, int, int]]:
+    """校验坐标为4个非负整数 [x1, y1, x2, y2]，无效时返回None"""
+    if isinstance(value, str):
+        value = re.findall(r'-?\d+(?:\.\d+)?', value)
+    if not isinstance(value, (list, tuple)) or len(value) != 4:
+        return None
+    try:
+        x1, y1, x2, y2 = (int(round(float(c))) for c in value)
+    except (TypeError, ValueError):
+        return None
+    if x1 > x2:
+        x1, x2 = x2, x1
+    if y1 > y2:
+        y1, y2 = y2, y1
+    if x2 <= 0 or y2 <= 0:
+        return None
+    return (max(0, x1), max(0, y1), x2, y2)
+
+
+def _clean(text: str) -> str:
+    """移除markdown代码块标记，定位到第一个 {"""
+    if '```' in text:
+        text = _FENCE_RE.sub('', text)
+    start = text.find('{')
+    return text[start:] if start >= 0 else ''
+
+
+class _Scanner:
+    """增量JSON结构扫描器
+
+    记录括号栈与字符串状态，用于：
+    - 在流式输入中识别 violations 数组内已完整的违规对象
+    - 在输入被截断时找到最后一个可安全截断的位置并补全括号
+    """
+
+    __slots__ = ('text', 'pos', 'stack', 'in_string', 'string_start', 'last_key',
+                 'violations_depth', 'object_start', 'cut_pos', 'cut_stack', 'done',
+                 'on_violation')
+
+    def __init__(self, on_violation=None):
+        self.text = ''
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.string_start = 0
+        self.last_key = None
+        self.violations_depth = -1
+        self.object_start = -1
+        self.cut_pos = 0
+        self.cut_stack = ''
+        self.done = False
+        self.on_violation = on_violation
+
+    def feed(self, chunk: str):
+        if self.done:
+            return
+        self.text += chunk
+        text = self.text
+        pos = self.pos
+        stack = self.stack
+        end = len(text)
+        while pos < end:
+            if self.in_string:
+                m = _STRING_RE.search(text, pos)
+                if m is None:
+                    pos = end
+                    break
+                if m.group() == '\\':
+                    if m.end() >= end:
+                        # 转义符在块末尾，等待下一块
+                        pos = m.start()
+                        break
+                    pos = m.end() + 1
+                    continue
+                pos = m.end()
+                self.in_string = False
+                if len(stack) == 1:
+                    self.last_key = text[self.string_start:pos - 1]
+                elif stack and stack[-1] == '[':
+                    self._mark_cut(pos)
+                continue
+
+            m = _STRUCT_RE.search(text, pos)
+            if m is None:
+                pos = end
+                break
+            ch = m.group()
+            pos = m.end()
+            if ch == '"':
+                self.in_string = True
+                self.string_start = pos
+            elif ch == '{' or ch == '[':
+                if ch == '[' and len(stack) == 1 and self.last_key == 'violations':
+                    self.violations_depth = 2
+                elif ch == '{' and len(stack) == self.violations_depth:
+                    self.object_start = pos - 1
+                stack.append(ch)
+            else:
+                if not stack:
+                    continue
+                stack.pop()
+                if (ch == '}' and len(stack) == self.violations_depth
+                        and self.object_start >= 0 and self.on_violation is not None):
+                    self.on_violation(text[self.object_start:pos])
+                    self.object_start = -1
+                elif ch == ']' and len(stack) == 1 and self.violations_depth == 2:
+                    self.violations_depth = -1
+                self._mark_cut(pos)
+                if not stack:
+                    # 根对象已结束，后面的尾随文字忽略
+                    self.done = True
+                    break
+        self.pos = pos
+
+    def _mark_cut(self, pos: int):
+        self.cut_pos = pos
+        self.cut_stack = ''.join(self.stack)
+
+    @property
+    def complete(self) -> bool:
+        return self.done
+
+    def repaired_text(self) -> str:
+        """截断到最后一个完整值并补全括号"""
+        if self.complete:
+            return self.text[:self.pos]
+        body = self.text[:self.cut_pos].rstrip()
+        if body.endswith(','):
+            body = body[:-1]
+        closers = ''.join('}' if c == '{' else ']' for c in reversed(self.cut_stack))
+        return body + closers
+
+
+def _loads_lenient(text: str) -> Any:
+    try:
+        return _DECODER.raw_decode(text)[0]
+    except ValueError:
+        return json.loads(_TRAILING_COMMA_RE.sub(r'\1', text))
+
+
+def _build_result(data: Any, repaired: bool) -> AnalysisResult:
+    if not isinstance(data, dict):
+        data = {}
+    raw_violations = data.get('violations') or []
+    if not isinstance(raw_violations, list):
+        raw_violations = []
+    violations = [Violation.from_dict(v) for v in raw_violations if isinstance(v, dict)]
+    summary = Summary.from_dict(data.get('summary'))
+    # 摘要缺失或经过截断修复时，模型给出的评分不可信（缺失时默认为100），按违规项重新计算
+    finalize_summary(summary, violations, recompute=repaired or not isinstance(data.get('summary'), dict))
+    return AnalysisResult(violations, summary, repaired)
+
+
+def safety_score(severe: int, normal: int) -> int:
+    """安全评分规则：严重违规每项扣20分，一般违规每项扣10分"""
+    return max(0, 100 - severe * 20 - normal * 10)
+
+
+def finalize_summary(summary: Summary, violations: List[Violation], recompute: bool = False):
+    """按 parseAIResponse 的规则重新统计违规数量与评分
+
+    recompute 为True时忽略已有评分，按严重/一般违规数量重新计算
+    """
+    severe = sum(1 for v in violations if v.type == '严重违规')
+    normal = sum(1 for v in violations if v.type == '一般违规')
+    summary.severe_count = severe
+    summary.normal_count = normal
+    if recompute or not summary.total_score:
+        summary.total_score = safety_score(severe, normal)
+
+
+def parse_analysis(text: str) -> Optional[AnalysisResult]:
+    """解析模型返回文本，无法解析时返回None
+
+    快速路径直接使用C实现的json解码；失败时用扫描器修复尾随逗号和截断
+    """
+    cleaned = _clean(text or '')
+    if not cleaned:
+        return None
+    try:
+        return _build_result(_DECODER.raw_decode(cleaned)[0], False)
+    except ValueError:
+        pass
+
+    scanner = _Scanner()
+    scanner.feed(cleaned)
+    try:
+        data = _loads_lenient(scanner.repaired_text())
+    except ValueError:
+        return None
+    return _build_result(data, True)
+
+
+class StreamingParser:
+    """流式解析器：边接收模型输出边产出已完整的违规记录
+
+    用法:
+        parser = StreamingParser()
+        for chunk in chunks:
+            for violation in parser.feed(chunk):
+                ...
+        result = parser.close()
+    """
+
+    def __init__(self):
+        self._pending = []
+        self._violations = []
+        self._scanner = _Scanner(on_violation=self._pending.append)
+        self._prefix = ''
+        self._started = False
+
+    def feed(self, chunk: str) -> List[Violation]:
+        if not self._started:
+            # 在找到根对象之前缓存，以便剥离代码块标记
+            self._prefix += chunk
+            cleaned = _clean(self._prefix)
+            if not cleaned:
+                return []
+            self._started = True
+            chunk = cleaned
+        self._scanner.feed(chunk)
+        return self._drain()
+
+    def _drain(self) -> List[Violation]:
+        ready = []
+        for raw in self._pending:
+            try:
+                ready.append(Violation.from_dict(_loads_lenient(raw)))
+            except ValueError:
+                continue
+        self._pending.clear()
+        self._violations.extend(ready)
+        return ready
+
+    def close(self) -> Optional[AnalysisResult]:
+        """输入结束，返回完整结果（必要时修复截断）"""
+        if not self._started:
+            return None
+        scanner = self._scanner
+        try:
+            data = _loads_lenient(scanner.repaired_text())
+        except ValueError:
+            data = {}
+        result = _build_result(data, not scanner.complete)
+        if len(result.violations) < len(self._violations):
+            # 修复后的文本丢失了已流式产出的违规项时，以流式结果为准
+            result.violations = list(self._violations)
+            finalize_summary(result.summary, result.violations, recompute=True)
+        return result
+
+
+def iter_parse(texts: Iterable[str]) -> Iterator[Optional[AnalysisResult]]:
+    """批量解析多条模型输出"""
+    for text in texts:
+        yield parse_analysis(text)
+
+
+def benchmark(count: int = 5000) -> Dict[str, float]:
+    """解析性能测试，返回每秒可解析的响应数"""
+    sample = {
+        'violations': [{
+            'type': '严重违规' if i % 2 else '一般违规',
+            'category': '基坑支护安全',
+            'description': '沟槽深度超过1.5m，两侧边缘未设置标准防护栏杆',
+            'coordinates': [100 + i, 100, 300 + i, 220],
+            'regulations': [{'code': 'JGJ59-2011', 'article': '4.1.3',
+                             'content': '基坑深度超过1.5m时，必须设置安全防护栏杆'}],
+            'suggestions': ['立即设置安全防护栏杆', '加强现场安全巡查'],
+            'severity': 'high',
+            'risk_level': '极高风险',
+        } for i in range(5)],
+        'summary': {'total_score': 45, 'overall_assessment': '存在严重安全隐患',
+                    'priority_actions': ['立即设置基坑安全防护栏杆']},
+    }
+    full = '```json\n' + json.dumps(sample, ensure_ascii=False, indent=2) + '\n```\n以上为分析结果。'
+    truncated = full[:int(len(full) * 0.7)]
+
+    stats = {}
+    for name, text in (('complete', full), ('truncated', truncated)):
+        start = time.perf_counter()
+        for _ in range(count):
+            parse_analysis(text)
+        elapsed = time.perf_counter() - start
+        stats[name] = count / elapsed if elapsed > 0 else float('inf')
+    return stats
+
+
+if __name__ == "__main__":
+    print("🔍 测试AI分析结果解析...")
+    for name, rate in benchmark().items():
+        print(f"   {name}: {rate:,.0f} 条/秒")
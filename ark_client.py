@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+豆包AI分析客户端
+Python端调用 /api/v3/chat/completions 进行建筑安全分析，
+请求参数与 routes/analyze.js 中的 analyzeWithAI 保持一致
+"""
+
+import os
+import time
+import base64
+from typing import Optional
+
+from analysis_parser import AnalysisResult, parse_analysis
+
+try:
+    from dotenv import load_dotenv
+    load_dotenv('./config.env')
+except ImportError:
+    pass
+
+# 提示词版本：修改 SAFETY_ANALYSIS_PROMPT 时同步递增，用于判断历史分析是否需要重跑
+PROMPT_VERSION = "2025-08-15"
+
+# 与 routes/analyze.js 中的 SAFETY_ANALYSIS_PROMPT 保持一致
+SAFETY_ANALYSIS_PROMPT = """请作为专业的建筑安全专家，仔细分析这张建筑施工现场图片，识别出所有违反建筑安全和质量的行为。
+
+对于每个违规行为，请提供以下信息：
+1. 违规类型：严重违规 或 一般违规
+2. 违规行为描述：具体描述发现的安全问题
+3. 违反的具体条例：引用相关的建筑安全规范条例
+4. 整改建议：提供具体可行的整改措施
+5. 违规区域坐标：在图片中精确定位违规区域，坐标格式为[x1,y1,x2,y2]（左上角和右下角坐标）
+   - 基坑/沟槽违规：坐标必须准确指向开挖区域的实际边界，确保完全覆盖沟槽区域
+   - 材料堆放违规：坐标必须指向材料散乱的具体区域
+   - 安全防护违规：坐标必须指向缺少防护的具体位置
+   - 其他违规：坐标必须精确定位到违规物体或区域
+
+   重要：坐标范围要足够大，确保完全覆盖违规区域，避免标注过小导致位置不准确
+
+请严格按照以下JSON格式返回结果：
+
+{
+  "violations": [
+    {
+      "type": "严重违规" | "一般违规",
+      "category": "违规类别名称",
+      "description": "详细的违规行为描述",
+      "coordinates": [x1, y1, x2, y2],
+      "regulations": [
+        {
+          "code": "规范代码",
+          "article": "条款号",
+          "content": "具体条款内容"
+        }
+      ],
+      "suggestions": [
+        "整改建议1",
+        "整改建议2"
+      ],
+      "severity": "high" | "medium",
+      "risk_level": "风险等级描述"
+    }
+  ],
+  "summary": {
+    "severe_count": 严重违规数量,
+    "normal_count": 一般违规数量,
+    "total_score": 安全评分(0-100),
+    "overall_assessment": "整体安全评估",
+    "priority_actions": ["优先整改事项"]
+  }
+}
+
+请确保：
+- 坐标准确标注违规区域位置，必须精确定位到具体的违规物体或区域（如沟槽、基坑、材料堆放区等）
+- 对于基坑/沟槽类违规，坐标应准确指向开挖区域的实际边界
+- 对于材料堆放违规，坐标应指向材料散乱的具体区域
+- 引用真实有效的建筑安全规范条例
+- 提供具体可操作的整改建议
+- 区分严重违规和一般违规的严重程度
+- 给出合理的安全评分
+
+如果图片中没有发现明显的安全违规行为，请返回空的violations数组，但仍需提供summary信息。"""
+
+
+class ArkClient:
+    """豆包AI视觉分析客户端"""
+
+    def __init__(self, api_key: Optional[str] = None, base_url: Optional[str] = None,
+                 model_id: Optional[str] = None, timeout: float = 120, max_retries: int = 2):
+        self.api_key = api_key or os.environ.get("ARK_API_KEY")
+        self.base_url = (base_url or os.environ.get("ARK_API_BASE_URL")
+                         or "https://ark.cn-beijing.volces.com").rstrip('/')
+        self.model_id = model_id or os.environ.get("ARK_MODEL_ID") or "doubao-seed-1-6-flash-250715"
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.proxies = {
+            'http': os.environ.get('HTTP_PROXY'),
+            'https': os.environ.get('HTTPS_PROXY')
+        }
+        self._session = None
+
+    @property
+    def session(self):
+        if self._session is None:
+            import requests
+            self._session = requests.Session()
+        return self._session
+
+    def analyze(self, image_bytes: bytes, mime_type: str = "image/jpeg",
+                prompt: str = SAFETY_ANALYSIS_PROMPT) -> Optional[AnalysisResult]:
+        """分析一张图片，失败时返回None"""
+        import requests
+
+        if not self.api_key:
+            print("⚠️ 未配置ARK_API_KEY，无法调用AI分析")
+            return None
+
+        payload = {
+            "model": self.model_id,
+            "messages": [{
+                "role": "user",
+                "content": [
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('ascii')}"}
+                    },
+                    {"type": "text", "text": prompt}
+                ]
+            }],
+            "temperature": 0.1,
+            "max_tokens": 4000,
+            "top_p": 0.9
+        }
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': f'Bearer {self.api_key}'
+        }
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(
+                    f"{self.base_url}/api/v3/chat/completions",
+                    headers=headers,
+                    json=payload,
+                    proxies=self.proxies,
+                    timeout=self.timeout
+                )
+                if response.status_code == 429 or response.status_code >= 500:
+                    raise requests.exceptions.RequestException(f"状态码 {response.status_code}")
+                if response.status_code != 200:
+                    print(f"❌ AI服务调用失败: {response.status_code} {response.text[:200]}")
+                    return None
+                choices = response.json().get('choices') or []
+                if not choices:
+                    print("❌ AI模型返回数据格式异常")
+                    return None
+                return parse_analysis(choices[0].get('message', {}).get('content', ''))
+            except (requests.exceptions.RequestException, ValueError) as e:
+                print(f"❌ AI分析失败 (尝试{attempt + 1}/{self.max_retries + 1}): {e}")
+                if attempt < self.max_retries:
+                    time.sleep(attempt + 1)
+        return None
+
+    def analyze_file(self, image_path: str) -> Optional[AnalysisResult]:
+        """读取本地图片并分析"""
+        with open(image_path, 'rb') as f:
+            image_bytes = f.read()
+        ext = os.path.splitext(image_path)[1].lower()
+        mime_type = {'.png': 'image/png', '.webp': 'image/webp', '.bmp': 'image/bmp'}.get(ext, 'image/jpeg')
+        return self.analyze(image_bytes, mime_type)
@@ -0,0 +1,290 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+分析链路压测脚本
+并发执行"AI分析 + 报告生成"，统计端到端吞吐量与尾延迟。
+默认在本地启动模拟服务（mock_ark_server.py），不消耗真实接口额度
+
+两种模式:
+  默认        进程内调用 ark_client.ArkClient（Node分析逻辑的Python实现）和 simple_report 的生成函数，
+              用于评估模型接口延迟/重试和报告渲染本身，不包含线上链路中Node路由、
+              每份报告启动一次 python simple_report.py 子进程的开销
+  --express   启动 node server.js（或使用指定地址的已运行服务），AI接口指向模拟服务，
+              通过 POST /api/analyze 与 /api/analyze/generate-report 压测线上实际链路。
+              注意 server.js 对 /api/ 的限流为每IP每15分钟100次请求，
+              请求总数 x (1 + 报告格式数) 超过100时会出现429失败
+"""
+
+import io
+import os
+import sys
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+from contextlib import redirect_stdout
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+import mock_ark_server
+from ark_client import ArkClient
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * pct / 100.0
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def _sample_image(path: str = None) -> bytes:
+    if path:
+        with open(path, 'rb') as f:
+            return f.read()
+    upload_dir = os.environ.get('UPLOAD_PATH', './uploads')
+    if os.path.isdir(upload_dir):
+        for name in sorted(os.listdir(upload_dir)):
+            if name.lower().endswith(('.jpg', '.jpeg')):
+                with open(os.path.join(upload_dir, name), 'rb') as f:
+                    return f.read()
+    from PIL import Image
+    buf = io.BytesIO()
+    Image.new('RGB', (1280, 960), (200, 180, 150)).save(buf, format='JPEG')
+    return buf.getvalue()
+
+
+def run_load(client: ArkClient, image_bytes: bytes, requests: int, concurrency: int,
+             report_formats: List[str], output_dir: str) -> Dict[str, object]:
+    """执行压测，返回统计结果"""
+    from simple_report import generate_pdf_report, generate_word_report
+
+    generators = {'pdf': (generate_pdf_report, '.pdf'), 'word': (generate_word_report, '.docx')}
+    lock = threading.Lock()
+    records = []
+
+    def one(i: int):
+        start = time.perf_counter()
+        result = client.analyze(image_bytes)
+        analyzed = time.perf_counter()
+        ok = result is not None
+        if ok:
+            data = result.to_dict()
+            for fmt in report_formats:
+                generate, ext = generators[fmt]
+                ok = generate(data, os.path.join(output_dir, f"load_{i}{ext}")) and ok
+        end = time.perf_counter()
+        with lock:
+            records.append({
+                'ok': ok,
+                'repaired': bool(result and result.repaired),
+                'analysis': analyzed - start,
+                'report': end - analyzed,
+                'total': end - start,
+            })
+
+    # 报告生成函数会打印状态行，压测期间屏蔽
+    started = time.perf_counter()
+    with redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    return summarize(records, requests, concurrency, time.perf_counter() - started)
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_express(mock_url: str, state_dir: str, timeout: float = 30.0):
+    """启动 node server.js，AI接口指向模拟服务，返回 (进程, 服务地址)
+
+    趋势库、检索索引、趋势图和报告片段缓存都写到 state_dir，压测数据不混入正式库
+    """
+    import requests
+
+    root = os.path.dirname(os.path.abspath(__file__))
+    port = _free_port()
+    env = dict(os.environ, PORT=str(port), ARK_API_KEY='mock-key', ARK_API_BASE_URL=mock_url,
+               HTTP_PROXY='', HTTPS_PROXY='', NODE_ENV='production',
+               TREND_DB=os.path.join(state_dir, 'trends.sqlite3'),
+               SEARCH_DB=os.path.join(state_dir, 'search.sqlite3'),
+               TREND_CHART_DIR=os.path.join(state_dir, 'charts'),
+               FRAGMENT_DB=os.path.join(state_dir, 'fragments.sqlite3'))
+    proc = subprocess.Popen(['node', 'server.js'], cwd=root, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("node server.js 启动失败，请先运行 npm install")
+        try:
+            if requests.get(f"{base_url}/health", timeout=2).ok:
+                return proc, base_url
+        except requests.RequestException:
+            time.sleep(0.3)
+    proc.terminate()
+    raise RuntimeError("node server.js 启动超时")
+
+
+def run_express_load(base_url: str, image_path: str, requests_count: int, concurrency: int,
+                     report_formats: List[str]) -> Dict[str, object]:
+    """通过Express接口执行压测：分析一张上传目录外的本地图片，再按格式生成报告
+
+    Node在AI调用失败时会回退到模拟分析结果（analysis.mock），这类结果计为失败
+    """
+    import requests
+
+    session = requests.Session()
+    session.trust_env = False
+    lock = threading.Lock()
+    records = []
+
+    def one(i: int):
+        start = time.perf_counter()
+        ok = False
+        repaired = False
+        analyzed = start
+        try:
+            resp = session.post(f"{base_url}/api/analyze", json={'imagePath': image_path}, timeout=300)
+            analyzed = time.perf_counter()
+            analysis = resp.json().get('data', {}).get('analysis') if resp.ok else None
+            ok = bool(analysis) and not analysis.get('mock')
+            if ok:
+                for fmt in report_formats:
+                    report = session.post(f"{base_url}/api/analyze/generate-report",
+                                          json={'analysisData': analysis, 'format': fmt}, timeout=300)
+                    ok = ok and report.ok and len(report.content) > 0
+        except (requests.RequestException, ValueError):
+            ok = False
+        end = time.perf_counter()
+        with lock:
+            records.append({
+                'ok': ok,
+                'repaired': repaired,
+                'analysis': analyzed - start,
+                'report': end - analyzed,
+                'total': end - start,
+            })
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests_count)))
+    return summarize(records, requests_count, concurrency, time.perf_counter() - started)
+
+
+def summarize(records: List[Dict[str, object]], requests: int, concurrency: int,
+              elapsed: float) -> Dict[str, object]:
+    succeeded = [r for r in records if r['ok']]
+    totals = [r['total'] for r in succeeded]
+    return {
+        'requests': requests,
+        'concurrency': concurrency,
+        'succeeded': len(succeeded),
+        'failed': requests - len(succeeded),
+        'repaired': sum(1 for r in records if r['repaired']),
+        'elapsed': elapsed,
+        'throughput': len(succeeded) / elapsed if elapsed else 0.0,
+        'p50': percentile(totals, 50),
+        'p90': percentile(totals, 90),
+        'p95': percentile(totals, 95),
+        'p99': percentile(totals, 99),
+        'max': max(totals) if totals else 0.0,
+        'analysis_p95': percentile([r['analysis'] for r in succeeded], 95),
+        'report_p95': percentile([r['report'] for r in succeeded], 95),
+    }
+
+
+def print_stats(stats: Dict[str, object]):
+    print("\n" + "=" * 60)
+    print("📊 压测结果:")
+    print(f"   请求数: {stats['requests']}  并发: {stats['concurrency']}")
+    print(f"   成功: {stats['succeeded']}  失败: {stats['failed']}  截断修复: {stats['repaired']}")
+    print(f"   总耗时: {stats['elapsed']:.2f}s  吞吐量: {stats['throughput']:.2f} 次/秒")
+    print(f"   端到端延迟 p50={stats['p50']:.3f}s p90={stats['p90']:.3f}s "
+          f"p95={stats['p95']:.3f}s p99={stats['p99']:.3f}s max={stats['max']:.3f}s")
+    print(f"   分析阶段 p95={stats['analysis_p95']:.3f}s  报告阶段 p95={stats['report_p95']:.3f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='分析与报告生成链路压测')
+    parser.add_argument('--url', help='接口地址，不指定时启动本地模拟服务')
+    parser.add_argument('--requests', type=int, default=200, help='请求总数 (默认: 200)')
+    parser.add_argument('--concurrency', type=int, default=20, help='并发数 (默认: 20)')
+    parser.add_argument('--report', choices=['none', 'pdf', 'word', 'both'], default='pdf',
+                        help='每次分析后生成的报告 (默认: pdf)')
+    parser.add_argument('--client-timeout', type=float, default=120, help='客户端超时秒数 (默认: 120)')
+    parser.add_argument('--retries', type=int, default=2, help='客户端重试次数 (默认: 2)')
+    parser.add_argument('--image', help='用于压测的图片 (默认取uploads目录第一张)')
+    parser.add_argument('--express', nargs='?', const='spawn', metavar='URL',
+                        help='压测Express接口：不带地址时启动 node server.js，带地址时使用已运行的服务')
+    mock_ark_server.add_config_arguments(parser)
+
+    args = parser.parse_args()
+
+    server = None
+    base_url = args.url
+    api_key = os.environ.get('ARK_API_KEY')
+    if not base_url:
+        server = mock_ark_server.start_server(mock_ark_server.config_from_args(args))
+        base_url = f"http://127.0.0.1:{server.server_address[1]}"
+        api_key = 'mock-key'
+        print(f"🚀 已启动本地模拟服务: {base_url}")
+
+    formats = {'none': [], 'pdf': ['pdf'], 'word': ['word'], 'both': ['pdf', 'word']}[args.report]
+
+    if args.express:
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                node = None
+                try:
+                    if args.express == 'spawn':
+                        node, express_url = start_express(base_url, tmp)
+                        print(f"🚀 已启动 node server.js: {express_url}")
+                    else:
+                        express_url = args.express.rstrip('/')
+                    print(f"🔍 开始压测Express接口: {args.requests} 次请求，并发 {args.concurrency}，"
+                          f"报告 {args.report}")
+                    image_path = os.path.join(tmp, 'load_test.jpg')
+                    with open(image_path, 'wb') as f:
+                        f.write(_sample_image(args.image))
+                    stats = run_express_load(express_url, image_path, args.requests, args.concurrency, formats)
+                finally:
+                    # 先停止node再删除临时目录，避免后台的趋势记录进程仍在写入
+                    if node:
+                        node.terminate()
+                        node.wait(timeout=10)
+        except RuntimeError as e:
+            print(f"❌ {e}")
+            return 1
+        finally:
+            if server:
+                server.shutdown()
+        print_stats(stats)
+        return 0 if stats['failed'] == 0 else 1
+
+    client = ArkClient(api_key=api_key, base_url=base_url, timeout=args.client_timeout,
+                       max_retries=args.retries)
+    if server:
+        # 本地模拟服务不走代理
+        client.session.trust_env = False
+        client.proxies = {}
+
+    print(f"🔍 开始压测: {args.requests} 次请求，并发 {args.concurrency}，报告 {args.report}")
+    try:
+        with tempfile.TemporaryDirectory() as output_dir:
+            stats = run_load(client, _sample_image(args.image), args.requests, args.concurrency,
+                             formats, output_dir)
+    finally:
+        if server:
+            server.shutdown()
+    print_stats(stats)
+    return 0 if stats['failed'] == 0 else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+临时文件与报告生命周期管理
+按文件年龄、数量和总大小清理 temp/、reports/、uploads/ 目录。
+文件信息保存在SQLite索引中：Python端生成报告时直接登记；
+Node端写入的文件通过目录修改时间判断是否需要增量同步，未变化的目录不再遍历
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+import threading
+from typing import Dict, List
+
+INDEX_PATH = os.environ.get('ARTIFACT_INDEX', './temp/.artifacts.sqlite3')
+
+# 刚生成的文件可能仍在被读取或发送，清理时跳过
+MIN_AGE_SECONDS = 10 * 60
+
+DAY = 24 * 3600
+MB = 1024 * 1024
+
+
+class RetentionPolicy:
+    """目录保留策略，任一项为0表示不限制"""
+
+    __slots__ = ('max_age', 'max_count', 'max_bytes', 'extensions')
+
+    def __init__(self, max_age: float = 0, max_count: int = 0, max_bytes: int = 0, extensions=None):
+        self.max_age = max_age
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        # 只管理这些扩展名的文件，None表示全部
+        self.extensions = tuple(extensions) if extensions else None
+
+
+DEFAULT_POLICIES = {
+    './temp': RetentionPolicy(max_age=1 * DAY, max_count=200, max_bytes=500 * MB,
+                              extensions=('.json', '.docx', '.pdf', '.xlsx', '.zip')),
+    # 违规特写缓存，按原图哈希命名，删除后会按需重新生成
+    './temp/crops': RetentionPolicy(max_age=7 * DAY, max_bytes=500 * MB, extensions=('.jpg',)),
+    './reports': RetentionPolicy(max_age=30 * DAY, max_count=1000, max_bytes=2048 * MB,
+                                 extensions=('.docx', '.pdf', '.xlsx', '.zip')),
+    './uploads': RetentionPolicy(max_age=90 * DAY, max_count=5000, max_bytes=10240 * MB,
+                                 extensions=('.jpg', '.jpeg', '.png', '.bmp', '.webp')),
+}
+
+
+class ArtifactIndex:
+    """文件索引（线程安全）"""
+
+    def __init__(self, index_path: str = INDEX_PATH):
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(index_path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS artifacts (
+                path TEXT PRIMARY KEY,
+                directory TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_artifacts_dir_mtime ON artifacts (directory, mtime);
+            CREATE TABLE IF NOT EXISTS directories (
+                directory TEXT PRIMARY KEY,
+                synced_mtime REAL NOT NULL
+            );
+        ''')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def register(self, path: str):
+        """登记新生成的文件"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return
+        path = os.path.abspath(path)
+        with self._lock, self._conn:
+            self._conn.execute('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)',
+                               (path, os.path.dirname(path), st.st_size, st.st_mtime))
+
+    def sync(self, directory: str, force: bool = False) -> int:
+        """同步目录到索引，返回新发现的文件数
+
+        目录修改时间与上次同步一致时（没有文件新增或删除）直接跳过；
+        否则只对索引中没有的文件调用stat，并移除已不存在的记录；
+        force 为True时重新读取全部文件信息
+        """
+        directory = os.path.abspath(directory)
+        try:
+            dir_mtime = os.stat(directory).st_mtime
+        except OSError:
+            return 0
+        with self._lock:
+            row = self._conn.execute('SELECT synced_mtime FROM directories WHERE directory = ?',
+                                     (directory,)).fetchone()
+            if row and row[0] == dir_mtime and not force:
+                return 0
+            known = {r[0] for r in self._conn.execute(
+                'SELECT path FROM artifacts WHERE directory = ?', (directory,))}
+        # 强制同步时重新读取所有文件的大小和修改时间
+        fresh = set() if force else known
+
+        seen = set()
+        added = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.startswith('.') or not entry.is_file():
+                    continue
+                path = os.path.join(directory, entry.name)
+                seen.add(path)
+                if path not in fresh:
+                    st = entry.stat()
+                    added.append((path, directory, st.st_size, st.st_mtime))
+
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR REPLACE INTO artifacts VALUES (?, ?, ?, ?)', added)
+            self._conn.executemany('DELETE FROM artifacts WHERE path = ?', [(p,) for p in known - seen])
+            self._conn.execute('INSERT OR REPLACE INTO directories VALUES (?, ?)', (directory, dir_mtime))
+        return len(added)
+
+    def list(self, directory: str) -> List[tuple]:
+        """按修改时间从旧到新返回 (path, size, mtime)"""
+        with self._lock:
+            return self._conn.execute(
+                'SELECT path, size, mtime FROM artifacts WHERE directory = ? ORDER BY mtime',
+                (os.path.abspath(directory),)).fetchall()
+
+    def forget(self, paths: List[str]):
+        with self._lock, self._conn:
+            self._conn.executemany('DELETE FROM artifacts WHERE path = ?', [(p,) for p in paths])
+
+
+def plan_eviction(files: List[tuple], policy: RetentionPolicy, now: float) -> List[tuple]:
+    """计算需要清理的文件，files 按修改时间从旧到新排列"""
+    if policy.extensions:
+        files = [f for f in files if f[0].lower().endswith(policy.extensions)]
+    candidates = [f for f in files if now - f[2] >= MIN_AGE_SECONDS]
+    evict = []
+    evicted = set()
+
+    if policy.max_age:
+        for f in candidates:
+            if now - f[2] > policy.max_age:
+                evict.append(f)
+                evicted.add(f[0])
+
+    remaining = [f for f in files if f[0] not in evicted]
+    count = len(remaining)
+    total = sum(f[1] for f in remaining)
+    for f in candidates:
+        if f[0] in evicted:
+            continue
+        over_count = policy.max_count and count > policy.max_count
+        over_bytes = policy.max_bytes and total > policy.max_bytes
+        if not (over_count or over_bytes):
+            break
+        evict.append(f)
+        evicted.add(f[0])
+        count -= 1
+        total -= f[1]
+    return evict
+
+
+def sweep(index: ArtifactIndex, policies: Dict[str, RetentionPolicy] = None,
+          dry_run: bool = False, force_sync: bool = False) -> Dict[str, Dict[str, int]]:
+    """执行一次清理，返回每个目录清理的文件数和回收字节数"""
+    policies = policies or DEFAULT_POLICIES
+    now = time.time()
+    report = {}
+    for directory, policy in policies.items():
+        if not os.path.isdir(directory):
+            continue
+        index.sync(directory, force=force_sync)
+        evict = plan_eviction(index.list(directory), policy, now)
+        removed = []
+        reclaimed = 0
+        for path, size, _ in evict:
+            if not dry_run:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                except OSError as e:
+                    print(f"❌ 删除失败 {path}: {e}")
+                    continue
+            removed.append(path)
+            reclaimed += size
+        if not dry_run:
+            index.forget(removed)
+        report[directory] = {'files': len(removed), 'bytes': reclaimed}
+    return report
+
+
+def print_report(report: Dict[str, Dict[str, int]], dry_run: bool = False):
+    action = '可清理' if dry_run else '已清理'
+    total = 0
+    for directory, stats in report.items():
+        total += stats['bytes']
+        print(f"🧹 {directory}: {action} {stats['files']} 个文件，{stats['bytes'] / MB:.2f} MB")
+    print(f"📊 合计{action} {total / MB:.2f} MB")
+
+
+class Sweeper(threading.Thread):
+    """后台定时清理线程"""
+
+    def __init__(self, interval: float = 600, policies: Dict[str, RetentionPolicy] = None,
+                 index_path: str = INDEX_PATH):
+        super().__init__(daemon=True, name='artifact-sweeper')
+        self.interval = interval
+        self.policies = policies
+        self.index_path = index_path
+        self._stop_event = threading.Event()
+
+    def run(self):
+        index = ArtifactIndex(self.index_path)
+        try:
+            while not self._stop_event.is_set():
+                try:
+                    print_report(sweep(index, self.policies))
+                except Exception as e:
+                    print(f"❌ 清理失败: {e}")
+                self._stop_event.wait(self.interval)
+        finally:
+            index.close()
+
+    def stop(self):
+        self._stop_event.set()
+
+
+_default_index = None
+_default_lock = threading.Lock()
+
+
+def register_artifact(path: str):
+    """登记新生成的报告文件；索引不可用时静默跳过，不影响报告生成"""
+    global _default_index
+    try:
+        with _default_lock:
+            if _default_index is None:
+                _default_index = ArtifactIndex()
+        _default_index.register(path)
+    except (OSError, sqlite3.Error):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='清理临时文件、报告和上传图片')
+    parser.add_argument('--dry-run', action='store_true', help='只统计不删除')
+    parser.add_argument('--reindex', action='store_true', help='强制重新同步目录索引')
+    parser.add_argument('--daemon', action='store_true', help='以后台方式定时清理')
+    parser.add_argument('--interval', type=float, default=600, help='定时清理间隔秒数 (默认: 600)')
+    parser.add_argument('--index', default=INDEX_PATH, help=f'索引文件路径 (默认: {INDEX_PATH})')
+
+    args = parser.parse_args()
+
+    if args.daemon:
+        sweeper = Sweeper(args.interval, index_path=args.index)
+        sweeper.start()
+        try:
+            while sweeper.is_alive():
+                sweeper.join(1)
+        except KeyboardInterrupt:
+            sweeper.stop()
+        return
+
+    index = ArtifactIndex(args.index)
+    try:
+        print_report(sweep(index, dry_run=args.dry_run, force_sync=args.reindex), args.dry_run)
+    finally:
+        index.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
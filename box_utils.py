@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+违规区域坐标框工具
+坐标格式统一为 [x1, y1, x2, y2]（左上角和右下角），使用numpy批量计算
+"""
+
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from analysis_parser import safety_score
+
+# 分块计算IoU时每块的行数，避免数千个框时构造过大的 N×N 矩阵
+_BLOCK = 1024
+
+_TYPE_RANK = {'严重违规': 1, '一般违规': 0}
+_SEVERITY_RANK = {'high': 2, 'medium': 1, 'low': 0}
+
+
+def as_boxes(boxes: Sequence[Sequence[float]]) -> np.ndarray:
+    """转换为 (N, 4) 的float64数组"""
+    arr = np.asarray(boxes, dtype=np.float64)
+    if arr.size == 0:
+        return np.zeros((0, 4), dtype=np.float64)
+    return arr.reshape(-1, 4)
+
+
+def box_area(boxes: np.ndarray) -> np.ndarray:
+    """每个框的面积"""
+    return np.clip(boxes[:, 2] - boxes[:, 0], 0, None) * np.clip(boxes[:, 3] - boxes[:, 1], 0, None)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """两组框之间的IoU矩阵，形状 (len(a), len(b))"""
+    a = as_boxes(a)
+    b = as_boxes(b)
+    x1 = np.maximum(a[:, None, 0], b[None, :, 0])
+    y1 = np.maximum(a[:, None, 1], b[None, :, 1])
+    x2 = np.minimum(a[:, None, 2], b[None, :, 2])
+    y2 = np.minimum(a[:, None, 3], b[None, :, 3])
+    inter = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    union = box_area(a)[:, None] + box_area(b)[None, :] - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def _iou_one(box: np.ndarray, boxes: np.ndarray, areas: np.ndarray) -> np.ndarray:
+    """一个框与一组框的IoU"""
+    w = np.clip(np.minimum(box[2], boxes[:, 2]) - np.maximum(box[0], boxes[:, 0]), 0, None)
+    h = np.clip(np.minimum(box[3], boxes[:, 3]) - np.maximum(box[1], boxes[:, 1]), 0, None)
+    inter = w * h
+    union = (box[2] - box[0]) * (box[3] - box[1]) + areas - inter
+    return np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+
+
+def nms(boxes: Sequence[Sequence[float]], scores: Sequence[float], iou_threshold: float = 0.5) -> List[int]:
+    """非极大值抑制，返回按分数降序保留的下标
+
+    每轮只计算当前框与剩余候选框的IoU，内存开销为 O(N)
+    """
+    boxes = as_boxes(boxes)
+    if len(boxes) == 0:
+        return []
+    order = np.argsort(-np.asarray(scores, dtype=np.float64), kind='stable')
+    areas = box_area(boxes)
+    keep = []
+    while order.size:
+        idx = order[0]
+        keep.append(int(idx))
+        rest = order[1:]
+        order = rest[_iou_one(boxes[idx], boxes[rest], areas[rest]) <= iou_threshold]
+    return keep
+
+
+def batched_nms(boxes: Sequence[Sequence[float]], scores: Sequence[float], groups: Sequence[Any],
+                iou_threshold: float = 0.5) -> List[int]:
+    """分组NMS：只在同一组（如同一违规类别）内互相抑制
+
+    通过给每组加上互不重叠的坐标偏移，一次NMS完成所有组
+    """
+    boxes = as_boxes(boxes)
+    if len(boxes) == 0:
+        return []
+    _, group_ids = np.unique(np.asarray([str(g) for g in groups]), return_inverse=True)
+    offset = group_ids.astype(np.float64)[:, None] * (boxes.max() + 1)
+    return nms(boxes + offset, scores, iou_threshold)
+
+
+def cluster_boxes(boxes: Sequence[Sequence[float]], groups: Sequence[Any],
+                  iou_threshold: float = 0.3) -> np.ndarray:
+    """把同组内相互重叠（IoU超过阈值，可传递）的框聚为一类
+
+    返回每个框的簇编号（簇内最小下标）
+    """
+    boxes = as_boxes(boxes)
+    n = len(boxes)
+    labels = np.arange(n)
+    if n == 0:
+        return labels
+    _, group_ids = np.unique(np.asarray([str(g) for g in groups]), return_inverse=True)
+
+    # 分块计算IoU，收集同组重叠的框对
+    pairs_i, pairs_j = [], []
+    for start in range(0, n, _BLOCK):
+        block = iou_matrix(boxes[start:start + _BLOCK], boxes)
+        same = group_ids[start:start + _BLOCK, None] == group_ids[None, :]
+        i, j = np.nonzero((block > iou_threshold) & same)
+        i += start
+        upper = i < j
+        pairs_i.append(i[upper])
+        pairs_j.append(j[upper])
+    pi = np.concatenate(pairs_i)
+    pj = np.concatenate(pairs_j)
+
+    # 标签传播：反复取相连框的最小标签直到收敛
+    while pi.size:
+        before = labels.copy()
+        low = np.minimum(labels[pi], labels[pj])
+        np.minimum.at(labels, pi, low)
+        np.minimum.at(labels, pj, low)
+        labels = labels[labels]
+        if np.array_equal(labels, before):
+            break
+    return labels
+
+
+def clamp_boxes(boxes: Sequence[Sequence[float]], width: float, height: float) -> np.ndarray:
+    """把框裁剪到图片范围内，并保证 x1<=x2、y1<=y2"""
+    boxes = as_boxes(boxes)
+    x = np.sort(boxes[:, [0, 2]], axis=1)
+    y = np.sort(boxes[:, [1, 3]], axis=1)
+    return np.stack([
+        np.clip(x[:, 0], 0, width), np.clip(y[:, 0], 0, height),
+        np.clip(x[:, 1], 0, width), np.clip(y[:, 1], 0, height),
+    ], axis=1)
+
+
+def rescale_boxes(boxes: Sequence[Sequence[float]], src_size: Tuple[float, float],
+                  dst_size: Tuple[float, float]) -> np.ndarray:
+    """把框从 src_size (宽, 高) 的坐标系缩放到 dst_size"""
+    boxes = as_boxes(boxes)
+    sx = dst_size[0] / float(src_size[0])
+    sy = dst_size[1] / float(src_size[1])
+    return boxes * np.array([sx, sy, sx, sy])
+
+
+def _merge_cluster(members: List[Dict[str, Any]], box: np.ndarray) -> Dict[str, Any]:
+    """合并同一簇的违规项：保留最严重的一项为主，合并描述、条例和建议"""
+    members = sorted(members, key=lambda v: (_TYPE_RANK.get(v.get('type'), 0),
+                                             _SEVERITY_RANK.get(v.get('severity'), 0)), reverse=True)
+    merged = dict(members[0])
+    descriptions, regulations, suggestions = [], [], []
+    seen_regs = set()
+    for v in members:
+        desc = v.get('description')
+        if desc and desc not in descriptions:
+            descriptions.append(desc)
+        for reg in v.get('regulations') or []:
+            key = (reg.get('code'), reg.get('article'))
+            if key not in seen_regs:
+                seen_regs.add(key)
+                regulations.append(reg)
+        for suggestion in v.get('suggestions') or []:
+            if suggestion not in suggestions:
+                suggestions.append(suggestion)
+    merged['description'] = '；'.join(descriptions)
+    merged['regulations'] = regulations
+    merged['suggestions'] = suggestions
+    merged['coordinates'] = [int(round(c)) for c in box]
+    return merged
+
+
+def dedupe_violations(violations: List[Dict[str, Any]], iou_threshold: float = 0.3,
+                      image_size: Tuple[int, int] = None) -> List[Dict[str, Any]]:
+    """合并同类别且区域重叠的违规项（字典格式，与AI返回结构一致）
+
+    每簇的坐标取成员框的外接矩形；提供 image_size 时先裁剪到图片范围内。
+    没有有效坐标的违规项原样保留
+    """
+    indexed = [i for i, v in enumerate(violations)
+               if isinstance(v.get('coordinates'), (list, tuple)) and len(v['coordinates']) == 4]
+    if len(indexed) < 2:
+        return list(violations)
+    try:
+        boxes = as_boxes([violations[i]['coordinates'] for i in indexed])
+    except (TypeError, ValueError):
+        return list(violations)
+    if image_size:
+        boxes = clamp_boxes(boxes, image_size[0], image_size[1])
+
+    labels = cluster_boxes(boxes, [violations[i].get('category', '') for i in indexed], iou_threshold)
+    clusters = {}
+    for pos, label in enumerate(labels.tolist()):
+        clusters.setdefault(label, []).append(pos)
+    label_of = dict(zip(indexed, labels.tolist()))
+
+    result = []
+    for i, v in enumerate(violations):
+        label = label_of.get(i)
+        if label is None:
+            result.append(v)
+            continue
+        members = clusters.pop(label, None)
+        if members is None:
+            # 同簇的其他成员已在首次出现处合并输出
+            continue
+        if len(members) == 1:
+            result.append(v)
+            continue
+        stacked = boxes[members]
+        union = np.concatenate([stacked[:, :2].min(axis=0), stacked[:, 2:].max(axis=0)])
+        result.append(_merge_cluster([violations[indexed[p]] for p in members], union))
+    return result
+
+
+def dedupe_analysis(analysis_data: Dict[str, Any], iou_threshold: float = 0.3) -> Dict[str, Any]:
+    """返回合并重叠违规项后的分析数据副本
+
+    有违规项被合并时，摘要中的违规数量和安全评分按合并后的违规项重新计算
+    （规则同 analysis_parser.finalize_summary），避免评分仍按合并前的重复项扣分
+    """
+    violations = analysis_data.get('violations') or []
+    deduped = dedupe_violations(violations, iou_threshold)
+    if len(deduped) == len(violations):
+        return analysis_data
+    data = dict(analysis_data)
+    data['violations'] = deduped
+    summary = dict(data.get('summary') or {})
+    summary['severe_count'] = sum(1 for v in deduped if v.get('type') == '严重违规')
+    summary['normal_count'] = sum(1 for v in deduped if v.get('type') == '一般违规')
+    summary['total_score'] = safety_score(summary['severe_count'], summary['normal_count'])
+    data['summary'] = summary
+    return data
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+上传目录批量重新分析工具
+在提示词或模型更新后，对 uploads/ 中的历史图片重新进行AI分析。
+已在当前（模型, 提示词版本）下分析过的图片会被跳过；进度写入检查点文件，中断后可继续。
+每张图片的分析结果同时记录到站点趋势汇总（按上传时间，同一图片只记录一次），
+并写入违规项检索索引（重新分析后替换该图片原有的索引）
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime
+from typing import Iterator, Set, Tuple
+
+from worker_metrics import QUEUE_DEPTH, start_http_server_from_env
+
+# 与 routes/upload.js 中生成的文件名一致：construction_<毫秒时间戳>_<随机hex>.<ext>
+UPLOAD_NAME_RE = re.compile(r'^construction_(\d+)_([0-9a-f]+)\.(jpe?g|png|bmp|webp)$', re.IGNORECASE)
+
+CHECKPOINT_NAME = 'checkpoint.jsonl'
+
+
+def iter_uploads(upload_dir: str) -> Iterator[os.DirEntry]:
+    """流式遍历上传目录中的图片，不一次性加载整个目录列表"""
+    with os.scandir(upload_dir) as entries:
+        for entry in entries:
+            if entry.is_file() and UPLOAD_NAME_RE.match(entry.name):
+                yield entry
+
+
+def load_checkpoint(path: str, model_id: str, prompt_version: str) -> Set[str]:
+    """读取检查点，返回当前（模型, 提示词版本）下已完成的文件名"""
+    done = set()
+    if not os.path.exists(path):
+        return done
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 崩溃时可能留下写了一半的最后一行
+                continue
+            if (record.get('model') == model_id and record.get('prompt_version') == prompt_version
+                    and record.get('status') == 'ok'):
+                done.add(record.get('file'))
+    return done
+
+
+class Progress:
+    """吞吐量与剩余时间统计"""
+
+    def __init__(self, total: int):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.start = time.monotonic()
+
+    def update(self, ok: bool):
+        self.done += 1
+        if not ok:
+            self.failed += 1
+
+    def line(self) -> str:
+        elapsed = max(time.monotonic() - self.start, 1e-6)
+        rate = self.done / elapsed * 60
+        remaining = self.total - self.done
+        eta = remaining / (self.done / elapsed) if self.done else float('inf')
+        eta_text = time.strftime('%H:%M:%S', time.gmtime(eta)) if eta != float('inf') else '--:--:--'
+        return (f"📈 {self.done}/{self.total} 失败{self.failed} | "
+                f"{rate:.1f} 张/分钟 | 剩余约 {eta_text}")
+
+
+def _analyze_one(analyze, path: str) -> Tuple[bool, object]:
+    try:
+        return True, analyze(path)
+    except Exception as e:
+        return False, e
+
+
+def upload_time(name: str) -> datetime:
+    """上传时间：取文件名中的毫秒时间戳"""
+    match = UPLOAD_NAME_RE.match(name)
+    return datetime.fromtimestamp(int(match.group(1)) / 1000.0)
+
+
+def run(upload_dir: str, output_dir: str, workers: int = 4, limit: int = 0,
+        tiled: bool = False, dry_run: bool = False, site: str = '') -> int:
+    from ark_client import ArkClient, PROMPT_VERSION
+    from trend_rollup import TrendStore, DEFAULT_SITE
+    from violation_search import SearchIndex
+
+    client = ArkClient()
+    if tiled:
+        from tiled_analysis import analyze_tiled
+        # 子图在当前线程内串行分析，总并发仍由 --workers 决定
+        analyze = lambda path: analyze_tiled(path, client.analyze, max_workers=1)
+    else:
+        analyze = client.analyze_file
+
+    os.makedirs(output_dir, exist_ok=True)
+    checkpoint_path = os.path.join(output_dir, CHECKPOINT_NAME)
+    done = load_checkpoint(checkpoint_path, client.model_id, PROMPT_VERSION)
+
+    # 只统计文件名，用于计算剩余时间
+    pending_total = sum(1 for e in iter_uploads(upload_dir) if e.name not in done)
+    if limit:
+        pending_total = min(pending_total, limit)
+    print(f"🔍 模型 {client.model_id} / 提示词版本 {PROMPT_VERSION}: "
+          f"已完成 {len(done)} 张，待分析 {pending_total} 张")
+    if dry_run or pending_total == 0:
+        return 0
+
+    site = site or DEFAULT_SITE or '未知'
+    progress = Progress(pending_total)
+    trends = TrendStore()
+    search = SearchIndex()
+    with open(checkpoint_path, 'a', encoding='utf-8') as checkpoint, \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        in_flight = {}
+
+        def collect(futures):
+            for future in futures:
+                name = in_flight.pop(future)
+                QUEUE_DEPTH.set(len(in_flight), worker='bulk_reanalyze')
+                ok, result = future.result()
+                ok = ok and result is not None
+                if ok:
+                    stem = os.path.splitext(name)[0]
+                    record = {
+                        'file': name,
+                        'site': site,
+                        'timestamp': upload_time(name).isoformat(sep=' ', timespec='seconds'),
+                        'model': client.model_id,
+                        'prompt_version': PROMPT_VERSION,
+                        'analyzed_at': datetime.now().isoformat(timespec='seconds'),
+                        'analysis': result.to_dict(),
+                    }
+                    tmp_path = os.path.join(output_dir, stem + '.json.tmp')
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(record, f, ensure_ascii=False, indent=2)
+                    os.replace(tmp_path, os.path.join(output_dir, stem + '.json'))
+                    # 结果文件已落盘，趋势/检索索引写入失败只记录日志，不中断批量分析
+                    try:
+                        trends.record(record['analysis'], site=site, timestamp=record['timestamp'],
+                                      analysis_id=name)
+                    except Exception as e:
+                        print(f"⚠️ 趋势统计写入失败: {name} {e}")
+                    try:
+                        search.add(record['analysis'], site=site, timestamp=record['timestamp'],
+                                   analysis_id=name, replace=True)
+                    except Exception as e:
+                        print(f"⚠️ 检索索引写入失败: {name} {e}")
+                else:
+                    print(f"❌ 分析失败: {name} {result if result is not None else ''}")
+                checkpoint.write(json.dumps({
+                    'file': name,
+                    'model': client.model_id,
+                    'prompt_version': PROMPT_VERSION,
+                    'status': 'ok' if ok else 'failed',
+                }, ensure_ascii=False) + '\n')
+                checkpoint.flush()
+                progress.update(ok)
+                print(progress.line())
+
+        submitted = 0
+        for entry in iter_uploads(upload_dir):
+            if entry.name in done:
+                continue
+            if limit and submitted >= limit:
+                break
+            # 限制在途任务数量，避免目录很大时一次性提交全部任务
+            while len(in_flight) >= workers * 2:
+                finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(finished)
+            in_flight[executor.submit(_analyze_one, analyze, entry.path)] = entry.name
+            QUEUE_DEPTH.set(len(in_flight), worker='bulk_reanalyze')
+            submitted += 1
+        while in_flight:
+            finished, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            collect(finished)
+    trends.close()
+    search.close()
+
+    print(f"🎯 批量分析完成: 成功 {progress.done - progress.failed}，失败 {progress.failed}")
+    return 1 if progress.failed else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='批量重新分析上传目录中的图片')
+    parser.add_argument('--uploads', default=os.environ.get('UPLOAD_PATH', './uploads'),
+                        help='上传目录 (默认: ./uploads)')
+    parser.add_argument('--output', default='./analyses', help='分析结果输出目录 (默认: ./analyses)')
+    parser.add_argument('--workers', type=int, default=4, help='并发分析数 (默认: 4)')
+    parser.add_argument('--limit', type=int, default=0, help='本次最多分析的图片数 (默认: 不限)')
+    parser.add_argument('--tiled', action='store_true', help='对大图使用分块分析')
+    parser.add_argument('--dry-run', action='store_true', help='只统计待分析数量')
+    parser.add_argument('--site', default=os.environ.get('SITE_NAME', ''), help='站点名称，用于趋势汇总 (默认: 环境变量SITE_NAME)')
+
+    args = parser.parse_args()
+    start_http_server_from_env()
+    sys.exit(run(args.uploads, args.output, args.workers, args.limit, args.tiled, args.dry_run, args.site))
+
+
+if __name__ == '__main__':
+    main()
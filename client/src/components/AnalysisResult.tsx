@@ -45,7 +45,8 @@ const AnalysisResult: React.FC<AnalysisResultProps> = ({ data, onReAnalyze }) =>
         },
         body: JSON.stringify({
           analysisData: analysis,
-          format: format
+          format: format,
+          imageUrl: imageUrl
         }),
       });
       
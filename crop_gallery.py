@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+违规区域特写图
+按违规项坐标从原图裁剪出带边距的特写并缩放，一张原图只解码一次，
+各特写在线程池中并行编码为JPEG，按 (原图哈希, 区域, 尺寸参数) 缓存到磁盘，
+供报告“违规详情”和审核界面使用
+"""
+
+import os
+import sys
+import json
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Sequence
+
+from worker_metrics import record_cache
+
+CROP_DIR = os.environ.get('CROP_CACHE_DIR', './temp/crops')
+UPLOAD_DIR = os.environ.get('UPLOAD_PATH', './uploads')
+
+# 特写默认最长边、区域外扩比例、JPEG质量
+CROP_MAX_SIDE = 480
+CROP_PAD = 0.15
+CROP_QUALITY = 80
+# 报告中特写的版面宽度（英寸）
+CROP_WIDTH_INCHES = 3
+
+
+def resolve_source_image(analysis_data: Dict[str, Any], upload_dir: str = UPLOAD_DIR) -> Optional[str]:
+    """分析数据对应的原图路径
+
+    报告数据来自前端请求，只接受上传目录中的文件：
+    image_path 须位于上传目录内，imageUrl 只取文件名（与 routes/analyze.js 的处理一致）
+    """
+    root = os.path.realpath(upload_dir)
+    candidates = []
+    image_path = analysis_data.get('image_path') or analysis_data.get('imagePath')
+    if isinstance(image_path, str) and image_path:
+        candidates.append(os.path.realpath(image_path))
+    image_url = analysis_data.get('imageUrl') or analysis_data.get('image_url')
+    if isinstance(image_url, str) and '/uploads/' in image_url:
+        candidates.append(os.path.realpath(os.path.join(root, os.path.basename(image_url.split('?')[0]))))
+    for path in candidates:
+        if os.path.dirname(path) == root and os.path.isfile(path):
+            return path
+    return None
+
+
+def crop_params(profile=None, level: int = 0):
+    """(最长边, JPEG质量)，使用输出配置时按版面宽度、配置DPI和降级级别计算"""
+    if profile is None:
+        return CROP_MAX_SIDE, CROP_QUALITY
+    return profile.image_params(level, CROP_WIDTH_INCHES)
+
+
+def _crop_path(cache_dir: str, image_hash: str, box: Sequence[float], pad: float,
+               max_side: int, quality: int) -> str:
+    key = json.dumps([image_hash, [round(float(c), 1) for c in box], pad, max_side, quality])
+    return os.path.join(cache_dir, f"crop_{hashlib.sha1(key.encode('utf-8')).hexdigest()[:20]}.jpg")
+
+
+def _encode(crop, path: str, max_side: int, quality: int):
+    from PIL import Image
+
+    if max(crop.size) > max_side:
+        crop = crop.copy()
+        crop.thumbnail((max_side, max_side), Image.LANCZOS)
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    crop.save(tmp_path, format='JPEG', quality=quality)
+    os.replace(tmp_path, path)
+
+
+def generate_crops(image_path: str, boxes: Sequence[Sequence[float]], max_side: int = CROP_MAX_SIDE,
+                   pad: float = CROP_PAD, quality: int = CROP_QUALITY, max_workers: int = 4,
+                   cache_dir: str = CROP_DIR) -> List[Optional[str]]:
+    """为每个区域生成特写JPEG，返回与 boxes 对应的文件路径（无效区域为None）"""
+    from image_loader import file_hash, load_crops
+
+    image_hash = file_hash(image_path)
+    paths = []
+    missing = []
+    for i, box in enumerate(boxes):
+        if not isinstance(box, (list, tuple)) or len(box) != 4:
+            paths.append(None)
+            continue
+        try:
+            path = _crop_path(cache_dir, image_hash, box, pad, max_side, quality)
+        except (TypeError, ValueError):
+            paths.append(None)
+            continue
+        hit = os.path.exists(path)
+        record_cache('violation_crop', hit)
+        if not hit:
+            missing.append(i)
+        paths.append(path)
+
+    if missing:
+        os.makedirs(cache_dir, exist_ok=True)
+        # 缺失的区域一次解码全部裁出
+        crops = load_crops(image_path, [boxes[i] for i in missing], pad=pad, target_side=max_side)
+        jobs = [(crop, paths[i]) for i, crop in zip(missing, crops) if crop is not None]
+        for i, crop in zip(missing, crops):
+            if crop is None:
+                paths[i] = None
+        # 缩放和JPEG编码会释放GIL，并行执行
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(jobs)))) as executor:
+            list(executor.map(lambda job: _encode(job[0], job[1], max_side, quality), jobs))
+    return paths
+
+
+def violation_crops(analysis_data: Dict[str, Any], profile=None, level: int = 0) -> List[Optional[str]]:
+    """报告中每个违规项的特写路径；没有原图或生成失败时返回空列表"""
+    violations = analysis_data.get('violations') or []
+    image_path = resolve_source_image(analysis_data)
+    if not image_path or not violations:
+        return []
+    max_side, quality = crop_params(profile, level)
+    try:
+        return generate_crops(image_path, [v.get('coordinates') for v in violations], max_side=max_side,
+                              quality=quality)
+    except (OSError, ValueError) as e:
+        print(f"违规特写生成失败: {e}")
+        return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description='生成违规区域特写图')
+    parser.add_argument('--data', required=True, help='分析数据JSON文件路径')
+    parser.add_argument('--image', required=True, help='原图路径')
+    parser.add_argument('--output', default=CROP_DIR, help=f'特写输出目录 (默认: {CROP_DIR})')
+    parser.add_argument('--max-side', type=int, default=CROP_MAX_SIDE, help=f'特写最长边 (默认: {CROP_MAX_SIDE})')
+    parser.add_argument('--pad', type=float, default=CROP_PAD, help=f'区域外扩比例 (默认: {CROP_PAD})')
+
+    args = parser.parse_args()
+    with open(args.data, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    # 兼容 {analysis: {...}} 的包装格式
+    violations = data.get('analysis', data).get('violations') or []
+    paths = generate_crops(args.image, [v.get('coordinates') for v in violations], max_side=args.max_side,
+                           pad=args.pad, cache_dir=args.output)
+    print(json.dumps([{'index': i, 'category': v.get('category'), 'crop': p}
+                      for i, (v, p) in enumerate(zip(violations, paths))], ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+大图按需解码
+上传目录中的手机照片通常有数MB、上千万像素。这里通过内存映射读取文件，
+并利用Pillow的JPEG draft模式按需要的尺寸以 1/2、1/4、1/8 比例解码：
+计算哈希不解码，缩略图只解码到接近目标尺寸，违规区域裁剪只解码到
+足以保留裁剪区域分辨率的比例。解码结果放在按字节数限制的进程内LRU缓存中
+"""
+
+import os
+import mmap
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+# 解码图片缓存上限（字节），默认256MB
+CACHE_BYTES = int(os.environ.get('IMAGE_CACHE_BYTES', 256 * 1024 * 1024))
+
+# JPEG draft模式支持的缩小比例
+_DRAFT_SCALES = (1, 2, 4, 8)
+
+
+class DecodedCache:
+    """按字节数限制的解码图片LRU缓存（线程安全）"""
+
+    def __init__(self, max_bytes: int = CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._lock = threading.Lock()
+        self._items = OrderedDict()
+
+    @staticmethod
+    def _cost(image) -> int:
+        return image.width * image.height * len(image.getbands())
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+                return item[0]
+        return None
+
+    def put(self, key, image, scale: int):
+        cost = self._cost(image)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old[2]
+            self._items[key] = (image, scale, cost)
+            self.current_bytes += cost
+            while self.current_bytes > self.max_bytes:
+                _, (_, _, evicted) = self._items.popitem(last=False)
+                self.current_bytes -= evicted
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+
+
+_cache = DecodedCache()
+
+
+def _file_key(path: str) -> Tuple[str, int, int]:
+    st = os.stat(path)
+    return os.path.abspath(path), st.st_mtime_ns, st.st_size
+
+
+@contextmanager
+def mapped(path: str) -> Iterator[mmap.mmap]:
+    """只读内存映射文件，读取内容由操作系统按页调入，不复制到Python堆"""
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError(f"空文件: {path}")
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+
+def file_hash(path: str, algorithm: str = 'sha1') -> str:
+    """文件内容哈希，不解码图片"""
+    with mapped(path) as mm:
+        return hashlib.new(algorithm, mm).hexdigest()
+
+
+def image_size(path: str) -> Tuple[int, int]:
+    """只读取文件头获取图片尺寸"""
+    from PIL import Image
+
+    with mapped(path) as mm, Image.open(mm) as img:
+        return img.size
+
+
+def _decode(path: str, scale: int):
+    """以 1/scale 比例解码（非JPEG图片总是完整解码），返回 (RGB图片, 实际比例)"""
+    from PIL import Image
+
+    with mapped(path) as mm, Image.open(mm) as img:
+        width, height = img.size
+        if scale > 1 and img.format == 'JPEG':
+            img.draft('RGB', (max(1, width // scale), max(1, height // scale)))
+        img.load()
+        actual = max(1, int(round(width / float(img.size[0]))))
+        return img.convert('RGB'), actual
+
+
+def load_scaled(path: str, scale: int = 1, cache: bool = True):
+    """以不大于 scale 的缩小比例解码整张图片，返回 (RGB图片, 实际比例)
+
+    缓存中已有同一文件更精细的解码结果时直接复用。
+    返回的图片可能来自缓存，调用方不要原地修改
+    """
+    scale = max(s for s in _DRAFT_SCALES if s <= max(1, scale))
+    key = _file_key(path)
+    if cache:
+        for s in reversed(_DRAFT_SCALES):
+            if s > scale:
+                continue
+            image = _cache.get(key + (s,))
+            if image is not None:
+                return image, s
+    image, actual = _decode(path, scale)
+    if cache:
+        _cache.put(key + (actual,), image, actual)
+    return image, actual
+
+
+def _scale_for(width: int, height: int, max_side: int) -> int:
+    """解码后最长边不小于 max_side 的最大缩小比例"""
+    longest = max(width, height)
+    return max([s for s in _DRAFT_SCALES if longest // s >= max_side] or [1])
+
+
+def load_reduced(path: str, max_side: int, cache: bool = True):
+    """缩略图：最长边不超过 max_side 的RGB图片"""
+    from PIL import Image
+
+    width, height = image_size(path)
+    image, _ = load_scaled(path, _scale_for(width, height, max_side), cache)
+    if max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    return image
+
+
+def perceptual_hash(path: str, hash_size: int = 8) -> int:
+    """差值感知哈希，以最小比例解码"""
+    from video_ingest import dhash
+
+    image, _ = load_scaled(path, 8, cache=False)
+    return dhash(image, hash_size)
+
+
+def _padded_box(box: Sequence[float], pad: float, width: int, height: int) -> Tuple[int, int, int, int]:
+    x1, y1, x2, y2 = box
+    px = (x2 - x1) * pad
+    py = (y2 - y1) * pad
+    return (max(0, int(x1 - px)), max(0, int(y1 - py)),
+            min(width, int(round(x2 + px))), min(height, int(round(y2 + py))))
+
+
+def load_crops(path: str, boxes: Sequence[Sequence[float]], pad: float = 0.0,
+               target_side: Optional[int] = None, cache: bool = True) -> List[Optional[object]]:
+    """一次解码裁剪多个区域，boxes 为原图坐标 [x1, y1, x2, y2]
+
+    target_side 为裁剪图最终显示的最长边：按最小的区域选择解码比例，
+    保证每个裁剪区域解码后的分辨率不低于 target_side；为None时按原图分辨率裁剪。
+    无效区域对应位置返回None
+    """
+    width, height = image_size(path)
+    regions = []
+    for box in boxes:
+        try:
+            region = _padded_box([float(c) for c in box], pad, width, height)
+        except (TypeError, ValueError):
+            region = None
+        if region is None or region[2] <= region[0] or region[3] <= region[1]:
+            region = None
+        regions.append(region)
+
+    valid = [r for r in regions if r]
+    if not valid:
+        return [None] * len(regions)
+    scale = 1
+    if target_side:
+        smallest = min(max(r[2] - r[0], r[3] - r[1]) for r in valid)
+        scale = max([s for s in _DRAFT_SCALES if smallest // s >= target_side] or [1])
+    image, actual = load_scaled(path, scale, cache)
+
+    crops = []
+    for region in regions:
+        if region is None:
+            crops.append(None)
+            continue
+        scaled = tuple(int(c / actual) for c in region)
+        crops.append(image.crop(scaled))
+    return crops
+
+
+def clear_cache():
+    _cache.clear()
@@ -0,0 +1,506 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+复查差异报告
+对同一站点的上次与本次分析结果按“类别 + 区域重叠”匹配违规项，
+生成只包含 已整改 / 新发现 / 仍存在 三部分的精简复查报告。
+违规项正文（描述、条例、整改建议）的报告片段只按内容缓存，完整报告生成时写入，
+复查时新发现和仍存在的违规项都直接复用；Word片段持久化，PDF段落只在进程内复用
+"""
+
+import os
+import copy
+import json
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from worker_metrics import record_cache
+
+FRAGMENT_DB = os.environ.get('FRAGMENT_DB', './temp/.fragments.sqlite3')
+
+# 片段版式变化时递增，使旧缓存失效
+FRAGMENT_VERSION = 2
+# 命中片段的使用时间（用于清理最久未使用的片段）最多每隔这么多秒更新一次
+TOUCH_INTERVAL = 3600
+
+# 判定为同一违规项的最小IoU
+MATCH_IOU = 0.3
+
+# 片段内容只取正文用到的字段，标题、序号、坐标和特写图片不在片段内
+_FRAGMENT_FIELDS = ('description', 'regulations', 'suggestions', 'risk_level')
+
+# 违规项正文版式：simple_report（线上报告）与 ReportGenerator 措辞不同，片段按版式分别缓存
+LAYOUTS = {
+    'simple': {
+        'description': '违规描述: {description}',
+        'regulations': '相关条例:',
+        'regulation': '• {code} {article}: {content}',
+        'suggestions': '整改建议:',
+        'risk_level': '风险等级: {risk_level}',
+    },
+    'generator': {
+        'description': '违规行为：{description}',
+        'regulations': '违反规范：',
+        'regulation': '• {code} 第{article}条：{content}',
+        'suggestions': '整改建议：',
+        'risk_level': None,
+    },
+}
+
+
+def _as_dict(analysis: Any) -> Dict[str, Any]:
+    """兼容 AnalysisResult 与字典"""
+    if hasattr(analysis, 'to_dict'):
+        return analysis.to_dict()
+    return analysis or {}
+
+
+def _box(violation: Dict[str, Any]) -> Optional[List[float]]:
+    coords = violation.get('coordinates')
+    if isinstance(coords, (list, tuple)) and len(coords) == 4:
+        try:
+            return [float(c) for c in coords]
+        except (TypeError, ValueError):
+            return None
+    return None
+
+
+def match_violations(previous: List[Dict[str, Any]], current: List[Dict[str, Any]],
+                     iou_threshold: float = MATCH_IOU) -> Tuple[List[Tuple[int, int]], List[int], List[int]]:
+    """匹配两次检测的违规项，返回 (匹配对, 已整改下标, 新发现下标)
+
+    只在同一类别内匹配，按IoU从大到小贪心配对；没有坐标的违规项按描述完全一致匹配
+    """
+    from box_utils import iou_matrix
+
+    by_category = {}
+    for side, items in ((0, previous), (1, current)):
+        for i, v in enumerate(items):
+            by_category.setdefault(v.get('category') or '', ([], []))[side].append(i)
+
+    pairs = []
+    for prev_idx, curr_idx in by_category.values():
+        prev_boxed = [i for i in prev_idx if _box(previous[i]) is not None]
+        curr_boxed = [j for j in curr_idx if _box(current[j]) is not None]
+        if prev_boxed and curr_boxed:
+            ious = iou_matrix([_box(previous[i]) for i in prev_boxed], [_box(current[j]) for j in curr_boxed])
+            candidates = sorted(((ious[a, b], a, b) for a in range(len(prev_boxed)) for b in range(len(curr_boxed))
+                                 if ious[a, b] >= iou_threshold), reverse=True)
+            used_a, used_b = set(), set()
+            for _, a, b in candidates:
+                if a in used_a or b in used_b:
+                    continue
+                used_a.add(a)
+                used_b.add(b)
+                pairs.append((prev_boxed[a], curr_boxed[b]))
+
+        unboxed = {}
+        for i in prev_idx:
+            if _box(previous[i]) is None:
+                unboxed.setdefault(previous[i].get('description'), []).append(i)
+        for j in curr_idx:
+            if _box(current[j]) is None:
+                waiting = unboxed.get(current[j].get('description'))
+                if waiting:
+                    pairs.append((waiting.pop(0), j))
+
+    matched_prev = {i for i, _ in pairs}
+    matched_curr = {j for _, j in pairs}
+    resolved = [i for i in range(len(previous)) if i not in matched_prev]
+    new = [j for j in range(len(current)) if j not in matched_curr]
+    return sorted(pairs, key=lambda p: p[1]), resolved, new
+
+
+def _dedupe(data: Dict[str, Any]) -> Dict[str, Any]:
+    try:
+        from box_utils import dedupe_analysis
+    except ImportError:
+        return data
+    return dedupe_analysis(data)
+
+
+def diff_analysis(previous: Any, current: Any, iou_threshold: float = MATCH_IOU,
+                  dedupe: bool = False) -> Dict[str, Any]:
+    """对比两次分析结果（AnalysisResult 或字典）
+
+    dedupe为True时先合并两次结果中重叠的同类违规项，与完整报告的处理一致
+    """
+    previous = _as_dict(previous)
+    current = _as_dict(current)
+    if dedupe:
+        previous = _dedupe(previous)
+        current = _dedupe(current)
+    prev_violations = previous.get('violations') or []
+    curr_violations = current.get('violations') or []
+    pairs, resolved, new = match_violations(prev_violations, curr_violations, iou_threshold)
+    return {
+        'previous': previous,
+        'current': current,
+        'resolved': [prev_violations[i] for i in resolved],
+        'new': [curr_violations[j] for j in new],
+        'persisting': [curr_violations[j] for _, j in pairs],
+    }
+
+
+def fragment_key(layout: str, fmt: str, violation: Dict[str, Any], style: str = '') -> str:
+    """片段缓存键：只由违规项正文内容、版式和输出格式决定，与其在复查报告中的分类无关"""
+    content = {k: violation.get(k) for k in _FRAGMENT_FIELDS}
+    payload = json.dumps([FRAGMENT_VERSION, layout, fmt, style, content], ensure_ascii=False, sort_keys=True)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+def violation_lines(violation: Dict[str, Any], layout: str = 'simple') -> List[Tuple[str, bool]]:
+    """违规项正文（不含标题和特写），返回 (文本, 是否列表项)"""
+    fmt = LAYOUTS[layout]
+    lines = [(fmt['description'].format(description=violation.get('description', '无描述')), False)]
+    regulations = violation.get('regulations', [])
+    if regulations:
+        lines.append((fmt['regulations'], False))
+        for reg in regulations:
+            lines.append((fmt['regulation'].format(code=reg.get('code', ''), article=reg.get('article', ''),
+                                                   content=reg.get('content', '')), True))
+    suggestions = violation.get('suggestions', [])
+    if suggestions:
+        lines.append((fmt['suggestions'], False))
+        for suggestion in suggestions:
+            lines.append((f"• {suggestion}", True))
+    if fmt['risk_level'] and violation.get('risk_level', ''):
+        lines.append((fmt['risk_level'].format(risk_level=violation['risk_level']), False))
+    return lines
+
+
+class FragmentCache:
+    """报告片段缓存（线程安全）
+
+    内存中按LRU保留最近使用的片段。DOCX片段是XML文本，同时写入SQLite供每次调用新启动的
+    报告进程复用；PDF片段是解析好的段落对象，只保存在进程内存中（persist=False）。
+    一次报告只在 prefetch() 时批量读取、flush() 时在一个事务中写入
+    """
+
+    def __init__(self, db_path: Optional[str] = FRAGMENT_DB, max_entries: int = 2000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        # 值为None表示已确认缓存库中没有该片段
+        self._memory = OrderedDict()
+        self._conn = None
+        self._puts = 0
+        # 待写入的新片段；值为None表示只需更新使用时间
+        self._pending = {}
+        if db_path:
+            try:
+                os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+                self._conn = sqlite3.connect(db_path, check_same_thread=False)
+                # 缓存库丢失最近写入也无妨，WAL模式下提交不必每次落盘
+                self._conn.execute('PRAGMA journal_mode=WAL')
+                self._conn.execute('PRAGMA synchronous=NORMAL')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS fragments (
+                        key TEXT PRIMARY KEY,
+                        body TEXT NOT NULL,
+                        used_at REAL NOT NULL
+                    )
+                ''')
+            except (OSError, sqlite3.Error) as e:
+                print(f"片段缓存不可用: {e}")
+                self._conn = None
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def prefetch(self, keys: List[str]):
+        """一次查询读取尚未在内存中的持久化片段，之后的 get() 不再逐条查询缓存库"""
+        with self._lock:
+            if self._conn is None:
+                return
+            missing = list(dict.fromkeys(k for k in keys if k not in self._memory))
+            found = {}
+            try:
+                for i in range(0, len(missing), 500):
+                    chunk = missing[i:i + 500]
+                    found.update((key, (body, used_at)) for key, body, used_at in self._conn.execute(
+                        f"SELECT key, body, used_at FROM fragments WHERE key IN ({','.join('?' * len(chunk))})",
+                        chunk))
+            except sqlite3.Error as e:
+                print(f"片段缓存读取失败: {e}")
+                return
+            now = datetime.now().timestamp()
+            for key in missing:
+                body, used_at = found.get(key, (None, now))
+                self._remember(key, body)
+                if now - used_at > TOUCH_INTERVAL:
+                    self._pending.setdefault(key, None)
+
+    def get(self, key: str, persist: bool = True) -> Any:
+        """返回缓存的片段，未命中返回None；persist为False时只查内存"""
+        with self._lock:
+            if key in self._memory:
+                value = self._memory[key]
+                self._memory.move_to_end(key)
+            else:
+                value = None
+                if persist and self._conn is not None:
+                    row = self._conn.execute('SELECT body, used_at FROM fragments WHERE key = ?',
+                                             (key,)).fetchone()
+                    if row:
+                        value = row[0]
+                        if datetime.now().timestamp() - row[1] > TOUCH_INTERVAL:
+                            self._pending.setdefault(key, None)
+                    self._remember(key, value)
+        record_cache('report_fragment', value is not None)
+        return value
+
+    def put(self, key: str, value: Any, persist: bool = True):
+        with self._lock:
+            self._remember(key, value)
+            if persist:
+                self._pending[key] = value
+
+    def flush(self):
+        """写入暂存的新片段并更新命中片段的使用时间"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if not pending or self._conn is None:
+                return
+            now = datetime.now().timestamp()
+            try:
+                with self._conn:
+                    self._conn.executemany('INSERT OR REPLACE INTO fragments VALUES (?, ?, ?)',
+                                           [(k, v, now) for k, v in pending.items() if v is not None])
+                    self._conn.executemany('UPDATE fragments SET used_at = ? WHERE key = ?',
+                                           [(now, k) for k, v in pending.items() if v is None])
+                    self._puts += 1
+                    # 定期清理最久未使用的片段
+                    if self._puts % 20 == 0:
+                        self._conn.execute('''
+                            DELETE FROM fragments WHERE key IN (
+                                SELECT key FROM fragments ORDER BY used_at DESC LIMIT -1 OFFSET ?
+                            )''', (self.max_entries,))
+            except sqlite3.Error as e:
+                print(f"片段缓存写入失败: {e}")
+
+    def _remember(self, key: str, value: Any):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+
+_default_cache = None
+_default_lock = threading.Lock()
+
+
+def default_cache() -> FragmentCache:
+    global _default_cache
+    with _default_lock:
+        if _default_cache is None:
+            _default_cache = FragmentCache()
+        return _default_cache
+
+
+def _summary_rows(diff: Dict[str, Any]) -> List[List[str]]:
+    prev = diff['previous'].get('summary') or {}
+    curr = diff['current'].get('summary') or {}
+    return [
+        ['项目', '上次检测', '本次检测'],
+        ['安全评分', str(prev.get('total_score', 0)), str(curr.get('total_score', 0))],
+        ['严重违规', str(prev.get('severe_count', 0)), str(curr.get('severe_count', 0))],
+        ['一般违规', str(prev.get('normal_count', 0)), str(curr.get('normal_count', 0))],
+    ]
+
+
+def _change_line(diff: Dict[str, Any]) -> str:
+    return (f"已整改 {len(diff['resolved'])} 项，新发现 {len(diff['new'])} 项，"
+            f"仍存在 {len(diff['persisting'])} 项")
+
+
+def prefetch_word_bodies(violations: List[Dict[str, Any]], layout: str = 'simple',
+                         cache: Optional[FragmentCache] = None):
+    """生成Word报告前一次读取全部违规项的正文片段"""
+    (cache or default_cache()).prefetch([fragment_key(layout, 'word', v) for v in violations])
+
+
+def word_violation_body(doc, violation: Dict[str, Any], layout: str = 'simple',
+                        cache: Optional[FragmentCache] = None):
+    """向文档追加违规项正文，命中缓存时直接插入缓存的XML，未命中时生成并写入缓存"""
+    from docx.oxml import parse_xml
+
+    cache = cache or default_cache()
+    key = fragment_key(layout, 'word', violation)
+    cached = cache.get(key)
+    if cached is not None:
+        body = doc.element.body
+        sect_pr = body.sectPr
+        for xml in json.loads(cached):
+            element = parse_xml(xml)
+            if sect_pr is not None:
+                sect_pr.addprevious(element)
+            else:
+                body.append(element)
+        return
+    added = []
+    for text, bullet in violation_lines(violation, layout):
+        paragraph = doc.add_paragraph(text, style='List Bullet') if bullet else doc.add_paragraph(text)
+        added.append(paragraph._p)
+    cache.put(key, json.dumps([element.xml for element in added], ensure_ascii=False))
+
+
+def _style_signature(style) -> str:
+    return '/'.join(str(getattr(style, attr)) for attr in ('name', 'fontName', 'fontSize', 'leading', 'spaceAfter'))
+
+
+def pdf_violation_body(violation: Dict[str, Any], style, layout: str = 'simple',
+                       cache: Optional[FragmentCache] = None) -> list:
+    """违规项正文的PDF段落
+
+    缓存只在进程内保存未参与排版的段落，每次返回浅拷贝（排版时会修改段落对象），
+    省去重新解析段落标记
+    """
+    from reportlab.platypus import Paragraph
+
+    cache = cache or default_cache()
+    key = fragment_key(layout, 'pdf', violation, _style_signature(style))
+    parts = cache.get(key, persist=False)
+    if parts is None:
+        parts = [Paragraph(text, style) for text, _ in violation_lines(violation, layout)]
+        cache.put(key, parts, persist=False)
+    return [copy.copy(part) for part in parts]
+
+
+def _heading(v: Dict[str, Any]) -> str:
+    return f"{v.get('type', '违规')} - {v.get('category', '建筑安全违规')}"
+
+
+def render_diff_word(diff: Dict[str, Any], output_path: str, profile=None, level: int = 0,
+                     cache: Optional[FragmentCache] = None, title: str = '建筑安全复查报告',
+                     layout: str = 'simple') -> bool:
+    """生成Word格式复查报告"""
+    cache = cache or default_cache()
+    try:
+        from docx import Document
+        from docx.shared import Pt
+        from docx.enum.text import WD_ALIGN_PARAGRAPH
+
+        doc = Document()
+        heading = doc.add_heading(title, 0)
+        heading.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        time_para = doc.add_paragraph()
+        time_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
+        time_para.add_run(f'生成时间: {datetime.now().strftime("%Y年%m月%d日 %H:%M:%S")}').font.size = Pt(12)
+
+        doc.add_heading('复查概览', level=1)
+        rows = _summary_rows(diff)
+        table = doc.add_table(rows=len(rows), cols=3)
+        table.style = 'Table Grid'
+        for r, row in enumerate(rows):
+            for c, text in enumerate(row):
+                table.cell(r, c).text = text
+        doc.add_paragraph(_change_line(diff))
+
+        # 新发现与仍存在：标题 + 缓存的正文片段
+        for section, kind in (('新发现违规', 'new'), ('仍存在违规', 'persisting')):
+            if diff[kind]:
+                doc.add_heading(section, level=1)
+                prefetch_word_bodies(diff[kind], layout, cache)
+                for v in diff[kind]:
+                    doc.add_heading(_heading(v), level=2)
+                    word_violation_body(doc, v, layout, cache)
+
+        # 已整改：每项一行
+        if diff['resolved']:
+            doc.add_heading('已整改违规', level=1)
+            for v in diff['resolved']:
+                doc.add_paragraph(f"{v.get('category', '建筑安全违规')}: {v.get('description', '无描述')}",
+                                  style='List Bullet')
+
+        doc.save(output_path)
+        print(f"Word复查报告已生成: {output_path}")
+        return True
+
+    except ImportError:
+        print("缺少python-docx库，请运行: pip install python-docx")
+        return False
+    except Exception as e:
+        print(f"Word复查报告生成失败: {e}")
+        return False
+    finally:
+        cache.flush()
+
+
+def render_diff_pdf(diff: Dict[str, Any], output_path: str, profile=None, level: int = 0,
+                    cache: Optional[FragmentCache] = None, title: str = '建筑安全复查报告',
+                    font_name: str = 'Helvetica', layout: str = 'simple', body_style=None) -> bool:
+    """生成PDF格式复查报告
+
+    body_style为违规项正文样式，与完整报告一致时可复用完整报告生成时缓存的片段
+    """
+    cache = cache or default_cache()
+    try:
+        from reportlab.lib.pagesizes import A4
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+        from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+        from reportlab.lib.units import inch
+        from reportlab.lib import colors
+
+        doc = SimpleDocTemplate(output_path, pagesize=A4)
+        styles = getSampleStyleSheet()
+        title_style = ParagraphStyle('DiffTitle', parent=styles['Heading1'], fontSize=18, spaceAfter=30,
+                                     alignment=1, fontName=font_name)
+        heading_style = ParagraphStyle('DiffHeading', parent=styles['Heading2'], fontSize=14, spaceAfter=12,
+                                       spaceBefore=20, fontName=font_name)
+        item_style = ParagraphStyle('DiffItem', parent=styles['Heading3'], fontSize=11, spaceAfter=6,
+                                    fontName=font_name)
+        # 与 simple_report 完整报告的正文样式相同
+        normal_style = ParagraphStyle('CustomNormal', parent=styles['Normal'], fontSize=10, spaceAfter=6,
+                                      fontName=font_name)
+        body_style = body_style or normal_style
+
+        story = [
+            Paragraph(title, title_style),
+            Paragraph(f'生成时间: {datetime.now().strftime("%Y年%m月%d日 %H:%M:%S")}', normal_style),
+            Spacer(1, 20),
+            Paragraph('复查概览', heading_style),
+        ]
+        table = Table(_summary_rows(diff), colWidths=[2*inch, 1.5*inch, 1.5*inch])
+        table.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, -1), font_name),
+            ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black)
+        ]))
+        story.append(table)
+        story.append(Spacer(1, 12))
+        story.append(Paragraph(_change_line(diff), normal_style))
+
+        for section, kind in (('新发现违规', 'new'), ('仍存在违规', 'persisting')):
+            if diff[kind]:
+                story.append(Paragraph(section, heading_style))
+                for v in diff[kind]:
+                    story.append(Paragraph(_heading(v), item_style))
+                    story.extend(pdf_violation_body(v, body_style, layout, cache))
+
+        if diff['resolved']:
+            story.append(Paragraph('已整改违规', heading_style))
+            for v in diff['resolved']:
+                story.append(Paragraph(f"• {v.get('category', '建筑安全违规')}: {v.get('description', '无描述')}",
+                                       normal_style))
+
+        doc.build(story)
+        print(f"PDF复查报告已生成: {output_path}")
+        return True
+
+    except ImportError:
+        print("缺少reportlab库，请运行: pip install reportlab")
+        return False
+    except Exception as e:
+        print(f"PDF复查报告生成失败: {e}")
+        return False
@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+豆包AI接口本地模拟服务
+实现 /api/v3/chat/completions，返回 routes/analyze.js 所需格式的违规JSON，
+可配置响应延迟分布和错误率（429/5xx/超时），用于离线压测分析与报告生成链路
+"""
+
+import json
+import math
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional
+
+# 与 routes/analyze.js 中 generateMockAnalysis 的数据一致
+CANNED_VIOLATIONS = [
+    {
+        "type": "严重违规",
+        "category": "基坑支护安全",
+        "description": "沟槽深度超过1.5m，两侧边缘未设置标准防护栏杆，工人直接在沟槽内作业存在严重安全隐患",
+        "coordinates": [100, 100, 300, 220],
+        "regulations": [{
+            "code": "JGJ59-2011",
+            "article": "4.1.3",
+            "content": "基坑深度超过1.5m时，必须设置安全防护栏杆，高度不低于1.2米"
+        }],
+        "suggestions": ["立即在基坑边缘设置安全防护栏杆", "设置明显的安全警示标识", "加强现场安全巡查"],
+        "severity": "high",
+        "risk_level": "极高风险（可能导致人员伤亡）"
+    },
+    {
+        "type": "严重违规",
+        "category": "基坑支护安全",
+        "description": "沟槽侧壁垂直开挖，未采取放坡或支护措施，存在坍塌风险，且沟槽内积水未及时排除",
+        "coordinates": [60, 120, 340, 260],
+        "regulations": [{
+            "code": "JGJ59-2011",
+            "article": "4.1.4",
+            "content": "基坑开挖应采取放坡或支护措施，严禁垂直开挖"
+        }],
+        "suggestions": ["立即停止垂直开挖作业", "采取放坡或支护措施", "进行安全技术交底"],
+        "severity": "high",
+        "risk_level": "极高风险（可能导致坍塌事故）"
+    },
+    {
+        "type": "一般违规",
+        "category": "现场管理",
+        "description": "PVC管材、木质板材、金属盖板等材料未分类堆放",
+        "coordinates": [80, 280, 200, 350],
+        "regulations": [{
+            "code": "JGJ59-2011",
+            "article": "4.1.2",
+            "content": "施工现场材料应分类堆放整齐，保持通道畅通"
+        }],
+        "suggestions": ["立即整理材料，按类型分类堆放", "设置明显的材料标识", "定期清理现场杂物"],
+        "severity": "medium",
+        "risk_level": "中等风险（可能导致轻微伤害）"
+    },
+    {
+        "type": "一般违规",
+        "category": "现场管理",
+        "description": "通道上放置手推车、铁锹等工具，通道宽度不足",
+        "coordinates": [250, 300, 380, 370],
+        "regulations": [{
+            "code": "JGJ59-2011",
+            "article": "4.1.2",
+            "content": "施工现场材料应分类堆放整齐，保持通道畅通"
+        }],
+        "suggestions": ["清理通道上的工具和材料", "确保通道宽度符合安全要求", "设置专门的工具存放区域"],
+        "severity": "medium",
+        "risk_level": "中等风险（可能导致轻微伤害）"
+    },
+]
+
+
+class MockConfig:
+    """模拟服务配置"""
+
+    def __init__(self, latency_median: float = 2.0, latency_sigma: float = 0.5, latency_max: float = 60.0,
+                 rate_429: float = 0.0, rate_5xx: float = 0.0, rate_timeout: float = 0.0,
+                 timeout_seconds: float = 150.0, rate_fenced: float = 0.5, rate_truncated: float = 0.0,
+                 seed: Optional[int] = None):
+        # 延迟服从对数正态分布：中位数 latency_median 秒，形状参数 latency_sigma
+        self.latency_median = latency_median
+        self.latency_sigma = latency_sigma
+        self.latency_max = latency_max
+        self.rate_429 = rate_429
+        self.rate_5xx = rate_5xx
+        # 超时：挂起 timeout_seconds 秒后断开连接，不返回响应
+        self.rate_timeout = rate_timeout
+        self.timeout_seconds = timeout_seconds
+        # 模型输出带 ```json 代码块标记 / 被截断的比例
+        self.rate_fenced = rate_fenced
+        self.rate_truncated = rate_truncated
+        self.random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, '200': 0, '429': 0, '5xx': 0, 'timeout': 0}
+
+    def sample(self) -> Dict[str, Any]:
+        """为一次请求抽样：延迟、结果类型、违规数量"""
+        with self._lock:
+            r = self.random.random()
+            latency = 0.0
+            if self.latency_median > 0:
+                latency = min(self.latency_max,
+                              self.random.lognormvariate(math.log(self.latency_median), self.latency_sigma))
+            if r < self.rate_429:
+                outcome = '429'
+            elif r < self.rate_429 + self.rate_5xx:
+                outcome = '5xx'
+            elif r < self.rate_429 + self.rate_5xx + self.rate_timeout:
+                outcome = 'timeout'
+            else:
+                outcome = '200'
+            sample = {
+                'latency': latency,
+                'outcome': outcome,
+                'violations': self.random.randint(0, len(CANNED_VIOLATIONS)),
+                'fenced': self.random.random() < self.rate_fenced,
+                'truncated': self.random.random() < self.rate_truncated,
+                'error_status': self.random.choice((500, 502, 503)),
+            }
+            self.stats['requests'] += 1
+            self.stats[outcome] += 1
+        return sample
+
+
+def build_content(violation_count: int, fenced: bool = False, truncated: bool = False) -> str:
+    """构造模型输出文本"""
+    violations = CANNED_VIOLATIONS[:violation_count]
+    severe = sum(1 for v in violations if v['type'] == '严重违规')
+    normal = len(violations) - severe
+    data = {
+        "violations": violations,
+        "summary": {
+            "severe_count": severe,
+            "normal_count": normal,
+            "total_score": max(0, 100 - severe * 20 - normal * 10),
+            "overall_assessment": "现场存在多项安全风险，需要立即整改" if violations else "未发现明显安全违规",
+            "priority_actions": [v['suggestions'][0] for v in violations[:3]]
+        }
+    }
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if truncated:
+        text = text[:int(len(text) * 0.8)]
+    if fenced:
+        text = f"```json\n{text}\n```"
+    return text
+
+
+def make_handler(config: MockConfig):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status: int, payload: Dict[str, Any]):
+            body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == '/stats':
+                self._send_json(200, config.stats)
+            else:
+                self._send_json(404, {'error': {'message': 'not found'}})
+
+        def do_POST(self):
+            length = int(self.headers.get('Content-Length') or 0)
+            raw = self.rfile.read(length) if length else b''
+            if self.path.rstrip('/') != '/api/v3/chat/completions':
+                self._send_json(404, {'error': {'message': 'not found'}})
+                return
+            if not self.headers.get('Authorization', '').startswith('Bearer '):
+                self._send_json(401, {'error': {'code': 'AuthenticationError', 'message': '缺少API Key'}})
+                return
+            try:
+                request = json.loads(raw or b'{}')
+            except ValueError:
+                self._send_json(400, {'error': {'message': 'invalid json'}})
+                return
+
+            sample = config.sample()
+            if sample['outcome'] == 'timeout':
+                time.sleep(config.timeout_seconds)
+                self.close_connection = True
+                return
+            time.sleep(sample['latency'])
+            if sample['outcome'] == '429':
+                self._send_json(429, {'error': {'code': 'RateLimitExceeded', 'message': '请求过于频繁'}})
+                return
+            if sample['outcome'] == '5xx':
+                self._send_json(sample['error_status'],
+                                {'error': {'code': 'InternalServiceError', 'message': '服务内部错误'}})
+                return
+
+            content = build_content(sample['violations'], sample['fenced'], sample['truncated'])
+            self._send_json(200, {
+                'id': f"mock-{int(time.time() * 1000)}",
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': request.get('model', 'mock'),
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': content},
+                    'finish_reason': 'length' if sample['truncated'] else 'stop'
+                }],
+                'usage': {'prompt_tokens': len(raw) // 4, 'completion_tokens': len(content), 'total_tokens': 0}
+            })
+
+    return Handler
+
+
+def start_server(config: MockConfig, host: str = '127.0.0.1', port: int = 0) -> ThreadingHTTPServer:
+    """在后台线程启动模拟服务，port为0时自动分配端口"""
+    server = ThreadingHTTPServer((host, port), make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='mock-ark').start()
+    return server
+
+
+def add_config_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument('--latency', type=float, default=2.0, help='延迟中位数秒数 (默认: 2.0)')
+    parser.add_argument('--latency-sigma', type=float, default=0.5, help='对数正态分布形状参数 (默认: 0.5)')
+    parser.add_argument('--rate-429', type=float, default=0.0, help='429错误比例')
+    parser.add_argument('--rate-5xx', type=float, default=0.0, help='5xx错误比例')
+    parser.add_argument('--rate-timeout', type=float, default=0.0, help='超时比例')
+    parser.add_argument('--timeout-seconds', type=float, default=150.0, help='超时请求挂起秒数 (默认: 150)')
+    parser.add_argument('--rate-truncated', type=float, default=0.0, help='输出被截断的比例')
+    parser.add_argument('--rate-fenced', type=float, default=0.5, help='输出包裹在```json代码块中的比例 (默认: 0.5)')
+    parser.add_argument('--seed', type=int, help='随机种子')
+
+
+def config_from_args(args) -> MockConfig:
+    return MockConfig(latency_median=args.latency, latency_sigma=args.latency_sigma,
+                      rate_429=args.rate_429, rate_5xx=args.rate_5xx, rate_timeout=args.rate_timeout,
+                      timeout_seconds=args.timeout_seconds, rate_truncated=args.rate_truncated,
+                      rate_fenced=args.rate_fenced, seed=args.seed)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='豆包AI接口本地模拟服务')
+    parser.add_argument('--host', default='127.0.0.1', help='监听地址 (默认: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8089, help='监听端口 (默认: 8089)')
+    add_config_arguments(parser)
+
+    args = parser.parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(config_from_args(args)))
+    server.daemon_threads = True
+    print(f"🚀 模拟服务已启动: http://{args.host}:{args.port}/api/v3/chat/completions")
+    print(f"   设置 ARK_API_BASE_URL=http://{args.host}:{args.port} 即可让分析链路使用模拟服务")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+PDF中文字体注册
+reportlab的 pdfmetrics 字体表是进程级全局状态，这里加锁并只注册一次，
+多个线程同时生成PDF时不会重复加载字体文件或读到注册了一半的字体
+"""
+
+import os
+import threading
+
+# 尝试多个中文字体路径
+FONT_PATHS = [
+    "C:/Windows/Fonts/simsun.ttc",  # Windows宋体
+    "C:/Windows/Fonts/msyh.ttc",    # 微软雅黑
+    "C:/Windows/Fonts/simhei.ttf",  # 黑体
+    "C:/Windows/Fonts/simsun.ttf"   # 宋体TTF
+]
+
+FONT_NAME = 'ChineseFont'
+DEFAULT_FONT = 'Helvetica'
+
+_lock = threading.Lock()
+_registered = None
+
+
+def register_chinese_font() -> str:
+    """注册中文字体，返回字体名；没有可用字体时回退到Helvetica"""
+    global _registered
+    if _registered is not None:
+        return _registered
+    with _lock:
+        if _registered is not None:
+            return _registered
+        chinese_font = DEFAULT_FONT
+        try:
+            from reportlab.pdfbase import pdfmetrics
+            from reportlab.pdfbase.ttfonts import TTFont
+
+            for font_path in FONT_PATHS:
+                if os.path.exists(font_path):
+                    try:
+                        pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
+                        chinese_font = FONT_NAME
+                        print(f"成功注册字体: {font_path}")
+                        break
+                    except Exception as e:
+                        print(f"字体注册失败 {font_path}: {e}")
+                        continue
+        except Exception as e:
+            print(f"字体处理失败: {e}")
+            chinese_font = DEFAULT_FONT
+        _registered = chinese_font
+        return chinese_font
@@ -7,21 +7,65 @@
 
 import os
 import json
+import time
+import uuid
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional
+
+from pdf_fonts import register_chinese_font, DEFAULT_FONT
+from worker_metrics import observe_report, QUEUE_DEPTH
 
 class ReportGenerator:
     """建筑安全分析报告生成器"""
     
-    def __init__(self):
+    def __init__(self, max_workers: Optional[int] = None):
         self.company_name = "建筑安全检测平台"
         self.report_template = {
             "title": "建筑安全与质量检测报告",
             "subtitle": "基于AI视觉识别技术的安全分析",
             "footer": "本报告由AI系统自动生成，仅供参考"
         }
+        # render() 使用的有界线程池，首次调用时创建
+        self.max_workers = max_workers or min(8, (os.cpu_count() or 1) + 2)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._local = threading.local()
+    
+    @property
+    def last_output_info(self) -> Optional[Dict[str, Any]]:
+        """当前线程最近一次按输出配置生成的报告信息（实际大小、是否在预算内等）"""
+        return getattr(self._local, "last_output_info", None)
+    
+    @last_output_info.setter
+    def last_output_info(self, info: Optional[Dict[str, Any]]):
+        self._local.last_output_info = info
+    
+    def _output_path(self, output_dir: str, prefix: str, ext: str) -> str:
+        """带随机后缀的输出路径，同一秒内的并发调用不会互相覆盖"""
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return os.path.join(output_dir, f"{prefix}_{timestamp}_{uuid.uuid4().hex[:8]}{ext}")
+    
+    def _trend_chart(self, analysis_data: Dict[str, Any]) -> Optional[str]:
+        """站点历史趋势图，没有趋势数据时返回None"""
+        try:
+            from trend_rollup import trend_chart_for_report
+        except ImportError:
+            return None
+        return trend_chart_for_report(analysis_data)
+    
+    def _violation_crops(self, analysis_data: Dict[str, Any], profile=None, level: int = 0) -> List[Optional[str]]:
+        """每个违规项的区域特写图，没有原图时返回空列表"""
+        try:
+            from crop_gallery import violation_crops
+        except ImportError:
+            return []
+        return violation_crops(analysis_data, profile, level)
     
-    def generate_word_report(self, analysis_data: Dict[str, Any], output_path: str) -> bool:
+    def generate_word_report(self, analysis_data: Dict[str, Any], output_path: str,
+                             profile=None, level: int = 0) -> bool:
         """生成Word格式报告"""
         try:
             from docx import Document
@@ -56,6 +100,13 @@ class ReportGenerator:
             score = analysis_data.get("summary", {}).get("total_score", 0)
             doc.add_paragraph(f"整体安全评分：{score}/100")
             
+            # 安全趋势
+            trend_chart = self._trend_chart(analysis_data)
+            if trend_chart:
+                doc.add_heading("安全趋势", level=1)
+                from report_profiles import embed_image
+                doc.add_picture(embed_image(trend_chart, 6, profile, level), width=Inches(6))
+            
             # 违规统计
             doc.add_heading("违规统计", level=1)
             violations = analysis_data.get("violations", [])
@@ -78,21 +129,17 @@ class ReportGenerator:
             # 详细违规信息
             if violations:
                 doc.add_heading("详细违规信息", level=1)
+                from inspection_diff import default_cache, prefetch_word_bodies, word_violation_body
+                cache = default_cache()
+                prefetch_word_bodies(violations, 'generator', cache)
+                crops = self._violation_crops(analysis_data, profile, level)
                 for i, violation in enumerate(violations):
                     doc.add_heading(f"违规 {i + 1}: {violation.get('category', '未知类别')}", level=2)
-                    doc.add_paragraph(f"违规行为：{violation.get('description', '无描述')}")
-                    
-                    regulations = violation.get("regulations", [])
-                    if regulations:
-                        doc.add_paragraph("违反规范：")
-                        for reg in regulations:
-                            doc.add_paragraph(f"• {reg.get('code', '')} 第{reg.get('article', '')}条：{reg.get('content', '')}", style='List Bullet')
-                    
-                    suggestions = violation.get("suggestions", [])
-                    if suggestions:
-                        doc.add_paragraph("整改建议：")
-                        for suggestion in suggestions:
-                            doc.add_paragraph(f"• {suggestion}", style='List Bullet')
+                    if i < len(crops) and crops[i]:
+                        doc.add_picture(crops[i], width=Inches(3))
+                    # 违规行为、违反规范和整改建议，片段同时写入复查报告的缓存
+                    word_violation_body(doc, violation, 'generator', cache)
+                cache.flush()
             
             # 整体评估
             doc.add_heading("整体安全评估", level=1)
@@ -110,11 +157,12 @@ class ReportGenerator:
             print(f"❌ Word报告生成失败: {e}")
             return False
     
-    def generate_pdf_report(self, analysis_data: Dict[str, Any], output_path: str) -> bool:
+    def generate_pdf_report(self, analysis_data: Dict[str, Any], output_path: str,
+                            profile=None, level: int = 0) -> bool:
         """生成PDF格式报告"""
         try:
             from reportlab.lib.pagesizes import A4
-            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+            from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
             from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
             from reportlab.lib.units import inch
             from reportlab.lib import colors
@@ -123,6 +171,13 @@ class ReportGenerator:
             doc = SimpleDocTemplate(output_path, pagesize=A4)
             styles = getSampleStyleSheet()
             
+            # 有中文字体时替换默认样式的字体，表格表头仍使用粗体
+            font_name = register_chinese_font()
+            table_font = font_name if font_name != DEFAULT_FONT else 'Helvetica-Bold'
+            if font_name != DEFAULT_FONT:
+                for style_name in ('Heading1', 'Heading2', 'Normal'):
+                    styles[style_name].fontName = font_name
+            
             # 自定义样式
             title_style = ParagraphStyle(
                 'CustomTitle',
@@ -156,7 +211,7 @@ class ReportGenerator:
                 ('BACKGROUND', (0, 0), (0, -1), colors.grey),
                 ('TEXTCOLOR', (0, 0), (0, -1), colors.whitesmoke),
                 ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, -1), 'Helvetica-Bold'),
+                ('FONTNAME', (0, 0), (-1, -1), table_font),
                 ('FONTSIZE', (0, 0), (-1, -1), 10),
                 ('BOTTOMPADDING', (0, 0), (-1, -1), 12),
                 ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
@@ -171,6 +226,15 @@ class ReportGenerator:
             story.append(Paragraph(f"整体安全评分：{score}/100", styles['Normal']))
             story.append(Spacer(1, 20))
             
+            # 安全趋势
+            trend_chart = self._trend_chart(analysis_data)
+            if trend_chart:
+                story.append(Paragraph("安全趋势", styles['Heading1']))
+                story.append(Spacer(1, 12))
+                from report_profiles import embed_image
+                story.append(Image(embed_image(trend_chart, 6, profile, level), width=6*inch, height=2.4*inch))
+                story.append(Spacer(1, 20))
+            
             # 违规统计
             story.append(Paragraph("违规统计", styles['Heading1']))
             story.append(Spacer(1, 12))
@@ -192,7 +256,7 @@ class ReportGenerator:
                     ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
                     ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
                     ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+                    ('FONTNAME', (0, 0), (-1, -1), table_font),
                     ('FONTSIZE', (0, 0), (-1, -1), 9),
                 ]))
                 story.append(stats_table)
@@ -202,21 +266,15 @@ class ReportGenerator:
                 story.append(Paragraph("详细违规信息", styles['Heading1']))
                 story.append(Spacer(1, 12))
                 
+                from inspection_diff import default_cache, pdf_violation_body
+                cache = default_cache()
+                crops = self._violation_crops(analysis_data, profile, level)
                 for i, violation in enumerate(violations):
                     story.append(Paragraph(f"违规 {i + 1}: {violation.get('category', '未知类别')}", styles['Heading2']))
-                    story.append(Paragraph(f"违规行为：{violation.get('description', '无描述')}", styles['Normal']))
-                    
-                    regulations = violation.get("regulations", [])
-                    if regulations:
-                        story.append(Paragraph("违反规范：", styles['Normal']))
-                        for reg in regulations:
-                            story.append(Paragraph(f"• {reg.get('code', '')} 第{reg.get('article', '')}条：{reg.get('content', '')}", styles['Normal']))
-                    
-                    suggestions = violation.get("suggestions", [])
-                    if suggestions:
-                        story.append(Paragraph("整改建议：", styles['Normal']))
-                        for suggestion in suggestions:
-                            story.append(Paragraph(f"• {suggestion}", styles['Normal']))
+                    if i < len(crops) and crops[i]:
+                        story.append(Image(crops[i], width=3*inch, height=3*inch, kind='proportional'))
+                    # 违规行为、违反规范和整改建议，同一进程内的复查报告可复用解析好的段落
+                    story.extend(pdf_violation_body(violation, styles['Normal'], 'generator', cache))
                     
                     story.append(Spacer(1, 12))
             else:
@@ -240,29 +298,151 @@ class ReportGenerator:
             print(f"❌ PDF报告生成失败: {e}")
             return False
     
-    def generate_report(self, analysis_data: Dict[str, Any], format_type: str = "word", output_dir: str = "./reports") -> str:
+    def _render(self, generate, analysis_data: Dict[str, Any], output_path: str, profile_name: Optional[str]) -> bool:
+        """按输出配置生成报告，记录实际文件大小"""
+        self.last_output_info = None
+        if not profile_name:
+            return generate(analysis_data, output_path)
+        
+        from report_profiles import get_profile, render_within_budget, describe
+        try:
+            profile = get_profile(profile_name)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return False
+        
+        info = render_within_budget(lambda level: generate(analysis_data, output_path, profile, level),
+                                    output_path, profile)
+        if info is None:
+            return False
+        self.last_output_info = info
+        print(describe(info))
+        if not info['within_budget']:
+            # 超出预算的报告不交付
+            os.remove(output_path)
+            return False
+        return True
+    
+    def _register(self, output_path: str):
+        """登记生成的报告，便于生命周期管理按索引清理"""
+        try:
+            from artifact_manager import register_artifact
+        except ImportError:
+            return
+        register_artifact(output_path)
+    
+    def generate_report(self, analysis_data: Dict[str, Any], format_type: str = "word", output_dir: str = "./reports",
+                        dedupe: bool = True, profile: Optional[str] = None) -> str:
         """生成指定格式的报告"""
         # 确保输出目录存在
         os.makedirs(output_dir, exist_ok=True)
         
-        # 生成文件名
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"建筑安全报告_{timestamp}"
+        # 合并重叠的同类违规项
+        if dedupe:
+            try:
+                from box_utils import dedupe_analysis
+                analysis_data = dedupe_analysis(analysis_data)
+            except ImportError:
+                pass
+        
+        start = time.perf_counter()
+        
+        if format_type.lower() == "word":
+            output_path = self._output_path(output_dir, "建筑安全报告", ".docx")
+            success = self._render(self.generate_word_report, analysis_data, output_path, profile)
+        elif format_type.lower() == "pdf":
+            output_path = self._output_path(output_dir, "建筑安全报告", ".pdf")
+            success = self._render(self.generate_pdf_report, analysis_data, output_path, profile)
+        else:
+            print(f"❌ 不支持的报告格式: {format_type}")
+            return ""
+        
+        observe_report(format_type.lower(), success, time.perf_counter() - start,
+                       len(analysis_data.get("violations") or []), output_path)
+        if success:
+            self._register(output_path)
+            return output_path
+        return ""
+
+    def generate_diff_report(self, previous_data: Any, current_data: Any, format_type: str = "word",
+                             output_dir: str = "./reports", dedupe: bool = True,
+                             profile: Optional[str] = None) -> str:
+        """生成复查报告，previous_data/current_data 可以是 AnalysisResult 或字典
+        
+        与完整报告一样先合并重叠的同类违规项，违规项正文使用与完整报告相同的版式和缓存片段
+        """
+        from inspection_diff import diff_analysis, render_diff_word, render_diff_pdf
+        
+        os.makedirs(output_dir, exist_ok=True)
+        diff = diff_analysis(previous_data, current_data, dedupe=dedupe)
+        title = self.report_template["title"].replace("检测报告", "复查报告")
+        
+        start = time.perf_counter()
         
         if format_type.lower() == "word":
-            output_path = os.path.join(output_dir, f"{filename}.docx")
-            if self.generate_word_report(analysis_data, output_path):
-                return output_path
+            output_path = self._output_path(output_dir, "建筑安全复查报告", ".docx")
+            render = lambda d, path, p=None, level=0: render_diff_word(d, path, p, level, title=title,
+                                                                       layout="generator")
         elif format_type.lower() == "pdf":
-            output_path = os.path.join(output_dir, f"{filename}.pdf")
-            if self.generate_pdf_report(analysis_data, output_path):
-                return output_path
+            output_path = self._output_path(output_dir, "建筑安全复查报告", ".pdf")
+            font_name = register_chinese_font()
+            render = lambda d, path, p=None, level=0: render_diff_pdf(d, path, p, level, title=title,
+                                                                      font_name=font_name, layout="generator",
+                                                                      body_style=self._body_style(font_name))
         else:
             print(f"❌ 不支持的报告格式: {format_type}")
             return ""
         
+        success = self._render(render, diff, output_path, profile)
+        observe_report(f"{format_type.lower()}_diff", success, time.perf_counter() - start,
+                       len(diff["current"].get("violations") or []), output_path)
+        if success:
+            self._register(output_path)
+            return output_path
         return ""
 
+    @staticmethod
+    def _body_style(font_name: str):
+        """完整PDF报告中违规项正文使用的样式"""
+        from reportlab.lib.styles import getSampleStyleSheet
+        
+        style = getSampleStyleSheet()['Normal']
+        if font_name != DEFAULT_FONT:
+            style.fontName = font_name
+        return style
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="report-render")
+            return self._executor
+    
+    async def render(self, analysis_data: Dict[str, Any], format_type: str = "pdf", output_dir: str = "./reports",
+                     dedupe: bool = True, profile: Optional[str] = None) -> str:
+        """异步生成报告，供异步Web服务直接调用
+        
+        报告生成是CPU密集操作，在有界线程池中执行，不阻塞事件循环；
+        超出线程数的请求在线程池中排队。返回报告路径，失败时返回空字符串
+        """
+        import asyncio
+        
+        loop = asyncio.get_running_loop()
+        call = functools.partial(self.generate_report, analysis_data, format_type, output_dir, dedupe, profile)
+        # 提交失败（如线程池已关闭）或等待被取消时同样要减回计数
+        try:
+            QUEUE_DEPTH.inc(worker="report_generator")
+            return await loop.run_in_executor(self._get_executor(), call)
+        finally:
+            QUEUE_DEPTH.dec(worker="report_generator")
+    
+    def close(self):
+        """关闭 render() 使用的线程池"""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+
 # 使用示例
 if __name__ == "__main__":
     # 测试数据
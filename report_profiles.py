@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告输出配置
+按使用场景（mobile / archive / print）控制嵌入图片的分辨率（按版面宽度和DPI计算）
+与JPEG质量、DOCX压缩级别，超出大小预算时逐级降低图片质量重新生成，
+降级到底仍超出预算则视为生成失败
+"""
+
+import io
+import os
+import shutil
+import zipfile
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class OutputProfile:
+    """报告输出配置"""
+
+    __slots__ = ('name', 'size_budget', 'image_dpi', 'docx_compresslevel',
+                 'image_max_side', 'jpeg_quality', 'min_jpeg_quality', 'max_level')
+
+    def __init__(self, name: str, size_budget: int, image_dpi: int = 150,
+                 docx_compresslevel: int = 6, image_max_side: int = 2048, jpeg_quality: int = 85,
+                 min_jpeg_quality: int = 50, max_level: int = 3):
+        self.name = name
+        # 文件大小上限（字节）
+        self.size_budget = size_budget
+        # 嵌入图片按版面宽度换算像素时使用的分辨率
+        self.image_dpi = image_dpi
+        self.docx_compresslevel = docx_compresslevel
+        self.image_max_side = image_max_side
+        self.jpeg_quality = jpeg_quality
+        self.min_jpeg_quality = min_jpeg_quality
+        # 超出预算时最多降级的次数
+        self.max_level = max_level
+
+    def image_params(self, level: int = 0, width_inches: Optional[float] = None) -> Tuple[int, int]:
+        """第 level 级降级时的 (图片最长边, JPEG质量)
+
+        指定 width_inches 时最长边不超过该版面宽度在 image_dpi 下的像素数
+        """
+        max_side = self.image_max_side
+        if width_inches:
+            max_side = min(max_side, int(width_inches * self.image_dpi))
+        max_side = max(128, int(max_side * (0.75 ** level)))
+        quality = max(self.min_jpeg_quality, self.jpeg_quality - 12 * level)
+        return max_side, quality
+
+
+PROFILES = {
+    # 现场手机下载：小体积优先
+    'mobile': OutputProfile('mobile', 2 * 1024 * 1024, image_dpi=96, docx_compresslevel=9,
+                            image_max_side=1024, jpeg_quality=60, min_jpeg_quality=35),
+    # 归档保存：质量与体积兼顾
+    'archive': OutputProfile('archive', 10 * 1024 * 1024, image_dpi=150, docx_compresslevel=6,
+                             image_max_side=2048, jpeg_quality=85, min_jpeg_quality=60),
+    # 打印：保留图片细节
+    'print': OutputProfile('print', 50 * 1024 * 1024, image_dpi=300, docx_compresslevel=6,
+                           image_max_side=4096, jpeg_quality=95, min_jpeg_quality=80, max_level=1),
+}
+
+
+def get_profile(name: Optional[str]) -> Optional[OutputProfile]:
+    """按名称获取输出配置，None表示不使用配置（保持原有输出）"""
+    if not name:
+        return None
+    profile = PROFILES.get(name.lower())
+    if profile is None:
+        raise ValueError(f"不支持的输出配置: {name}，可选: {', '.join(PROFILES)}")
+    return profile
+
+
+def downsample_image(image, profile: Optional[OutputProfile], level: int = 0,
+                     width_inches: Optional[float] = None, fmt: str = 'JPEG') -> bytes:
+    """按配置缩放并重新压缩图片，返回图片字节；image 为PIL图片或文件路径
+
+    fmt 为 'PNG' 时无损保存（用于线条图表），否则按配置的JPEG质量压缩
+    """
+    from PIL import Image
+
+    max_side, quality = profile.image_params(level, width_inches) if profile else (None, 90)
+    if isinstance(image, str):
+        from image_loader import load_reduced, load_scaled
+        # 只解码到接近目标尺寸
+        image = load_reduced(image, max_side) if max_side else load_scaled(image)[0]
+    else:
+        image = image.convert('RGB')
+    if max_side and max(image.size) > max_side:
+        image = image.copy()
+        image.thumbnail((max_side, max_side), Image.LANCZOS)
+    buf = io.BytesIO()
+    if fmt == 'PNG':
+        image.save(buf, format='PNG', optimize=True)
+    else:
+        image.save(buf, format='JPEG', quality=quality, optimize=True)
+    return buf.getvalue()
+
+
+def embed_image(path: str, width_inches: float, profile: Optional[OutputProfile], level: int = 0):
+    """报告中嵌入的图片：不使用配置时返回原路径，否则返回按版面宽度和配置缩放后的图片流
+
+    PNG（趋势图等线条图）保持PNG格式，其余图片按配置的JPEG质量重新压缩
+    """
+    if profile is None:
+        return path
+    fmt = 'PNG' if path.lower().endswith('.png') else 'JPEG'
+    return io.BytesIO(downsample_image(path, profile, level, width_inches, fmt))
+
+
+def recompress_docx(path: str, profile: OutputProfile, level: int = 0) -> int:
+    """按配置重写DOCX压缩包：调整zip压缩级别，缩放 word/media 下的图片
+
+    只替换同名媒体文件的内容，不修改文档关系，因此图片保持原扩展名
+    """
+    from PIL import Image
+
+    max_side, quality = profile.image_params(level)
+    tmp_path = path + '.tmp'
+    with zipfile.ZipFile(path, 'r') as src, \
+            zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED,
+                            compresslevel=profile.docx_compresslevel) as dst:
+        for item in src.infolist():
+            data = src.read(item.filename)
+            lower = item.filename.lower()
+            if lower.startswith('word/media/') and lower.endswith(('.jpg', '.jpeg', '.png')):
+                try:
+                    with Image.open(io.BytesIO(data)) as img:
+                        if max(img.size) > max_side or lower.endswith(('.jpg', '.jpeg')):
+                            img.load()
+                            if max(img.size) > max_side:
+                                img.thumbnail((max_side, max_side), Image.LANCZOS)
+                            buf = io.BytesIO()
+                            if lower.endswith('.png'):
+                                img.save(buf, format='PNG', optimize=True)
+                            else:
+                                img.convert('RGB').save(buf, format='JPEG', quality=quality, optimize=True)
+                            if buf.tell() < len(data):
+                                data = buf.getvalue()
+                except OSError:
+                    pass
+            # 已压缩的媒体文件不再deflate
+            compress = zipfile.ZIP_STORED if lower.startswith('word/media/') else zipfile.ZIP_DEFLATED
+            dst.writestr(item.filename, data, compress_type=compress)
+    shutil.move(tmp_path, path)
+    return os.path.getsize(path)
+
+
+def render_within_budget(render: Callable[[int], bool], output_path: str,
+                         profile: OutputProfile) -> Dict[str, Any]:
+    """按配置生成报告，超出大小预算时逐级降低图片质量重新生成
+
+    render(level) 负责在 output_path 生成报告；返回记录实际大小等信息的字典，
+    生成失败时返回 None
+    """
+    is_docx = output_path.lower().endswith('.docx')
+    previous_size = None
+    level = 0
+    size = 0
+    while True:
+        if not render(level):
+            return None
+        if is_docx:
+            size = recompress_docx(output_path, profile, level)
+        else:
+            size = os.path.getsize(output_path)
+        if size <= profile.size_budget or level >= profile.max_level:
+            break
+        if previous_size is not None and size >= previous_size:
+            # 降级已无效果（例如报告中没有图片），不再重试
+            break
+        previous_size = size
+        level += 1
+
+    if size > profile.size_budget:
+        print(f"⚠️ 已降级 {level} 次仍超出 {profile.name} 配置的大小预算")
+    return {
+        'profile': profile.name,
+        'size': size,
+        'size_budget': profile.size_budget,
+        'within_budget': size <= profile.size_budget,
+        'level': level,
+    }
+
+
+def describe(info: Dict[str, Any]) -> str:
+    """输出信息的可读描述"""
+    status = '✅' if info['within_budget'] else '⚠️ 超出预算'
+    return (f"{status} 输出配置 {info['profile']}: {info['size'] / 1024:.1f} KB "
+            f"(预算 {info['size_budget'] / 1024:.0f} KB, 降级 {info['level']} 次)")
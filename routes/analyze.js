@@ -193,10 +193,50 @@ function generateMockAnalysis(imagePath) {
     
     return {
         violations: mockViolations,
-        summary: mockSummary
+        summary: mockSummary,
+        // 模拟结果不计入趋势汇总和检索索引
+        mock: true
     };
 }
 
+// 分析结果所属站点：请求中的site字段或X-Site-Id请求头，否则使用部署配置的SITE_NAME
+function resolveSite(req, fallback) {
+    return (req.body && req.body.site) || req.get('X-Site-Id') || fallback || process.env.SITE_NAME || '未知';
+}
+
+// 本地时间 YYYY-MM-DD HH:mm:ss，趋势按本地日期分桶
+function localTimestamp(date = new Date()) {
+    return new Date(date.getTime() - date.getTimezoneOffset() * 60000).toISOString().slice(0, 19).replace('T', ' ');
+}
+
+// 分析完成后异步记录到站点趋势汇总并写入违规项检索索引，失败只输出日志，不影响接口响应
+function recordAnalysis(analysis, { site, analysisId, timestamp }) {
+    if (!analysis || analysis.mock) {
+        return;
+    }
+    // 趋势记录和检索索引只是附带的统计，任何异常都不能影响已经成功的分析响应
+    try {
+        const { execFile } = require('child_process');
+        // 一个Python进程内同时完成趋势记录和检索索引，分析数据通过标准输入传递，不落临时文件
+        const args = [path.join(__dirname, '../trend_rollup.py'), 'record', '--data', '-', '--index',
+            '--site', site, '--timestamp', timestamp];
+        if (analysisId) {
+            args.push('--analysis-id', analysisId);
+        }
+        const child = execFile('python', args, { timeout: 30000 }, (error, stdout, stderr) => {
+            if (error) {
+                console.error('趋势记录/检索索引失败:', stderr || stdout || error.message);
+            }
+        });
+        child.stdin.on('error', (error) => {
+            console.error('趋势记录/检索索引失败:', error.message);
+        });
+        child.stdin.end(JSON.stringify(analysis));
+    } catch (error) {
+        console.error('趋势记录/检索索引失败:', error.message);
+    }
+}
+
 // 解析AI返回的文本为结构化数据
 function parseAIResponse(aiText) {
     try {
@@ -389,6 +429,7 @@ router.post('/', async (req, res) => {
                 message: '请提供图片URL或图片路径'
             });
         }
+        const site = resolveSite(req);
         
         // 确定要分析的图片路径
         let targetImagePath = null;
@@ -416,7 +457,7 @@ router.post('/', async (req, res) => {
         console.log(`🔍 开始分析图片: ${targetImagePath || targetImageUrl}`);
         
         // 调用AI进行分析
-        const analysisResult = await analyzeWithAI(targetImageUrl, targetImagePath);
+        const analysisResult = { ...await analyzeWithAI(targetImageUrl, targetImagePath), site };
         
         // 记录分析结果
         const analysisRecord = {
@@ -428,6 +469,12 @@ router.post('/', async (req, res) => {
         };
         
         // TODO: 保存到数据库
+        // 同一图片重复分析只计入一次
+        recordAnalysis(analysisResult, {
+            site,
+            analysisId: path.basename(targetImagePath || targetImageUrl || ''),
+            timestamp: localTimestamp()
+        });
         
         res.json({
             success: true,
@@ -470,6 +517,7 @@ router.post('/batch', async (req, res) => {
         }
         
         console.log(`🔍 开始批量分析 ${images.length} 张图片`);
+        const site = resolveSite(req);
         
         const results = [];
         
@@ -492,7 +540,12 @@ router.post('/batch', async (req, res) => {
                     console.log(`🔄 将URL转换为本地路径: ${targetPath}`);
                 }
                 
-                const analysisResult = await analyzeWithAI(targetUrl, targetPath);
+                const analysisResult = { ...await analyzeWithAI(targetUrl, targetPath), site: image.site || site };
+                recordAnalysis(analysisResult, {
+                    site: analysisResult.site,
+                    analysisId: path.basename(targetPath || targetUrl || ''),
+                    timestamp: localTimestamp()
+                });
                 
                 results.push({
                     index: i,
@@ -565,15 +618,21 @@ router.get('/history', (req, res) => {
 // 报告生成接口
 router.post('/generate-report', async (req, res) => {
     try {
-        const { analysisData, format = 'pdf' } = req.body;
+        const { analysisData: analysis, format = 'pdf', imageUrl } = req.body;
         
-        if (!analysisData) {
+        if (!analysis) {
             return res.status(400).json({
                 success: false,
                 message: '请提供分析数据'
             });
         }
         
+        // 附带原图地址，报告中可生成违规区域特写；附带站点，报告中可生成该站点的安全趋势
+        const analysisData = { ...analysis, site: resolveSite(req, analysis.site) };
+        if (imageUrl) {
+            analysisData.imageUrl = imageUrl;
+        }
+        
         console.log(`📄 开始生成${format.toUpperCase()}格式报告...`);
         
         let reportPath;
@@ -587,16 +646,21 @@ router.post('/generate-report', async (req, res) => {
             // 生成PDF文档
             reportPath = await generatePDFReport(analysisData);
             mimeType = 'application/pdf';
+        } else if (format === 'all') {
+            // 一次生成Word和PDF并打包
+            reportPath = await generateReportBundle(analysisData);
+            mimeType = 'application/zip';
         } else {
             return res.status(400).json({
                 success: false,
-                message: '不支持的格式，仅支持pdf和word'
+                message: '不支持的格式，仅支持pdf、word和all'
             });
         }
         
         // 设置响应头
         const timestamp = new Date().toISOString().slice(0, 19).replace(/:/g, '-');
-        const filename = `Building_Safety_Report_${timestamp}.${format === 'word' ? 'docx' : 'pdf'}`;
+        const extension = { word: 'docx', pdf: 'pdf', all: 'zip' }[format];
+        const filename = `Building_Safety_Report_${timestamp}.${extension}`;
         
         res.setHeader('Content-Type', mimeType);
         res.setHeader('Content-Disposition', `attachment; filename="${filename}"`);
@@ -629,9 +693,10 @@ async function generateWordReport(analysisData) {
     const util = require('util');
     const execAsync = util.promisify(exec);
     
+    // 临时数据文件
+    const tempDataFile = path.join(__dirname, '../temp', `report_data_${Date.now()}.json`);
+    
     try {
-        // 创建临时数据文件
-        const tempDataFile = path.join(__dirname, '../temp', `report_data_${Date.now()}.json`);
         const tempDir = path.dirname(tempDataFile);
         
         if (!fs.existsSync(tempDir)) {
@@ -660,14 +725,14 @@ async function generateWordReport(analysisData) {
         
         const wordFilePath = path.join(outputDir, wordFiles[0]);
         
-        // 清理临时数据文件
-        fs.unlinkSync(tempDataFile);
-        
         return wordFilePath;
         
     } catch (error) {
         console.error('Word报告生成失败:', error);
         throw new Error(`Word报告生成失败: ${error.message}`);
+    } finally {
+        // 清理临时数据文件（包括生成失败时）
+        fs.unlink(tempDataFile, () => {});
     }
 }
 
@@ -677,9 +742,10 @@ async function generatePDFReport(analysisData) {
     const util = require('util');
     const execAsync = util.promisify(exec);
     
+    // 临时数据文件
+    const tempDataFile = path.join(__dirname, '../temp', `report_data_${Date.now()}.json`);
+    
     try {
-        // 创建临时数据文件
-        const tempDataFile = path.join(__dirname, '../temp', `report_data_${Date.now()}.json`);
         const tempDir = path.dirname(tempDataFile);
         
         if (!fs.existsSync(tempDir)) {
@@ -708,14 +774,68 @@ async function generatePDFReport(analysisData) {
         
         const pdfFilePath = path.join(outputDir, pdfFiles[0]);
         
-        // 清理临时数据文件
-        fs.unlinkSync(tempDataFile);
-        
         return pdfFilePath;
         
     } catch (error) {
         console.error('PDF报告生成失败:', error);
         throw new Error(`PDF报告生成失败: ${error.message}`);
+    } finally {
+        // 清理临时数据文件（包括生成失败时）
+        fs.unlink(tempDataFile, () => {});
+    }
+}
+
+// 一次调用生成Word和PDF报告并打包为zip
+async function generateReportBundle(analysisData) {
+    const { exec } = require('child_process');
+    const util = require('util');
+    const execAsync = util.promisify(exec);
+    
+    // 临时数据文件
+    const tempDataFile = path.join(__dirname, '../temp', `report_data_${Date.now()}.json`);
+    // Python脚本输出，其中包含清单文件路径
+    let stdout = '';
+    
+    try {
+        const tempDir = path.dirname(tempDataFile);
+        
+        if (!fs.existsSync(tempDir)) {
+            fs.mkdirSync(tempDir, { recursive: true });
+        }
+        
+        fs.writeFileSync(tempDataFile, JSON.stringify(analysisData, null, 2));
+        
+        // 调用Python脚本在同一进程中生成所有格式
+        const pythonScript = path.join(__dirname, '../simple_report.py');
+        const outputDir = path.join(__dirname, '../temp');
+        
+        const result = await execAsync(
+            `python "${pythonScript}" --formats pdf,word --zip --data "${tempDataFile}" --output "${outputDir}"`,
+            { timeout: 30000 }
+        );
+        stdout = result.stdout;
+        
+        console.log('Python脚本输出:', stdout);
+        if (result.stderr) console.error('Python脚本错误:', result.stderr);
+        
+        const match = stdout.match(/报告压缩包: (.+)/);
+        if (!match) {
+            throw new Error('报告压缩包生成失败');
+        }
+        
+        return path.resolve(match[1].trim());
+        
+    } catch (error) {
+        stdout = stdout || error.stdout || '';
+        console.error('报告打包失败:', error);
+        throw new Error(`报告打包失败: ${error.message}`);
+    } finally {
+        // 清理临时数据文件和清单文件（包括生成失败时），压缩包发送后由路由删除
+        fs.unlink(tempDataFile, () => {});
+        const manifest = stdout.match(/清单文件: (.+)/);
+        if (manifest) {
+            fs.unlink(path.resolve(manifest[1].trim()), () => {});
+        }
     }
 }
 
@@ -1,10 +1,31 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import time
+import uuid
 import argparse
 from datetime import datetime
 
-def generate_word_report(data, output_path):
+from pdf_fonts import register_chinese_font
+from worker_metrics import observe_report
+
+def trend_chart_path(data):
+    """站点历史趋势图，没有趋势数据时返回None"""
+    try:
+        from trend_rollup import trend_chart_for_report
+    except ImportError:
+        return None
+    return trend_chart_for_report(data)
+
+def violation_crop_paths(data, profile=None, level=0):
+    """每个违规项的区域特写图，没有原图时返回空列表"""
+    try:
+        from crop_gallery import violation_crops
+    except ImportError:
+        return []
+    return violation_crops(data, profile, level)
+
+def generate_word_report(data, output_path, profile=None, level=0):
     """生成Word格式报告，不包含标注照片"""
     try:
         from docx import Document
@@ -76,43 +97,41 @@ def generate_word_report(data, output_path):
         
         doc.add_paragraph()  # 空行
         
+        # 安全趋势
+        trend_chart = trend_chart_path(data)
+        if trend_chart:
+            doc.add_heading('安全趋势', level=1)
+            from report_profiles import embed_image
+            doc.add_picture(embed_image(trend_chart, 6, profile, level), width=Inches(6))
+            doc.add_paragraph('折线为平均安全评分，红色/橙色柱为严重/一般违规数量')
+        
         # 违规详情
         violations = data.get('violations', [])
         if violations:
+            from inspection_diff import default_cache, prefetch_word_bodies, word_violation_body
+            cache = default_cache()
+            prefetch_word_bodies(violations, 'simple', cache)
             doc.add_heading('违规详情', level=1)
+            crops = violation_crop_paths(data, profile, level)
             
             for i, violation in enumerate(violations, 1):
                 # 违规标题
                 violation_title = f"{i}. {violation.get('type', '违规')} - {violation.get('category', '建筑安全违规')}"
                 doc.add_heading(violation_title, level=2)
                 
-                # 违规描述
-                doc.add_paragraph(f"违规描述: {violation.get('description', '无描述')}")
-                
-                # 相关条例
-                regulations = violation.get('regulations', [])
-                if regulations:
-                    doc.add_paragraph("相关条例:")
-                    for reg in regulations:
-                        reg_text = f"• {reg.get('code', '')} {reg.get('article', '')}: {reg.get('content', '')}"
-                        doc.add_paragraph(reg_text, style='List Bullet')
+                # 违规区域特写
+                if i <= len(crops) and crops[i - 1]:
+                    doc.add_picture(crops[i - 1], width=Inches(3))
                 
-                # 整改建议
-                suggestions = violation.get('suggestions', [])
-                if suggestions:
-                    doc.add_paragraph("整改建议:")
-                    for suggestion in suggestions:
-                        doc.add_paragraph(f"• {suggestion}", style='List Bullet')
-                
-                # 风险等级
-                risk_level = violation.get('risk_level', '')
-                if risk_level:
-                    doc.add_paragraph(f"风险等级: {risk_level}")
+                # 描述、条例、整改建议和风险等级，片段同时写入复查报告的缓存
+                word_violation_body(doc, violation, 'simple', cache)
                 
                 doc.add_paragraph()  # 空行
         
         # 保存文档
         doc.save(output_path)
+        if violations:
+            cache.flush()
         print(f"Word报告已生成: {output_path}")
         return True
         
@@ -123,11 +142,11 @@ def generate_word_report(data, output_path):
         print(f"Word报告生成失败: {e}")
         return False
 
-def generate_pdf_report(data, output_path):
+def generate_pdf_report(data, output_path, profile=None, level=0):
     """生成PDF格式报告，不包含标注照片"""
     try:
         from reportlab.lib.pagesizes import A4
-        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle
+        from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Table, TableStyle, Image
         from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
         from reportlab.lib.units import inch
         from reportlab.lib import colors
@@ -137,34 +156,7 @@ def generate_pdf_report(data, output_path):
         story = []
         
         # 尝试使用中文字体，如果失败则回退到默认字体
-        try:
-            from reportlab.pdfbase import pdfmetrics
-            from reportlab.pdfbase.ttfonts import TTFont
-            
-            # 尝试多个中文字体路径
-            font_paths = [
-                "C:/Windows/Fonts/simsun.ttc",  # Windows宋体
-                "C:/Windows/Fonts/msyh.ttc",    # 微软雅黑
-                "C:/Windows/Fonts/simhei.ttf",  # 黑体
-                "C:/Windows/Fonts/simsun.ttf"   # 宋体TTF
-            ]
-            
-            chinese_font = 'Helvetica'  # 默认字体
-            
-            for font_path in font_paths:
-                if os.path.exists(font_path):
-                    try:
-                        pdfmetrics.registerFont(TTFont('ChineseFont', font_path))
-                        chinese_font = 'ChineseFont'
-                        print(f"成功注册字体: {font_path}")
-                        break
-                    except Exception as e:
-                        print(f"字体注册失败 {font_path}: {e}")
-                        continue
-                        
-        except Exception as e:
-            print(f"字体处理失败: {e}")
-            chinese_font = 'Helvetica'
+        chinese_font = register_chinese_font()
         
         # 自定义样式
         title_style = ParagraphStyle(
@@ -247,39 +239,34 @@ def generate_pdf_report(data, output_path):
         
         story.append(Spacer(1, 20))
         
+        # 安全趋势
+        trend_chart = trend_chart_path(data)
+        if trend_chart:
+            story.append(Paragraph('安全趋势', heading_style))
+            from report_profiles import embed_image
+            story.append(Image(embed_image(trend_chart, 6, profile, level), width=6*inch, height=2.4*inch))
+            story.append(Paragraph('折线为平均安全评分，红色/橙色柱为严重/一般违规数量', normal_style))
+            story.append(Spacer(1, 20))
+        
         # 违规详情
         violations = data.get('violations', [])
         if violations:
+            from inspection_diff import default_cache, pdf_violation_body
+            cache = default_cache()
             story.append(Paragraph('违规详情', heading_style))
+            crops = violation_crop_paths(data, profile, level)
             
             for i, violation in enumerate(violations, 1):
                 # 违规标题
                 violation_title = f"{i}. {violation.get('type', '违规')} - {violation.get('category', '建筑安全违规')}"
                 story.append(Paragraph(violation_title, heading_style))
                 
-                # 违规描述
-                description = violation.get('description', '无描述')
-                story.append(Paragraph(f"违规描述: {description}", normal_style))
-                
-                # 相关条例
-                regulations = violation.get('regulations', [])
-                if regulations:
-                    story.append(Paragraph("相关条例:", normal_style))
-                    for reg in regulations:
-                        reg_text = f"• {reg.get('code', '')} {reg.get('article', '')}: {reg.get('content', '')}"
-                        story.append(Paragraph(reg_text, normal_style))
-                
-                # 整改建议
-                suggestions = violation.get('suggestions', [])
-                if suggestions:
-                    story.append(Paragraph("整改建议:", normal_style))
-                    for suggestion in suggestions:
-                        story.append(Paragraph(f"• {suggestion}", normal_style))
+                # 违规区域特写
+                if i <= len(crops) and crops[i - 1]:
+                    story.append(Image(crops[i - 1], width=3*inch, height=3*inch, kind='proportional'))
                 
-                # 风险等级
-                risk_level = violation.get('risk_level', '')
-                if risk_level:
-                    story.append(Paragraph(f"风险等级: {risk_level}", normal_style))
+                # 描述、条例、整改建议和风险等级，同一进程内的复查报告可复用解析好的段落
+                story.extend(pdf_violation_body(violation, normal_style, 'simple', cache))
                 
                 story.append(Spacer(1, 15))
         
@@ -295,31 +282,267 @@ def generate_pdf_report(data, output_path):
         print(f"PDF报告生成失败: {e}")
         return False
 
-def generate_report(data, format_type='pdf', output_dir='./temp'):
+def generate_excel_report(data, output_path, profile=None, level=0):
+    """生成Excel格式报告：概览和违规明细两个工作表"""
+    try:
+        from openpyxl import Workbook
+        
+        wb = Workbook(write_only=True)
+        summary = data.get('summary', {})
+        
+        overview = wb.create_sheet('分析概览')
+        overview.column_dimensions['A'].width = 16
+        overview.column_dimensions['B'].width = 60
+        overview.append(['项目', '数值'])
+        overview.append(['生成时间', datetime.now().strftime("%Y-%m-%d %H:%M:%S")])
+        overview.append(['安全评分', summary.get('total_score', 0)])
+        overview.append(['严重违规', summary.get('severe_count', 0)])
+        overview.append(['一般违规', summary.get('normal_count', 0)])
+        overview.append(['总违规数', summary.get('severe_count', 0) + summary.get('normal_count', 0)])
+        overview.append(['整体评估', summary.get('overall_assessment', '')])
+        for action in summary.get('priority_actions', []):
+            overview.append(['优先整改事项', action])
+        
+        details = wb.create_sheet('违规详情')
+        for column, width in zip('ABCDEFGH', (6, 10, 16, 60, 16, 50, 50, 20)):
+            details.column_dimensions[column].width = width
+        details.append(['序号', '违规类型', '违规类别', '违规描述', '风险等级', '相关条例', '整改建议', '坐标'])
+        for i, violation in enumerate(data.get('violations', []), 1):
+            regulations = '\n'.join(f"{reg.get('code', '')} {reg.get('article', '')}: {reg.get('content', '')}"
+                                    for reg in violation.get('regulations', []))
+            coordinates = violation.get('coordinates')
+            details.append([
+                i,
+                violation.get('type', ''),
+                violation.get('category', ''),
+                violation.get('description', ''),
+                violation.get('risk_level', ''),
+                regulations,
+                '\n'.join(violation.get('suggestions', [])),
+                ','.join(str(c) for c in coordinates) if coordinates else '',
+            ])
+        
+        wb.save(output_path)
+        print(f"Excel报告已生成: {output_path}")
+        return True
+        
+    except ImportError:
+        print("缺少openpyxl库，请运行: pip install openpyxl")
+        return False
+    except Exception as e:
+        print(f"Excel报告生成失败: {e}")
+        return False
+
+def generate_json_report(data, output_path, profile=None, level=0):
+    """导出分析数据JSON"""
+    try:
+        with open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        print(f"JSON数据已导出: {output_path}")
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        print(f"JSON数据导出失败: {e}")
+        return False
+
+# 格式 -> (生成函数, 扩展名)
+GENERATORS = {
+    'pdf': (generate_pdf_report, '.pdf'),
+    'word': (generate_word_report, '.docx'),
+    'excel': (generate_excel_report, '.xlsx'),
+    'json': (generate_json_report, '.json'),
+}
+
+def dedupe_report_data(data):
+    """合并重叠的同类违规项，缺少numpy时原样返回"""
+    try:
+        from box_utils import dedupe_analysis
+    except ImportError:
+        return data
+    return dedupe_analysis(data)
+
+def render_with_profile(generate, data, output_path, profile_name=None):
+    """按输出配置生成报告，并输出实际文件大小"""
+    if not profile_name:
+        return generate(data, output_path)
+    
+    from report_profiles import get_profile, render_within_budget, describe
+    try:
+        profile = get_profile(profile_name)
+    except ValueError as e:
+        print(e)
+        return False
+    
+    info = render_within_budget(lambda level: generate(data, output_path, profile, level), output_path, profile)
+    if info is None:
+        return False
+    print(describe(info))
+    if not info['within_budget']:
+        # 超出预算的报告不交付
+        os.remove(output_path)
+        return False
+    return True
+
+def register_output(output_path):
+    """登记生成的报告，便于生命周期管理按索引清理"""
+    try:
+        from artifact_manager import register_artifact
+    except ImportError:
+        return
+    register_artifact(output_path)
+
+def output_stem(prefix):
+    """带随机后缀的输出文件名（不含扩展名），同一秒内的并发调用不会互相覆盖"""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+def generate_report(data, format_type='pdf', output_dir='./temp', dedupe=True, profile=None):
     """生成指定格式的报告"""
     # 确保输出目录存在
     os.makedirs(output_dir, exist_ok=True)
     
+    if dedupe:
+        data = dedupe_report_data(data)
+    
     # 生成文件名
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    stem = output_stem("Building_Safety_Report")
+    start = time.perf_counter()
     
     if format_type == 'word':
-        filename = f"Building_Safety_Report_{timestamp}.docx"
+        filename = f"{stem}.docx"
         output_path = os.path.join(output_dir, filename)
-        return generate_word_report(data, output_path)
+        success = render_with_profile(generate_word_report, data, output_path, profile)
     elif format_type == 'pdf':
-        filename = f"Building_Safety_Report_{timestamp}.pdf"
+        filename = f"{stem}.pdf"
         output_path = os.path.join(output_dir, filename)
-        return generate_pdf_report(data, output_path)
+        success = render_with_profile(generate_pdf_report, data, output_path, profile)
     else:
         print(f"不支持的格式: {format_type}")
         return False
+    
+    observe_report(format_type, success, time.perf_counter() - start,
+                   len(data.get('violations') or []), output_path)
+    if success:
+        register_output(output_path)
+    return success
+
+def generate_diff_report(previous, current, format_type='pdf', output_dir='./temp', dedupe=True, profile=None):
+    """生成复查报告：对比上次与本次分析结果，只列出已整改/新发现/仍存在的违规项"""
+    from inspection_diff import diff_analysis, render_diff_word, render_diff_pdf
+    
+    os.makedirs(output_dir, exist_ok=True)
+    
+    diff = diff_analysis(previous, current, dedupe=dedupe)
+    
+    stem = output_stem("Building_Safety_Recheck")
+    start = time.perf_counter()
+    
+    if format_type == 'word':
+        output_path = os.path.join(output_dir, f"{stem}.docx")
+        success = render_with_profile(render_diff_word, diff, output_path, profile)
+    elif format_type == 'pdf':
+        output_path = os.path.join(output_dir, f"{stem}.pdf")
+        font_name = register_chinese_font()
+        success = render_with_profile(
+            lambda d, path, p=None, level=0: render_diff_pdf(d, path, p, level, font_name=font_name),
+            diff, output_path, profile)
+    else:
+        print(f"不支持的格式: {format_type}")
+        return False
+    
+    observe_report(f"{format_type}_diff", success, time.perf_counter() - start,
+                   len(diff['current'].get('violations') or []), output_path)
+    if success:
+        register_output(output_path)
+    return success
+
+def generate_bundle(data, formats=None, output_dir='./temp', dedupe=True, profile=None, archive=False):
+    """一次生成多种格式的报告
+    
+    数据只读取和合并一次，各格式在线程池中并发生成；
+    返回输出清单（archive为True时同时打包为zip，清单中记录zip路径）。
+    任一格式生成失败时删除已生成的文件并返回None，不输出缺少格式的报告
+    """
+    import zipfile
+    from concurrent.futures import ThreadPoolExecutor
+    
+    formats = list(formats or GENERATORS)
+    unknown = [fmt for fmt in formats if fmt not in GENERATORS]
+    if unknown:
+        print(f"不支持的格式: {', '.join(unknown)}")
+        return None
+    
+    os.makedirs(output_dir, exist_ok=True)
+    if dedupe:
+        data = dedupe_report_data(data)
+    violation_count = len(data.get('violations') or [])
+    stem = output_stem("Building_Safety_Report")
+    
+    def render(fmt):
+        generate, ext = GENERATORS[fmt]
+        output_path = os.path.join(output_dir, stem + ext)
+        start = time.perf_counter()
+        success = render_with_profile(generate, data, output_path, profile)
+        seconds = time.perf_counter() - start
+        observe_report(fmt, success, seconds, violation_count, output_path)
+        return {
+            'format': fmt,
+            'path': output_path,
+            'success': bool(success),
+            'size': os.path.getsize(output_path) if success else 0,
+            'seconds': round(seconds, 3),
+        }
+    
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(formats)) as executor:
+        outputs = list(executor.map(render, formats))
+    
+    produced = [o for o in outputs if o['success']]
+    failed = [o['format'] for o in outputs if not o['success']]
+    if failed:
+        print(f"报告生成失败的格式: {', '.join(failed)}")
+        for output in produced:
+            try:
+                os.remove(output['path'])
+            except OSError:
+                pass
+        return None
+    
+    manifest = {
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'outputs': outputs,
+        'seconds': round(time.perf_counter() - start, 3),
+    }
+    if archive:
+        archive_path = os.path.join(output_dir, stem + '.zip')
+        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+            for output in produced:
+                # PDF/DOCX/XLSX本身已压缩，直接存储
+                compress = zipfile.ZIP_DEFLATED if output['format'] == 'json' else zipfile.ZIP_STORED
+                zf.write(output['path'], os.path.basename(output['path']), compress_type=compress)
+        for output in produced:
+            os.remove(output['path'])
+            output['path'] = os.path.basename(output['path'])
+        manifest['archive'] = archive_path
+        register_output(archive_path)
+    else:
+        for output in produced:
+            register_output(output['path'])
+    
+    manifest_path = os.path.join(output_dir, stem + '.manifest.json')
+    with open(manifest_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    manifest['manifest'] = manifest_path
+    return manifest
 
 def main():
     parser = argparse.ArgumentParser(description='生成建筑安全分析报告')
     parser.add_argument('--format', choices=['pdf', 'word'], default='pdf', help='报告格式 (默认: pdf)')
     parser.add_argument('--data', help='分析数据JSON文件路径')
     parser.add_argument('--output', default='./temp', help='输出目录 (默认: ./temp)')
+    parser.add_argument('--no-dedupe', action='store_true', help='不合并重叠的同类违规项')
+    parser.add_argument('--profile', choices=['mobile', 'archive', 'print'], help='输出配置，控制文件大小与图片质量')
+    parser.add_argument('--previous', help='上次检测的分析数据JSON文件路径，指定后生成复查报告')
+    parser.add_argument('--formats', help='一次生成多种格式，逗号分隔 (pdf,word,excel,json) 或 all')
+    parser.add_argument('--zip', action='store_true', help='配合--formats使用，将所有输出打包为zip')
     
     args = parser.parse_args()
     
@@ -358,7 +581,32 @@ def main():
         }
     
     # 生成报告
-    success = generate_report(data, args.format, args.output)
+    if args.formats:
+        formats = None if args.formats == 'all' else [f.strip() for f in args.formats.split(',') if f.strip()]
+        manifest = generate_bundle(data, formats, args.output, dedupe=not args.no_dedupe,
+                                   profile=args.profile, archive=args.zip)
+        if manifest is None:
+            print("报告生成失败！")
+            return
+        for output in manifest['outputs']:
+            status = '成功' if output['success'] else '失败'
+            print(f"{output['format'].upper()}: {status} ({output['seconds']}s)")
+        if manifest.get('archive'):
+            print(f"报告压缩包: {manifest['archive']}")
+        print(f"清单文件: {manifest['manifest']}")
+        return
+    
+    if args.previous:
+        try:
+            with open(args.previous, 'r', encoding='utf-8') as f:
+                previous = json.load(f)
+        except Exception as e:
+            print(f"读取上次检测数据失败: {e}")
+            return
+        success = generate_diff_report(previous, data, args.format, args.output,
+                                       dedupe=not args.no_dedupe, profile=args.profile)
+    else:
+        success = generate_report(data, args.format, args.output, dedupe=not args.no_dedupe, profile=args.profile)
     
     if success:
         print(f"{args.format.upper()}格式报告生成成功！")
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+AI分析结果解析测试
+检查截断修复、摘要缺失时的违规统计与安全评分：
+修复后的结果不能沿用默认的满分
+"""
+
+import sys
+import json
+
+from analysis_parser import parse_analysis, StreamingParser
+from mock_ark_server import build_content, CANNED_VIOLATIONS
+
+
+def expected_score(violations) -> int:
+    severe = sum(1 for v in violations if v.type == '严重违规')
+    normal = sum(1 for v in violations if v.type == '一般违规')
+    return max(0, 100 - severe * 20 - normal * 10)
+
+
+def check(name: str, result, ok_condition: bool) -> bool:
+    status = '✅' if ok_condition else '❌'
+    detail = result.summary.to_dict() if result is not None else None
+    print(f"{status} {name}: {detail}")
+    return ok_condition
+
+
+def main():
+    ok = True
+    count = len(CANNED_VIOLATIONS)
+
+    # 完整输出：保留模型给出的评分
+    text = json.dumps({'violations': CANNED_VIOLATIONS, 'summary': {'total_score': 55}}, ensure_ascii=False)
+    result = parse_analysis(text)
+    ok &= check('完整输出保留评分', result, result is not None and not result.repaired
+                and result.summary.total_score == 55)
+
+    # 截断输出：摘要丢失，按违规项重新评分
+    truncated = build_content(count, truncated=True)
+    result = parse_analysis(truncated)
+    ok &= check('截断输出重新评分', result, result is not None and result.repaired
+                and len(result.violations) == count
+                and result.summary.severe_count == 2
+                and result.summary.total_score == expected_score(result.violations) < 100)
+
+    # 流式解析同一截断输出
+    parser = StreamingParser()
+    for i in range(0, len(truncated), 37):
+        parser.feed(truncated[i:i + 37])
+    result = parser.close()
+    ok &= check('流式截断输出重新评分', result, result is not None and result.repaired
+                and result.summary.total_score == expected_score(result.violations) < 100)
+
+    # 没有摘要的完整输出
+    text = json.dumps({'violations': CANNED_VIOLATIONS[:2]}, ensure_ascii=False)
+    result = parse_analysis(text)
+    ok &= check('摘要缺失重新评分', result, result is not None
+                and result.summary.total_score == expected_score(result.violations) == 60)
+
+    # 摘要中的评分在截断处之前，但违规列表已被修复，不沿用模型评分
+    text = json.dumps({'summary': {'total_score': 100}, 'violations': CANNED_VIOLATIONS}, ensure_ascii=False)
+    result = parse_analysis(text[:int(len(text) * 0.8)])
+    ok &= check('截断时不沿用模型评分', result, result is not None and result.repaired
+                and result.summary.total_score == expected_score(result.violations))
+
+    print("✅ 解析测试通过" if ok else "❌ 解析测试失败")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
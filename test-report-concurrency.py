@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告生成并发压力测试
+通过 ReportGenerator.render() 同时发起大量异步报告生成，
+检查每个请求都得到独立、完整的报告文件（没有同名覆盖和损坏文件）
+"""
+
+import io
+import os
+import sys
+import time
+import asyncio
+import zipfile
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+
+from report_generator import ReportGenerator
+
+TEST_DATA = {
+    "timestamp": "2025-08-14 22:30:00",
+    "location": "并发测试工地",
+    "inspector": "AI系统",
+    "violations": [
+        {
+            "type": "严重违规",
+            "category": "基坑支护安全",
+            "description": "沟槽深度超过1.5m，两侧边缘未设置标准防护栏杆",
+            "coordinates": [100, 100, 300, 220],
+            "severity": "high",
+            "risk_level": "极高风险",
+            "regulations": [{"code": "JGJ59-2011", "article": "4.1.3", "content": "基坑深度超过1.5m时，必须设置安全防护栏杆"}],
+            "suggestions": ["立即设置安全防护栏杆", "加强现场安全巡查"]
+        },
+        {
+            "type": "一般违规",
+            "category": "现场管理",
+            "description": "材料未分类堆放",
+            "coordinates": [80, 280, 200, 350],
+            "severity": "medium",
+            "risk_level": "中等风险",
+            "regulations": [{"code": "JGJ59-2011", "article": "4.1.2", "content": "施工现场材料应分类堆放整齐"}],
+            "suggestions": ["按类型分类堆放材料"]
+        }
+    ],
+    "summary": {
+        "severe_count": 1,
+        "normal_count": 1,
+        "total_score": 70,
+        "overall_assessment": "存在安全隐患，需要整改",
+        "priority_actions": ["立即设置基坑安全防护栏杆"]
+    }
+}
+
+
+def check_file(path: str) -> bool:
+    """检查报告文件是否完整"""
+    if not path or not os.path.exists(path):
+        return False
+    if path.endswith('.pdf'):
+        with open(path, 'rb') as f:
+            data = f.read()
+        return data.startswith(b'%PDF') and b'%%EOF' in data[-1024:]
+    try:
+        with zipfile.ZipFile(path) as zf:
+            return zf.testzip() is None and 'word/document.xml' in zf.namelist()
+    except zipfile.BadZipFile:
+        return False
+
+
+async def stress(count: int, workers: int, output_dir: str):
+    generator = ReportGenerator(max_workers=workers)
+    latencies = []
+
+    async def one(i: int):
+        start = time.perf_counter()
+        fmt = 'pdf' if i % 2 == 0 else 'word'
+        path = await generator.render(TEST_DATA, fmt, output_dir)
+        latencies.append(time.perf_counter() - start)
+        return path
+
+    started = time.perf_counter()
+    try:
+        paths = await asyncio.gather(*(one(i) for i in range(count)))
+    finally:
+        generator.close()
+    return paths, time.perf_counter() - started, latencies
+
+
+def main():
+    parser = argparse.ArgumentParser(description='报告生成并发压力测试')
+    parser.add_argument('--count', type=int, default=1000, help='并发请求数 (默认: 1000)')
+    parser.add_argument('--workers', type=int, default=8, help='渲染线程数 (默认: 8)')
+    args = parser.parse_args()
+
+    print(f"🔍 同时发起 {args.count} 个报告生成请求（PDF/Word各半，{args.workers} 个渲染线程）...")
+    with tempfile.TemporaryDirectory() as output_dir:
+        # 报告生成函数会打印状态行，测试期间屏蔽
+        with redirect_stdout(io.StringIO()):
+            paths, elapsed, latencies = asyncio.run(stress(args.count, args.workers, output_dir))
+
+        failed = sum(1 for p in paths if not p)
+        unique = len(set(p for p in paths if p))
+        on_disk = len(os.listdir(output_dir))
+        broken = sum(1 for p in set(paths) if p and not check_file(p))
+
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0
+    print(f"📊 总耗时 {elapsed:.2f}s，吞吐量 {args.count / elapsed:.1f} 份/秒，p95延迟 {p95:.2f}s")
+    print(f"   失败: {failed}  唯一路径: {unique}  实际文件: {on_disk}  损坏文件: {broken}")
+
+    ok = failed == 0 and unique == args.count and on_disk == args.count and broken == 0
+    print("✅ 并发测试通过" if ok else "❌ 并发测试失败")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告进程启动时间与内存回归测试
+每份报告都在新启动的Python进程中生成，启动耗时和基础内存是主要成本。
+在独立子进程中测量 simple_report.py 与 report_generator.py 的：
+导入耗时、首次生成耗时、稳定生成耗时、峰值内存，以及导入时加载的重量级模块，
+与保存的基线比较，超出容差时返回失败。
+耗时取多次测量的最小值（噪声只会让耗时变长），内存取中位数
+
+    python test-report-perf.py                     # 与基线比较
+    python test-report-perf.py --update-baseline   # 在当前机器上重新记录基线
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import tempfile
+import statistics
+import subprocess
+from contextlib import redirect_stdout
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BASELINE_PATH = os.path.join(ROOT, 'report-perf-baseline.json')
+
+MODULES = ('simple_report', 'report_generator')
+FORMATS = ('pdf', 'word')
+
+# 不应在导入报告模块时加载的重量级模块（应在生成报告时按需导入）
+HEAVY_MODULES = ('reportlab', 'docx', 'openpyxl', 'numpy', 'PIL', 'pandas', 'cv2', 'requests',
+                 'lxml', 'sqlite3', 'asyncio', 'http.server', 'email')
+
+# 耗时允许超出基线的比例和绝对值（秒），内存允许超出的比例和绝对值（MB）
+TIME_TOLERANCE = 0.3
+TIME_SLACK = 0.005
+RSS_TOLERANCE = 0.15
+RSS_SLACK = 5.0
+
+
+def fixture(violation_count: int) -> dict:
+    """构造包含指定数量违规项的分析数据"""
+    from mock_ark_server import CANNED_VIOLATIONS
+
+    violations = []
+    for i in range(violation_count):
+        v = dict(CANNED_VIOLATIONS[i % len(CANNED_VIOLATIONS)])
+        # 错开坐标，避免被合并
+        v['coordinates'] = [i * 50, 0, i * 50 + 40, 40]
+        v['description'] = f"{v['description']}（第{i + 1}处）"
+        violations.append(v)
+    severe = sum(1 for v in violations if v['type'] == '严重违规')
+    return {
+        'violations': violations,
+        'summary': {
+            'severe_count': severe,
+            'normal_count': violation_count - severe,
+            'total_score': max(0, 100 - severe * 20 - (violation_count - severe) * 10),
+            'overall_assessment': '现场存在多项安全风险，需要立即整改',
+            'priority_actions': [v['suggestions'][0] for v in violations[:3]],
+        },
+    }
+
+
+FIXTURES = {'small': 1, 'medium': 20, 'large': 100}
+
+
+def _peak_rss_mb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux为KB，macOS为字节
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def _renderer(module_name: str, output_dir: str):
+    if module_name == 'simple_report':
+        import simple_report
+        return lambda data, fmt: simple_report.generate_report(data, fmt, output_dir)
+    from report_generator import ReportGenerator
+    generator = ReportGenerator()
+    return lambda data, fmt: generator.generate_report(data, fmt, output_dir)
+
+
+def worker(module_name: str, import_only: bool, repeat: int) -> dict:
+    """子进程中执行的测量"""
+    before = set(sys.modules)
+    start = time.perf_counter()
+    __import__(module_name)
+    result = {'import_seconds': time.perf_counter() - start}
+    loaded = set(sys.modules) - before
+    result['heavy_imports'] = sorted(m for m in HEAVY_MODULES if m in loaded)
+    if import_only:
+        return result
+
+    with tempfile.TemporaryDirectory() as output_dir, redirect_stdout(io.StringIO()):
+        render = _renderer(module_name, output_dir)
+        medium = fixture(FIXTURES['medium'])
+        for fmt in FORMATS:
+            start = time.perf_counter()
+            if not render(medium, fmt):
+                raise RuntimeError(f"{module_name} {fmt} 报告生成失败")
+            result[f'first_render_seconds.{fmt}'] = time.perf_counter() - start
+        for name, count in FIXTURES.items():
+            data = fixture(count)
+            for fmt in FORMATS:
+                timings = []
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    render(data, fmt)
+                    timings.append(time.perf_counter() - start)
+                result[f'render_seconds.{name}.{fmt}'] = min(timings)
+    result['peak_rss_mb'] = _peak_rss_mb()
+    return result
+
+
+def _run_worker(module_name: str, import_only: bool, repeat: int) -> dict:
+    args = [sys.executable, os.path.abspath(__file__), '--worker', module_name, '--repeat', str(repeat)]
+    if import_only:
+        args.append('--import-only')
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+    for key in ('WORKER_METRICS_FILE', 'WORKER_METRICS_PORT'):
+        env.pop(key, None)
+    # 在临时目录中运行，避免读写仓库中的趋势库和文件索引
+    with tempfile.TemporaryDirectory() as cwd:
+        proc = subprocess.run(args, cwd=cwd, env=env, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                              universal_newlines=True, timeout=600)
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module_name} 测量失败:\n{proc.stderr}")
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def measure(import_runs: int = 9, render_runs: int = 3, repeat: int = 5) -> dict:
+    """耗时指标取多个新进程测量结果的最小值，内存取中位数"""
+    metrics = {}
+    heavy = {}
+    for module_name in MODULES:
+        print(f"⏱️ 测量 {module_name} ...")
+        imports = [_run_worker(module_name, True, repeat) for _ in range(import_runs)]
+        metrics[f'{module_name}.import_seconds'] = min(r['import_seconds'] for r in imports)
+        heavy[module_name] = sorted(set().union(*(r['heavy_imports'] for r in imports)))
+
+        renders = [_run_worker(module_name, False, repeat) for _ in range(render_runs)]
+        for key in renders[0]:
+            if key in ('import_seconds', 'heavy_imports') or renders[0][key] is None:
+                continue
+            values = [r[key] for r in renders]
+            metrics[f'{module_name}.{key}'] = statistics.median(values) if key == 'peak_rss_mb' else min(values)
+    return {'metrics': metrics, 'heavy_imports': heavy}
+
+
+def compare(current: dict, baseline: dict) -> list:
+    """返回超出容差的指标说明"""
+    failures = []
+    for key, base in sorted(baseline['metrics'].items()):
+        value = current['metrics'].get(key)
+        if value is None:
+            continue
+        if key.endswith('peak_rss_mb'):
+            limit = base * (1 + RSS_TOLERANCE) + RSS_SLACK
+            unit = 'MB'
+        else:
+            limit = base * (1 + TIME_TOLERANCE) + TIME_SLACK
+            unit = 's'
+        status = '❌' if value > limit else '✅'
+        print(f"{status} {key}: {value:.3f}{unit} (基线 {base:.3f}{unit}，上限 {limit:.3f}{unit})")
+        if value > limit:
+            failures.append(f"{key} {value:.3f}{unit} > {limit:.3f}{unit}")
+    for module_name, modules in current['heavy_imports'].items():
+        allowed = set(baseline.get('heavy_imports', {}).get(module_name, []))
+        added = [m for m in modules if m not in allowed]
+        if added:
+            print(f"❌ {module_name} 导入时新加载了重量级模块: {', '.join(added)}")
+            failures.append(f"{module_name} 导入了 {', '.join(added)}")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description='报告进程启动时间与内存回归测试')
+    parser.add_argument('--baseline', default=BASELINE_PATH, help='基线文件路径')
+    parser.add_argument('--update-baseline', action='store_true', help='在当前机器上重新记录基线')
+    parser.add_argument('--import-runs', type=int, default=9, help='测量导入耗时的进程数 (默认: 9)')
+    parser.add_argument('--render-runs', type=int, default=3, help='测量生成耗时的进程数 (默认: 3)')
+    parser.add_argument('--repeat', type=int, default=5, help='每个进程内稳定生成的重复次数 (默认: 5)')
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    parser.add_argument('--import-only', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.import_only, args.repeat)))
+        return 0
+
+    current = measure(args.import_runs, args.render_runs, args.repeat)
+    current['machine'] = {'platform': platform.platform(), 'python': platform.python_version(),
+                          'cpus': os.cpu_count()}
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(current, f, ensure_ascii=False, indent=2, sort_keys=True)
+        print(f"📝 基线已写入: {args.baseline}")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    if baseline.get('machine', {}).get('platform') != current['machine']['platform']:
+        print(f"⚠️ 基线记录于 {baseline.get('machine', {}).get('platform')}，当前为 "
+              f"{current['machine']['platform']}，耗时对比仅供参考")
+    failures = compare(current, baseline)
+    if failures:
+        print(f"\n❌ {len(failures)} 项指标回归:")
+        for failure in failures:
+            print(f"   {failure}")
+        return 1
+    print("\n✅ 所有指标均在基线容差内")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
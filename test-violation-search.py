@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+违规项全文检索测试
+生成指定数量的模拟违规项写入临时索引，检查检索结果与逐条扫描原文的结果一致，
+并测量查询耗时（默认要求每次查询不超过100ms），包括筛选条件很少命中或没有命中、
+多个词没有交集等需要读完倒排表才能确定结果的查询
+
+    python test-violation-search.py --count 1000000
+"""
+
+import io
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+from contextlib import redirect_stdout
+
+from violation_search import SearchIndex, normalize, searchable_text, search_report
+
+SITES = ['城东项目部', '滨江花园二期', '地铁5号线3标', '科技园B区', '老旧小区改造']
+SUBJECTS = ['作业人员', '钢筋工', '电焊工', '塔吊司机', '架子工', '临边区域', '配电箱', '脚手架', '基坑', '材料堆场']
+PROBLEMS = ['未佩戴安全帽', '未系安全带', '防护栏杆缺失', '未设置警示标志', '电缆拖地', '扣件松动',
+            '堆放超高', '未设置防护栏杆', '动火作业无监护', '安全网破损', '消防器材过期', '积水未排除']
+SUGGESTIONS = ['立即整改并复查', '加强现场安全巡查', '开展安全教育培训', '设置标准防护栏杆',
+               '配发并检查安全帽', '更换破损安全网', '规范材料堆放', '落实动火审批制度']
+REGULATIONS = [
+    {'code': 'JGJ59-2011', 'article': '4.1.3', 'content': '基坑深度超过1.5m时，必须设置安全防护栏杆'},
+    {'code': 'GB50720-2011', 'article': '6.3.1', 'content': '动火作业应办理动火许可证，并设专人监护'},
+    {'code': 'JGJ46-2005', 'article': '8.1.2', 'content': '配电箱应装设端正、牢固，电缆不得拖地'},
+    {'code': 'JGJ80-2016', 'article': '4.1.1', 'content': '临边作业的防护栏杆应由横杆、立杆及挡脚板组成'},
+]
+CATEGORIES = ['个人防护', '临边防护', '施工用电', '脚手架', '基坑支护安全', '现场管理', '消防安全']
+
+QUERIES = ['安全帽', '防护栏杆', '电焊工 安全带', '动火', '帽', '配电箱 拖地', '1.5m', '塔吊司机未系安全带',
+           '不存在的内容', '钢筋工 塔吊司机']
+
+# (检索词, 筛选条件)：常见筛选、选择性很强的筛选和没有命中的筛选
+FILTERED_QUERIES = [
+    ('安全帽', {'site': SITES[1]}),
+    ('防护栏杆', {'violation_type': '严重违规'}),
+    ('安全帽', {'site': SITES[2], 'since': '2025-03-01', 'until': '2025-03-05'}),
+    # 只给日期的上限包含当天全天
+    ('安全帽', {'since': '2025-03-07', 'until': '2025-03-07'}),
+    ('帽', {'site': SITES[0], 'category': '消防安全', 'since': '2025-06-01', 'until': '2025-06-10'}),
+    ('安全帽', {'site': '不存在的站点'}),
+    ('安全帽', {'since': '2030-01-01'}),
+    ('作业', {'category': '不存在的类别'}),
+    ('钢筋工 塔吊司机', {'site': SITES[3]}),
+]
+
+
+def matches_filters(meta, filters) -> bool:
+    site, ts, violation_type, category = meta
+    return ((not filters.get('site') or site == filters['site'])
+            and (not filters.get('violation_type') or violation_type == filters['violation_type'])
+            and (not filters.get('category') or category == filters['category'])
+            and (not filters.get('since') or ts >= filters['since'])
+            # 按上限的长度截取检测时间比较，只给日期时包含当天全天
+            and (not filters.get('until') or ts[:len(filters['until'])] <= filters['until']))
+
+
+def make_analysis(rng: random.Random, i: int, violations_per_analysis: int):
+    violations = []
+    for j in range(violations_per_analysis):
+        severe = rng.random() < 0.3
+        violations.append({
+            'type': '严重违规' if severe else '一般违规',
+            'category': rng.choice(CATEGORIES),
+            'description': f"{rng.choice(SUBJECTS)}{rng.choice(PROBLEMS)}，位于{rng.randint(1, 30)}号楼{rng.randint(1, 20)}层",
+            'coordinates': [j * 10, 0, j * 10 + 50, 50],
+            'regulations': [rng.choice(REGULATIONS)],
+            'suggestions': rng.sample(SUGGESTIONS, 2),
+            'severity': 'high' if severe else 'medium',
+            'risk_level': '高风险' if severe else '中等风险',
+        })
+    return {
+        'violations': violations,
+        'summary': {'total_score': rng.randint(40, 95)},
+    }, SITES[i % len(SITES)], f"2025-{1 + i % 12:02d}-{1 + i % 28:02d} 10:00:00", f"analysis-{i}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='违规项全文检索测试')
+    parser.add_argument('--count', type=int, default=50000, help='模拟违规项数量 (默认: 50000)')
+    parser.add_argument('--per-analysis', type=int, default=5, help='每次分析的违规项数量 (默认: 5)')
+    parser.add_argument('--limit', type=int, default=100, help='每次查询返回条数 (默认: 100)')
+    parser.add_argument('--budget-ms', type=float, default=100.0, help='单次查询耗时上限 (默认: 100ms)')
+    parser.add_argument('--verify', type=int, default=50000,
+                        help='违规项不超过该数量时与逐条扫描结果比对 (默认: 50000)')
+    args = parser.parse_args()
+
+    rng = random.Random(42)
+    analyses = max(1, args.count // args.per_analysis)
+    records = [make_analysis(rng, i, args.per_analysis) for i in range(analyses)]
+    ok = True
+
+    with tempfile.TemporaryDirectory() as tmp:
+        index = SearchIndex(os.path.join(tmp, 'search.sqlite3'))
+        print(f"📝 索引 {analyses * args.per_analysis} 项违规 ...")
+        start = time.perf_counter()
+        indexed = index.add_many(records)
+        elapsed = time.perf_counter() - start
+        print(f"   {indexed} 项，耗时 {elapsed:.1f}s（{indexed / elapsed:.0f} 项/秒）")
+        if index.add_many(records[:10]) != 0:
+            print("❌ 重复索引同一分析")
+            ok = False
+
+        if analyses * args.per_analysis <= args.verify:
+            # 逐条扫描的参照结果：按索引顺序从新到旧
+            corpus = []
+            metas = []
+            for analysis, site, ts, key in records:
+                for v in analysis['violations']:
+                    corpus.append(normalize(searchable_text(v)))
+                    metas.append((site, ts, v['type'], v['category']))
+            for query, filters in [(q, {}) for q in QUERIES] + FILTERED_QUERIES:
+                terms = [normalize(t) for t in query.split()]
+                expected = [i for i in range(len(corpus) - 1, -1, -1)
+                             if all(t in corpus[i] for t in terms) and matches_filters(metas[i], filters)][:args.limit]
+                got = [r['id'] - 1 for r in index.search(query, limit=args.limit, **filters)]
+                if got != expected:
+                    print(f"❌ “{query}” {filters} 检索结果与逐条扫描不一致 ({len(got)} / {len(expected)})")
+                    ok = False
+            print("✅ 检索结果与逐条扫描一致" if ok else "❌ 检索结果校验失败")
+
+        for query, filters in [(q, {}) for q in QUERIES] + FILTERED_QUERIES:
+            timings = []
+            for _ in range(5):
+                start = time.perf_counter()
+                results = index.search(query, limit=args.limit, **filters)
+                timings.append((time.perf_counter() - start) * 1000)
+            worst = max(timings[1:])
+            status = '✅' if worst <= args.budget_ms else '❌'
+            ok = ok and worst <= args.budget_ms
+            label = ' '.join([query] + [f"--{k} {v}" for k, v in filters.items()])
+            print(f"{status} {label}: 命中 {len(results)} 项，最慢 {worst:.1f}ms")
+
+        # 只给日期的时间范围命中当天的检测
+        same_day = index.search('安全帽', limit=10, since='2025-03-07', until='2025-03-07')
+        if not same_day or not all(r['timestamp'].startswith('2025-03-07') for r in same_day):
+            print(f"❌ 检测时间上限未包含当天 (命中 {len(same_day)} 项)")
+            ok = False
+
+        # 移除后不再命中
+        index.remove('analysis-0')
+        if any(r['analysis_id'] == 'analysis-0' for r in index.search('作业', limit=10 ** 9)):
+            print("❌ 删除分析后仍能检索到")
+            ok = False
+        stats = index.stats()
+        index.close()
+
+        with redirect_stdout(io.StringIO()):
+            manifest = search_report('安全帽', ['json', 'excel'], os.path.join(tmp, 'reports'), limit=50,
+                                     db_path=os.path.join(tmp, 'search.sqlite3'))
+        if not manifest or not all(o['success'] for o in manifest['outputs']):
+            print("❌ 检索结果报告生成失败")
+            ok = False
+
+    print(f"📊 {stats}")
+    print("✅ 检索测试通过" if ok else "❌ 检索测试失败")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
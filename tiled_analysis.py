@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+高分辨率图片分块分析
+将大图切分为相互重叠的子图并发送AI分析，再把各子图的坐标映射回原图，
+对接缝处的重复违规框做IoU非极大值抑制
+"""
+
+import io
+import argparse
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+
+from analysis_parser import AnalysisResult, Summary, Violation, finalize_summary
+from box_utils import batched_nms
+
+# 子图分析函数：(图片字节, MIME类型) -> 分析结果
+AnalyzeFn = Callable[[bytes, str], Optional[AnalysisResult]]
+
+_SEVERITY_RANK = {'high': 2, 'medium': 1, 'low': 0}
+
+
+def plan_tiles(width: int, height: int, tile_size: int = 1280, overlap: float = 0.2) -> List[Tuple[int, int, int, int]]:
+    """计算子图区域 [x1, y1, x2, y2]，相邻子图重叠 overlap 比例"""
+    def axis(length: int) -> List[Tuple[int, int]]:
+        if length <= tile_size:
+            return [(0, length)]
+        stride = max(1, int(tile_size * (1 - overlap)))
+        starts = list(range(0, length - tile_size, stride)) + [length - tile_size]
+        return [(s, s + tile_size) for s in sorted(set(starts))]
+
+    return [(x1, y1, x2, y2) for (y1, y2) in axis(height) for (x1, x2) in axis(width)]
+
+
+def _encode(image, quality: int = 90) -> bytes:
+    buf = io.BytesIO()
+    image.convert('RGB').save(buf, format='JPEG', quality=quality)
+    return buf.getvalue()
+
+
+def _shift(violation: Violation, region: Tuple[int, int, int, int], scale: float,
+           width: int, height: int) -> Violation:
+    """把子图坐标映射回原图坐标"""
+    if violation.coordinates:
+        x1, y1, x2, y2 = violation.coordinates
+        ox, oy = region[0], region[1]
+        violation.coordinates = (
+            min(width, int(round(ox + x1 * scale))),
+            min(height, int(round(oy + y1 * scale))),
+            min(width, int(round(ox + x2 * scale))),
+            min(height, int(round(oy + y2 * scale))),
+        )
+    return violation
+
+
+def merge_violations(violations: List[Violation], width: int, height: int,
+                     iou_threshold: float = 0.4) -> List[Violation]:
+    """按违规类别做NMS，去除接缝处的重复框
+
+    同一类别内，严重程度高的优先保留；严重程度相同时保留面积更大的框
+    """
+    image_area = float(max(1, width * height))
+    boxed = [v for v in violations if v.coordinates]
+    scores = [
+        _SEVERITY_RANK.get(v.severity, 0) + (b[2] - b[0]) * (b[3] - b[1]) / image_area
+        for v, b in ((v, v.coordinates) for v in boxed)
+    ]
+    keep = batched_nms([v.coordinates for v in boxed], scores, [v.category for v in boxed], iou_threshold)
+    return [v for v in violations if not v.coordinates] + [boxed[i] for i in keep]
+
+
+def analyze_tiled(image_path: str, analyze_fn: Optional[AnalyzeFn] = None, tile_size: int = 1280,
+                  overlap: float = 0.2, max_workers: int = 4, include_overview: bool = True,
+                  iou_threshold: float = 0.4) -> Optional[AnalysisResult]:
+    """分块分析一张图片
+
+    小于 tile_size 的图片只做一次整图分析；大图额外附带一张缩小的全景图，
+    以免跨越多个子图的大范围违规（如整段基坑）被切碎
+    """
+    from PIL import Image
+
+    if analyze_fn is None:
+        from ark_client import ArkClient
+        analyze_fn = ArkClient().analyze
+
+    with Image.open(image_path) as img:
+        img.load()
+        width, height = img.size
+        regions = plan_tiles(width, height, tile_size, overlap)
+
+        # (原图区域, 子图坐标到原图的缩放比例, 子图)
+        jobs = []
+        if len(regions) > 1:
+            for region in regions:
+                jobs.append((region, 1.0, img.crop(region)))
+            if include_overview:
+                scale = max(width, height) / float(tile_size)
+                overview = img.resize((max(1, int(width / scale)), max(1, int(height / scale))), Image.LANCZOS)
+                jobs.append(((0, 0, width, height), scale, overview))
+        else:
+            jobs.append(((0, 0, width, height), 1.0, img.copy()))
+
+    print(f"🧩 分块分析: {width}x{height} -> {len(jobs)} 个子图")
+
+    # JPEG编码与网络请求都会释放GIL，放在同一个线程池里并行
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(lambda job: analyze_fn(_encode(job[2]), 'image/jpeg'), jobs))
+
+    succeeded = [(job, r) for job, r in zip(jobs, results) if r is not None]
+    if not succeeded:
+        return None
+
+    violations = []
+    for (region, scale, _), result in succeeded:
+        violations.extend(_shift(v, region, scale, width, height) for v in result.violations)
+    violations = merge_violations(violations, width, height, iou_threshold)
+
+    # 整体评分取最差子图的结果，整改事项去重合并
+    worst = min((r for _, r in succeeded), key=lambda r: r.summary.total_score)
+    actions = []
+    for _, result in succeeded:
+        for action in result.summary.priority_actions:
+            if action not in actions:
+                actions.append(action)
+    summary = Summary(total_score=worst.summary.total_score,
+                      overall_assessment=worst.summary.overall_assessment,
+                      priority_actions=actions)
+    finalize_summary(summary, violations)
+    return AnalysisResult(violations, summary, any(r.repaired for _, r in succeeded))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='高分辨率图片分块安全分析')
+    parser.add_argument('image', help='图片路径')
+    parser.add_argument('--tile-size', type=int, default=1280, help='子图边长 (默认: 1280)')
+    parser.add_argument('--overlap', type=float, default=0.2, help='子图重叠比例 (默认: 0.2)')
+    parser.add_argument('--workers', type=int, default=4, help='并发分析数 (默认: 4)')
+    parser.add_argument('--output', help='结果JSON输出路径')
+
+    args = parser.parse_args()
+
+    result = analyze_tiled(args.image, tile_size=args.tile_size, overlap=args.overlap, max_workers=args.workers)
+    if result is None:
+        print("❌ 分块分析失败")
+        return
+
+    data = json.dumps(result.to_dict(), ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(data)
+        print(f"✅ 分析结果已保存: {args.output}")
+    else:
+        print(data)
+
+
+if __name__ == '__main__':
+    main()
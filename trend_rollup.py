@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+检测趋势增量汇总
+每次分析完成后把安全评分和违规数量累加到按站点、按日/周划分的汇总桶中，
+趋势查询只读取汇总桶，不再回放历史分析；趋势图生成一次后按数据内容缓存
+"""
+
+import os
+import io
+import sys
+import json
+import hashlib
+import sqlite3
+import argparse
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+from worker_metrics import record_cache
+
+TREND_DB = os.environ.get('TREND_DB', './reports/.trends.sqlite3')
+CHART_DIR = os.environ.get('TREND_CHART_DIR', './temp/charts')
+# 分析数据中没有站点信息时使用的站点名（每个部署对应一个工地时在环境变量中配置）
+DEFAULT_SITE = os.environ.get('SITE_NAME', '')
+
+GRANULARITIES = ('day', 'week')
+# 汇总全部类别时使用的类别名
+ALL_CATEGORIES = '*'
+
+
+def bucket_start(ts: datetime, granularity: str) -> str:
+    """时间所在汇总桶的起始日期（周桶从周一开始）"""
+    day = ts.date()
+    if granularity == 'week':
+        day -= timedelta(days=day.weekday())
+    return day.isoformat()
+
+
+def site_of(analysis_data: Dict[str, Any]) -> str:
+    return analysis_data.get('site') or analysis_data.get('location') or DEFAULT_SITE or '未知'
+
+
+def _parse_time(value: Any) -> datetime:
+    if isinstance(value, datetime):
+        return value
+    if isinstance(value, str) and value:
+        text = value.replace('Z', '+00:00')
+        for parse in (datetime.fromisoformat, lambda s: datetime.strptime(s, "%Y-%m-%d %H:%M:%S")):
+            try:
+                return parse(text).replace(tzinfo=None)
+            except ValueError:
+                continue
+    return datetime.now()
+
+
+class TrendStore:
+    """按站点/类别/时间桶预汇总的趋势数据（线程安全）"""
+
+    def __init__(self, db_path: str = TREND_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS buckets (
+                site TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                start TEXT NOT NULL,
+                category TEXT NOT NULL,
+                analyses INTEGER NOT NULL DEFAULT 0,
+                score_sum REAL NOT NULL DEFAULT 0,
+                score_min REAL,
+                score_max REAL,
+                severe_count INTEGER NOT NULL DEFAULT 0,
+                normal_count INTEGER NOT NULL DEFAULT 0,
+                PRIMARY KEY (site, granularity, category, start)
+            );
+            CREATE TABLE IF NOT EXISTS recorded (
+                analysis_id TEXT PRIMARY KEY
+            );
+            -- 每次分析对各汇总桶的贡献，重新分析时先扣除旧贡献再累加新结果
+            CREATE TABLE IF NOT EXISTS contributions (
+                analysis_id TEXT NOT NULL,
+                site TEXT NOT NULL,
+                granularity TEXT NOT NULL,
+                start TEXT NOT NULL,
+                category TEXT NOT NULL,
+                score REAL NOT NULL,
+                severe_count INTEGER NOT NULL,
+                normal_count INTEGER NOT NULL,
+                PRIMARY KEY (analysis_id, granularity, category)
+            );
+            CREATE INDEX IF NOT EXISTS contributions_bucket
+                ON contributions (site, granularity, category, start);
+        ''')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def record(self, analysis_data: Dict[str, Any], site: Optional[str] = None,
+               timestamp: Any = None, analysis_id: Optional[str] = None) -> bool:
+        """把一次分析累加到汇总桶，返回汇总桶是否有变化
+
+        同一 analysis_id 再次记录时（如重新分析）先扣除上次的贡献再累加新结果，
+        结果没有变化时返回False。未指定 analysis_id 时使用分析内容的哈希
+        """
+        site = site or site_of(analysis_data)
+        ts = _parse_time(timestamp or analysis_data.get('timestamp'))
+        if analysis_id is None:
+            payload = json.dumps(analysis_data, ensure_ascii=False, sort_keys=True, default=str)
+            analysis_id = hashlib.sha1(f"{site}|{payload}".encode('utf-8')).hexdigest()
+
+        summary = analysis_data.get('summary') or {}
+        violations = analysis_data.get('violations') or []
+        score = float(summary.get('total_score', 0) or 0)
+
+        # 每个类别的违规数量，'*' 为整体
+        rows = {ALL_CATEGORIES: [0, 0]}
+        for v in violations:
+            severe = v.get('type') == '严重违规'
+            for category in (ALL_CATEGORIES, v.get('category') or '未分类'):
+                counts = rows.setdefault(category, [0, 0])
+                counts[0 if severe else 1] += 1
+        if not violations:
+            rows[ALL_CATEGORIES] = [int(summary.get('severe_count', 0) or 0),
+                                    int(summary.get('normal_count', 0) or 0)]
+
+        contributions = sorted(
+            (site, granularity, bucket_start(ts, granularity), category, score, severe, normal)
+            for granularity in GRANULARITIES for category, (severe, normal) in rows.items())
+
+        with self._lock, self._conn:
+            previous = sorted(self._conn.execute(
+                'SELECT site, granularity, start, category, score, severe_count, normal_count '
+                'FROM contributions WHERE analysis_id = ?', (analysis_id,)).fetchall())
+            if not previous:
+                # 已记录但没有贡献明细的是旧版本写入的数据，无法扣除，仍只记录一次
+                try:
+                    self._conn.execute('INSERT INTO recorded VALUES (?)', (analysis_id,))
+                except sqlite3.IntegrityError:
+                    return False
+            elif previous == contributions:
+                return False
+            else:
+                self._conn.execute('DELETE FROM contributions WHERE analysis_id = ?', (analysis_id,))
+                self._conn.executemany('''
+                    UPDATE buckets SET
+                        analyses = analyses - 1,
+                        score_sum = score_sum - ?,
+                        severe_count = severe_count - ?,
+                        normal_count = normal_count - ?
+                    WHERE site = ? AND granularity = ? AND start = ? AND category = ?
+                ''', [(c[4], c[5], c[6]) + c[:4] for c in previous])
+
+            self._conn.executemany('INSERT INTO contributions VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   [(analysis_id,) + c for c in contributions])
+            self._conn.executemany('''
+                INSERT INTO buckets VALUES (?, ?, ?, ?, 1, ?, ?, ?, ?, ?)
+                ON CONFLICT (site, granularity, category, start) DO UPDATE SET
+                    analyses = analyses + 1,
+                    score_sum = score_sum + excluded.score_sum,
+                    score_min = MIN(score_min, excluded.score_min),
+                    score_max = MAX(score_max, excluded.score_max),
+                    severe_count = severe_count + excluded.severe_count,
+                    normal_count = normal_count + excluded.normal_count
+            ''', [c[:4] + (c[4],) * 3 + c[5:] for c in contributions])
+
+            # 扣除旧贡献后最低/最高分无法增量更新，按桶内剩余贡献重新计算；已清空的桶直接删除
+            for bucket in {c[:4] for c in previous}:
+                self._conn.execute('''
+                    UPDATE buckets SET
+                        score_min = (SELECT MIN(score) FROM contributions
+                                     WHERE site = ? AND granularity = ? AND start = ? AND category = ?),
+                        score_max = (SELECT MAX(score) FROM contributions
+                                     WHERE site = ? AND granularity = ? AND start = ? AND category = ?)
+                    WHERE site = ? AND granularity = ? AND start = ? AND category = ? AND analyses > 0
+                ''', bucket * 3)
+                self._conn.execute('DELETE FROM buckets WHERE site = ? AND granularity = ? AND start = ? '
+                                   'AND category = ? AND analyses <= 0', bucket)
+        return True
+
+    def trend(self, site: str, granularity: str = 'week', category: str = ALL_CATEGORIES,
+              start: Optional[str] = None, end: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按时间顺序返回汇总桶，耗时只与桶数量有关"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"不支持的汇总粒度: {granularity}")
+        sql = ('SELECT start, analyses, score_sum, score_min, score_max, severe_count, normal_count '
+               'FROM buckets WHERE site = ? AND granularity = ? AND category = ?')
+        params = [site, granularity, category]
+        if start:
+            sql += ' AND start >= ?'
+            params.append(start)
+        if end:
+            sql += ' AND start <= ?'
+            params.append(end)
+        sql += ' ORDER BY start'
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [{
+            'start': r[0],
+            'analyses': r[1],
+            'avg_score': round(r[2] / r[1], 1) if r[1] else 0,
+            'min_score': r[3],
+            'max_score': r[4],
+            'severe_count': r[5],
+            'normal_count': r[6],
+        } for r in rows]
+
+    def categories(self, site: str, granularity: str = 'week') -> List[str]:
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT DISTINCT category FROM buckets WHERE site = ? AND granularity = ? AND category != ?',
+                (site, granularity, ALL_CATEGORIES)).fetchall()
+        return sorted(r[0] for r in rows)
+
+
+def record_analysis(analysis_data: Dict[str, Any], site: Optional[str] = None, timestamp: Any = None,
+                    analysis_id: Optional[str] = None, db_path: str = TREND_DB) -> bool:
+    """分析完成后记录到趋势汇总，失败时只输出日志，不影响分析流程"""
+    try:
+        store = TrendStore(db_path)
+        try:
+            return store.record(analysis_data, site=site, timestamp=timestamp, analysis_id=analysis_id)
+        finally:
+            store.close()
+    except (sqlite3.Error, OSError) as e:
+        print(f"趋势记录失败: {e}")
+        return False
+
+
+def render_trend_chart(buckets: List[Dict[str, Any]], width: int = 900, height: int = 360) -> bytes:
+    """绘制趋势图PNG：折线为平均安全评分(0-100)，柱状为严重/一般违规数量
+
+    图中只使用数字和日期，避免依赖中文字体
+    """
+    from PIL import Image, ImageDraw
+
+    image = Image.new('RGB', (width, height), 'white')
+    draw = ImageDraw.Draw(image)
+    left, right, top, bottom = 50, width - 50, 20, height - 40
+    draw.rectangle([left, top, right, bottom], outline=(180, 180, 180))
+
+    n = len(buckets)
+    max_count = max([b['severe_count'] + b['normal_count'] for b in buckets] + [1])
+    slot = (right - left) / float(max(n, 1))
+    bar_w = max(2, int(slot * 0.5))
+    points = []
+    for i, b in enumerate(buckets):
+        cx = left + slot * (i + 0.5)
+        # 违规数量柱（严重在下，一般在上）
+        severe_h = (bottom - top) * b['severe_count'] / max_count
+        normal_h = (bottom - top) * b['normal_count'] / max_count
+        draw.rectangle([cx - bar_w / 2, bottom - severe_h, cx + bar_w / 2, bottom], fill=(255, 77, 79))
+        draw.rectangle([cx - bar_w / 2, bottom - severe_h - normal_h, cx + bar_w / 2, bottom - severe_h],
+                       fill=(250, 173, 20))
+        points.append((cx, bottom - (bottom - top) * b['avg_score'] / 100.0))
+        if n <= 12 or i % max(1, n // 12) == 0:
+            draw.text((cx - 28, bottom + 8), b['start'], fill=(80, 80, 80))
+
+    if len(points) > 1:
+        draw.line(points, fill=(24, 144, 255), width=3)
+    for x, y in points:
+        draw.ellipse([x - 4, y - 4, x + 4, y + 4], fill=(24, 144, 255))
+
+    for value in (0, 50, 100):
+        y = bottom - (bottom - top) * value / 100.0
+        draw.text((left - 30, y - 6), str(value), fill=(24, 144, 255))
+    draw.text((right + 8, top), str(max_count), fill=(255, 77, 79))
+
+    buf = io.BytesIO()
+    image.save(buf, format='PNG', optimize=True)
+    return buf.getvalue()
+
+
+def cached_trend_chart(site: str, buckets: List[Dict[str, Any]], chart_dir: str = CHART_DIR) -> str:
+    """按趋势数据内容缓存图表，数据不变时直接复用已生成的PNG"""
+    key = hashlib.sha1(json.dumps([site, buckets], ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+    path = os.path.join(chart_dir, f"trend_{key[:16]}.png")
+    hit = os.path.exists(path)
+    record_cache('trend_chart', hit)
+    if not hit:
+        os.makedirs(chart_dir, exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(render_trend_chart(buckets))
+        os.replace(tmp_path, path)
+    return path
+
+
+def trend_chart_for_report(analysis_data: Dict[str, Any], granularity: str = 'week',
+                           db_path: str = TREND_DB) -> Optional[str]:
+    """报告使用的趋势图路径；没有趋势库或历史不足两个周期时返回None"""
+    if not os.path.exists(db_path):
+        return None
+    try:
+        store = TrendStore(db_path)
+        try:
+            buckets = store.trend(site_of(analysis_data), granularity)
+        finally:
+            store.close()
+        if len(buckets) < 2:
+            return None
+        return cached_trend_chart(site_of(analysis_data), buckets)
+    except (sqlite3.Error, OSError, ImportError) as e:
+        print(f"趋势图生成失败: {e}")
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='检测趋势汇总')
+    parser.add_argument('--db', default=TREND_DB, help=f'趋势库路径 (默认: {TREND_DB})')
+    sub = parser.add_subparsers(dest='command')
+
+    record_parser = sub.add_parser('record', help='记录一次分析结果')
+    record_parser.add_argument('--data', required=True, help='分析数据JSON文件路径，- 表示从标准输入读取')
+    record_parser.add_argument('--site', help='站点名称 (默认取数据中的site/location)')
+    record_parser.add_argument('--timestamp', help='检测时间 (默认取数据中的timestamp)')
+    record_parser.add_argument('--analysis-id', help='分析标识，同一标识重复记录时以最新结果为准 (默认取数据内容哈希)')
+    record_parser.add_argument('--index', action='store_true',
+                               help='同时写入违规项检索索引（同一分析标识先删除再重新索引）')
+
+    query_parser = sub.add_parser('query', help='查询站点趋势')
+    query_parser.add_argument('--site', required=True, help='站点名称')
+    query_parser.add_argument('--granularity', choices=GRANULARITIES, default='week', help='汇总粒度')
+    query_parser.add_argument('--category', default=ALL_CATEGORIES, help='违规类别 (默认: 全部)')
+    query_parser.add_argument('--chart', action='store_true', help='同时生成趋势图')
+
+    args = parser.parse_args()
+    store = TrendStore(args.db)
+    status = 0
+    try:
+        if args.command == 'record':
+            if args.data == '-':
+                data = json.load(io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8'))
+            else:
+                with open(args.data, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            # 兼容 {analysis: {...}} 的包装格式
+            analysis = data.get('analysis', data)
+            site = args.site or site_of(data)
+            timestamp = args.timestamp or data.get('timestamp')
+            try:
+                if store.record(analysis, site=site, timestamp=timestamp, analysis_id=args.analysis_id):
+                    print("✅ 已记录分析结果")
+                else:
+                    print("ℹ️ 该分析结果已记录过，没有变化")
+            except sqlite3.Error as e:
+                print(f"趋势记录失败: {e}")
+                status = 1
+            if args.index:
+                # 与趋势记录在同一进程内完成，服务端每次分析只需启动一个Python进程；
+                # 趋势记录失败时仍然写入检索索引
+                from violation_search import SearchIndex
+
+                try:
+                    index = SearchIndex()
+                    try:
+                        count = index.add(analysis, site=site, timestamp=timestamp,
+                                          analysis_id=args.analysis_id, replace=True)
+                    finally:
+                        index.close()
+                    print(f"✅ 新索引 {count} 项违规")
+                except (sqlite3.Error, OSError) as e:
+                    print(f"检索索引失败: {e}")
+                    status = 1
+        elif args.command == 'query':
+            buckets = store.trend(args.site, args.granularity, args.category)
+            print(json.dumps(buckets, ensure_ascii=False, indent=2))
+            if args.chart and buckets:
+                print(f"📈 趋势图: {cached_trend_chart(args.site, buckets)}")
+        else:
+            parser.print_help()
+            return 1
+    finally:
+        store.close()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,278 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+施工现场视频/图片序列分析
+从视频或图片序列中流式读取帧，按感知哈希变化挑选关键帧，只对关键帧调用AI分析，
+再把相邻关键帧中同一隐患的违规项合并
+"""
+
+import io
+import os
+import sys
+import json
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from analysis_parser import AnalysisResult
+
+# 帧分析函数：(图片字节, MIME类型) -> 分析结果
+AnalyzeFn = Callable[[bytes, str], Optional[AnalysisResult]]
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+VIDEO_EXTENSIONS = ('.mp4', '.mov', '.avi', '.mkv', '.m4v', '.3gp')
+
+# 发送给AI的关键帧最长边，与上传接口压缩后的尺寸相当
+_MAX_SIDE = 1920
+
+
+def _iter_image_dir(path: str, fps: float) -> Iterator[Tuple[int, float, Any]]:
+    from image_loader import load_reduced
+
+    names = sorted(n for n in os.listdir(path) if n.lower().endswith(IMAGE_EXTENSIONS))
+    for index, name in enumerate(names):
+        # 关键帧最终缩放到 _MAX_SIDE，JPEG只需解码到接近该尺寸；逐帧读取不进缓存
+        yield index, index / fps, load_reduced(os.path.join(path, name), _MAX_SIDE, cache=False)
+
+
+def _iter_animated(path: str, sample_fps: float) -> Iterator[Tuple[int, float, Any]]:
+    from PIL import Image, ImageSequence
+
+    with Image.open(path) as img:
+        timestamp = 0.0
+        next_sample = 0.0
+        for index, frame in enumerate(ImageSequence.Iterator(img)):
+            if timestamp >= next_sample:
+                next_sample = timestamp + 1.0 / sample_fps
+                yield index, timestamp, frame.convert('RGB')
+            timestamp += frame.info.get('duration', 100) / 1000.0
+
+
+def _iter_video(path: str, sample_fps: float) -> Iterator[Tuple[int, float, Any]]:
+    try:
+        import cv2
+    except ImportError:
+        raise RuntimeError("缺少opencv-python库，请运行: pip install opencv-python")
+    from PIL import Image
+
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise RuntimeError(f"无法打开视频文件: {path}")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        step = max(1, int(round(fps / sample_fps)))
+        index = 0
+        while True:
+            # 非采样帧只grab不解码
+            if index % step:
+                if not capture.grab():
+                    break
+                index += 1
+                continue
+            ok, frame = capture.read()
+            if not ok:
+                break
+            yield index, index / fps, Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+            index += 1
+    finally:
+        capture.release()
+
+
+def iter_frames(source: str, sample_fps: float = 2.0, sequence_fps: float = 1.0) -> Iterator[Tuple[int, float, Any]]:
+    """流式读取帧，产出 (帧序号, 时间戳秒, PIL图片)
+
+    source 可以是图片目录（按文件名排序，每张间隔 1/sequence_fps 秒）、GIF动图或视频文件
+    """
+    if os.path.isdir(source):
+        return _iter_image_dir(source, sequence_fps)
+    ext = os.path.splitext(source)[1].lower()
+    if ext in ('.gif', '.webp', '.png'):
+        return _iter_animated(source, sample_fps)
+    return _iter_video(source, sample_fps)
+
+
+def dhash(image, hash_size: int = 8) -> int:
+    """差值感知哈希，64位整数"""
+    from PIL import Image
+
+    small = image.convert('L').resize((hash_size + 1, hash_size), Image.BILINEAR)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count('1')
+
+
+def select_keyframes(frames: Iterator[Tuple[int, float, Any]], threshold: int = 12,
+                     min_gap: float = 1.0, max_gap: float = 30.0) -> Iterator[Tuple[int, float, Any]]:
+    """挑选关键帧
+
+    与上一关键帧的哈希距离超过 threshold 时视为画面变化；
+    两个关键帧至少间隔 min_gap 秒，超过 max_gap 秒无变化时也强制取一帧
+    """
+    last_hash = None
+    last_time = None
+    for index, timestamp, image in frames:
+        if last_hash is not None and timestamp - last_time < min_gap:
+            continue
+        frame_hash = dhash(image)
+        if (last_hash is None or hamming(frame_hash, last_hash) > threshold
+                or timestamp - last_time >= max_gap):
+            last_hash = frame_hash
+            last_time = timestamp
+            yield index, timestamp, image
+
+
+def _encode(image) -> bytes:
+    from PIL import Image
+
+    if max(image.size) > _MAX_SIDE:
+        image = image.copy()
+        image.thumbnail((_MAX_SIDE, _MAX_SIDE), Image.LANCZOS)
+    buf = io.BytesIO()
+    image.save(buf, format='JPEG', quality=85)
+    return buf.getvalue()
+
+
+def merge_across_frames(frame_results: List[Tuple[int, float, AnalysisResult]],
+                        iou_threshold: float = 0.3) -> List[Dict[str, Any]]:
+    """合并相邻关键帧中的同一隐患
+
+    当前关键帧的违规项与上一关键帧同类别违规项的IoU超过阈值时视为同一隐患，
+    延续其出现时间段；否则作为新隐患。同一关键帧内按IoU从大到小贪心配对，
+    每条隐患最多匹配一个违规项
+    """
+    from box_utils import iou_matrix
+
+    tracks = []
+    previous = []  # 上一关键帧中出现的 (track, 坐标)
+    for _, timestamp, result in frame_results:
+        violations = result.violations
+        prev_boxed = [(t, c) for t, c in previous if c]
+        curr_boxed = [i for i, v in enumerate(violations) if v.coordinates]
+        matched = {}
+        if prev_boxed and curr_boxed:
+            ious = iou_matrix([violations[i].coordinates for i in curr_boxed], [c for _, c in prev_boxed])
+            candidates = sorted(((ious[a, b], a, b) for a in range(len(curr_boxed)) for b in range(len(prev_boxed))
+                                 if ious[a, b] > iou_threshold
+                                 and violations[curr_boxed[a]].category == prev_boxed[b][0]['category']),
+                                reverse=True)
+            used_a, used_b = set(), set()
+            for _, a, b in candidates:
+                if a in used_a or b in used_b:
+                    continue
+                used_a.add(a)
+                used_b.add(b)
+                matched[curr_boxed[a]] = prev_boxed[b][0]
+
+        current = []
+        for index, violation in enumerate(violations):
+            track = matched.get(index)
+            if track is None:
+                track = violation.to_dict()
+                track.update(first_seen=timestamp, last_seen=timestamp, frame_count=0)
+                tracks.append(track)
+            elif violation.type == '严重违规' and track['type'] != '严重违规':
+                track['type'] = violation.type
+                track['severity'] = violation.severity
+            track['last_seen'] = timestamp
+            track['frame_count'] += 1
+            current.append((track, violation.coordinates))
+        previous = current
+    return tracks
+
+
+def analyze_sequence(source: str, analyze_fn: Optional[AnalyzeFn] = None, sample_fps: float = 2.0,
+                     threshold: int = 12, min_gap: float = 1.0, max_gap: float = 30.0,
+                     max_workers: int = 4) -> Optional[Dict[str, Any]]:
+    """分析视频或图片序列，返回与单张图片分析结构一致的结果（附加关键帧信息）
+
+    所有关键帧都分析失败时返回None
+    """
+    if analyze_fn is None:
+        from ark_client import ArkClient
+        analyze_fn = ArkClient().analyze
+
+    keyframes = []
+    futures = []
+    # 同时排队的关键帧上限，超过时先等待最早提交的分析完成
+    max_pending = max_workers * 2
+    waited = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        # 关键帧边解码边提交分析，待分析的关键帧数量有上限，内存占用与视频长度无关
+        for index, timestamp, image in select_keyframes(iter_frames(source, sample_fps), threshold, min_gap, max_gap):
+            while len(futures) - waited >= max_pending:
+                futures[waited].result()
+                waited += 1
+            keyframes.append((index, timestamp))
+            futures.append(executor.submit(analyze_fn, _encode(image), 'image/jpeg'))
+            print(f"🎞️ 关键帧 #{len(keyframes)}: 第{index}帧 ({timestamp:.1f}s)")
+        results = [f.result() for f in futures]
+
+    frame_results = [(i, t, r) for (i, t), r in zip(keyframes, results) if r is not None]
+    if not frame_results:
+        return None
+    violations = merge_across_frames(frame_results)
+
+    severe = sum(1 for v in violations if v['type'] == '严重违规')
+    normal = sum(1 for v in violations if v['type'] == '一般违规')
+    scores = [r.summary.total_score for _, _, r in frame_results]
+    actions = []
+    for _, _, r in frame_results:
+        for action in r.summary.priority_actions:
+            if action not in actions:
+                actions.append(action)
+    worst = min(frame_results, key=lambda fr: fr[2].summary.total_score)[2]
+
+    return {
+        'violations': violations,
+        'summary': {
+            'severe_count': severe,
+            'normal_count': normal,
+            'total_score': min(scores),
+            'overall_assessment': worst.summary.overall_assessment,
+            'priority_actions': actions,
+        },
+        'keyframes': [
+            {'frame': i, 'timestamp': round(t, 2), 'analyzed': r is not None}
+            for (i, t), r in zip(keyframes, results)
+        ],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='施工现场视频/图片序列安全分析')
+    parser.add_argument('source', help='视频文件、GIF动图或图片目录')
+    parser.add_argument('--sample-fps', type=float, default=2.0, help='视频采样帧率 (默认: 2)')
+    parser.add_argument('--threshold', type=int, default=12, help='关键帧哈希距离阈值 (默认: 12)')
+    parser.add_argument('--max-gap', type=float, default=30.0, help='最长关键帧间隔秒数 (默认: 30)')
+    parser.add_argument('--workers', type=int, default=4, help='并发分析数 (默认: 4)')
+    parser.add_argument('--output', help='结果JSON输出路径')
+
+    args = parser.parse_args()
+
+    data = analyze_sequence(args.source, sample_fps=args.sample_fps, threshold=args.threshold,
+                            max_gap=args.max_gap, max_workers=args.workers)
+    if data is None:
+        print("❌ 所有关键帧分析失败，请检查ARK_API_KEY配置和网络连接")
+        return 1
+    print(f"📊 共{len(data['keyframes'])}个关键帧，合并后违规{len(data['violations'])}项")
+
+    text = json.dumps(data, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text)
+        print(f"✅ 分析结果已保存: {args.output}")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,535 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+违规项全文检索
+每次分析完成后把违规项的类别、描述、整改建议和法规条文切分为词元写入倒排索引，
+中文按相邻两字切分（每段连续汉字末尾的单字也单独记录，支持单字检索），
+英文和数字按整词切分。查询从出现次数最少的词元开始沿倒排表从新到旧读取，
+再逐条核对原文，取够条数即停止；站点、类别、时间等筛选条件命中的违规项
+明显少于倒排表时改为从筛选条件一侧读取。检索结果可以直接生成筛选后的报告
+"""
+
+import os
+import re
+import sys
+import json
+import heapq
+import hashlib
+import sqlite3
+import argparse
+import threading
+import unicodedata
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SEARCH_DB = os.environ.get('SEARCH_DB', './reports/.search.sqlite3')
+
+# 连续的英文数字，或连续的汉字（含扩展A区和兼容区）
+_RUN = re.compile(r'[0-9a-z]+|[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff]+')
+
+# 单次写入事务的违规项数量
+BATCH_SIZE = 2000
+
+
+def normalize(text: str) -> str:
+    """全角转半角、统一小写"""
+    return unicodedata.normalize('NFKC', text).lower()
+
+
+def _is_cjk(run: str) -> bool:
+    return not run[0].isascii()
+
+
+def tokenize(text: str) -> set:
+    """索引词元：汉字相邻两字 + 每段末字，英文数字整词"""
+    tokens = set()
+    for run in _RUN.findall(normalize(text)):
+        if not _is_cjk(run):
+            tokens.add(run)
+            continue
+        for i in range(len(run) - 1):
+            tokens.add(run[i:i + 2])
+        tokens.add(run[-1])
+    return tokens
+
+
+def query_tokens(term: str) -> List[Tuple[str, bool]]:
+    """查询词的 (词元, 是否前缀匹配) 列表
+
+    单个汉字需要匹配以该字开头的双字词元或段末单字，其余词元精确匹配
+    """
+    tokens = []
+    for run in _RUN.findall(normalize(term)):
+        if not _is_cjk(run):
+            tokens.append((run, False))
+        elif len(run) == 1:
+            tokens.append((run, True))
+        else:
+            tokens.extend((run[i:i + 2], False) for i in range(len(run) - 1))
+    return tokens
+
+
+def searchable_text(violation: Dict[str, Any]) -> str:
+    """参与检索的文本：类别、描述、整改建议、法规条文，各字段分行"""
+    parts = [violation.get('category'), violation.get('description')]
+    parts.extend(violation.get('suggestions') or [])
+    for regulation in violation.get('regulations') or []:
+        if isinstance(regulation, dict):
+            parts.append(regulation.get('content'))
+    return '\n'.join(str(p) for p in parts if p)
+
+
+def analysis_key(analysis_data: Dict[str, Any], site: str) -> str:
+    payload = json.dumps(analysis_data, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(f"{site}|{payload}".encode('utf-8')).hexdigest()
+
+
+def _until_bound(until: str) -> Tuple[str, str]:
+    """检测时间上限的比较方式：只给日期时包含当天全天（检测时间存为 YYYY-MM-DD HH:MM:SS）"""
+    try:
+        day = datetime.strptime(until, '%Y-%m-%d')
+    except ValueError:
+        return '<=', until
+    return '<', (day + timedelta(days=1)).strftime('%Y-%m-%d')
+
+
+class SearchIndex:
+    """违规项倒排索引（线程安全）"""
+
+    def __init__(self, db_path: str = SEARCH_DB):
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript('''
+            CREATE TABLE IF NOT EXISTS analyses (
+                id INTEGER PRIMARY KEY,
+                analysis_key TEXT UNIQUE NOT NULL,
+                site TEXT NOT NULL,
+                timestamp TEXT NOT NULL,
+                total_score REAL
+            );
+            CREATE TABLE IF NOT EXISTS violations (
+                id INTEGER PRIMARY KEY,
+                analysis_id INTEGER NOT NULL,
+                type TEXT,
+                category TEXT,
+                data TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_violations_analysis ON violations (analysis_id);
+            CREATE INDEX IF NOT EXISTS idx_violations_category ON violations (category);
+            CREATE INDEX IF NOT EXISTS idx_violations_type ON violations (type);
+            CREATE INDEX IF NOT EXISTS idx_analyses_site ON analyses (site, timestamp);
+            CREATE INDEX IF NOT EXISTS idx_analyses_timestamp ON analyses (timestamp);
+            CREATE TABLE IF NOT EXISTS postings (
+                token TEXT NOT NULL,
+                violation_id INTEGER NOT NULL,
+                PRIMARY KEY (token, violation_id)
+            ) WITHOUT ROWID;
+            CREATE TABLE IF NOT EXISTS terms (
+                token TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        ''')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def add(self, analysis_data: Dict[str, Any], site: Optional[str] = None, timestamp: Any = None,
+            analysis_id: Optional[str] = None, replace: bool = False) -> int:
+        """索引一次分析的违规项，返回新索引的违规项数量
+
+        同一 analysis_id 只索引一次（未指定时使用分析内容的哈希）；
+        replace 为True时先删除该分析已有的索引，用于重新分析后更新
+        """
+        return self.add_many([(analysis_data, site, timestamp, analysis_id)], replace=replace)
+
+    def add_many(self, records: Iterable[Tuple[Dict[str, Any], Optional[str], Any, Optional[str]]],
+                 replace: bool = False) -> int:
+        """批量索引 (分析数据, 站点, 时间, analysis_id)，按批提交事务并合并词频更新"""
+        from trend_rollup import site_of, _parse_time
+
+        indexed = 0
+        pending = []
+        pending_violations = 0
+        for analysis_data, site, timestamp, analysis_id in records:
+            site = site or site_of(analysis_data)
+            ts = _parse_time(timestamp or analysis_data.get('timestamp')).isoformat(sep=' ', timespec='seconds')
+            key = analysis_id or analysis_key(analysis_data, site)
+            pending.append((analysis_data, site, ts, key))
+            pending_violations += len(analysis_data.get('violations') or [])
+            if pending_violations >= BATCH_SIZE:
+                indexed += self._write(pending, replace)
+                pending = []
+                pending_violations = 0
+        if pending:
+            indexed += self._write(pending, replace)
+        return indexed
+
+    def _write(self, batch, replace: bool) -> int:
+        df = Counter()
+        indexed = 0
+        with self._lock, self._conn:
+            for analysis_data, site, ts, key in batch:
+                if replace:
+                    self._remove(key, df)
+                summary = analysis_data.get('summary') or {}
+                try:
+                    cur = self._conn.execute(
+                        'INSERT INTO analyses (analysis_key, site, timestamp, total_score) VALUES (?, ?, ?, ?)',
+                        (key, site, ts, summary.get('total_score')))
+                except sqlite3.IntegrityError:
+                    continue
+                row_id = cur.lastrowid
+                for violation in analysis_data.get('violations') or []:
+                    if not isinstance(violation, dict):
+                        continue
+                    cur = self._conn.execute(
+                        'INSERT INTO violations (analysis_id, type, category, data) VALUES (?, ?, ?, ?)',
+                        (row_id, violation.get('type'), violation.get('category'),
+                         json.dumps(violation, ensure_ascii=False)))
+                    violation_id = cur.lastrowid
+                    tokens = tokenize(searchable_text(violation))
+                    self._conn.executemany('INSERT INTO postings VALUES (?, ?)',
+                                           ((token, violation_id) for token in tokens))
+                    df.update(tokens)
+                    indexed += 1
+            self._conn.executemany('''
+                INSERT INTO terms VALUES (?, ?)
+                ON CONFLICT (token) DO UPDATE SET df = df + excluded.df
+            ''', df.items())
+            if replace:
+                self._conn.execute('DELETE FROM terms WHERE df <= 0')
+        return indexed
+
+    def _remove(self, key: str, df: Counter):
+        row = self._conn.execute('SELECT id FROM analyses WHERE analysis_key = ?', (key,)).fetchone()
+        if row is None:
+            return
+        for violation_id, data in self._conn.execute(
+                'SELECT id, data FROM violations WHERE analysis_id = ?', (row[0],)).fetchall():
+            tokens = tokenize(searchable_text(json.loads(data)))
+            self._conn.executemany('DELETE FROM postings WHERE token = ? AND violation_id = ?',
+                                   ((token, violation_id) for token in tokens))
+            df.subtract(tokens)
+        self._conn.execute('DELETE FROM violations WHERE analysis_id = ?', (row[0],))
+        self._conn.execute('DELETE FROM analyses WHERE id = ?', (row[0],))
+
+    def remove(self, analysis_id: str) -> bool:
+        """删除一次分析的索引"""
+        df = Counter()
+        with self._lock, self._conn:
+            exists = self._conn.execute('SELECT 1 FROM analyses WHERE analysis_key = ?', (analysis_id,)).fetchone()
+            self._remove(analysis_id, df)
+            self._conn.executemany('UPDATE terms SET df = df + ? WHERE token = ?',
+                                   ((n, token) for token, n in df.items()))
+            self._conn.execute('DELETE FROM terms WHERE df <= 0')
+        return exists is not None
+
+    def _df(self, token: str, prefix: bool) -> int:
+        if prefix:
+            row = self._conn.execute('SELECT SUM(df) FROM terms WHERE token >= ? AND token < ?',
+                                     (token, token + '\uffff')).fetchone()
+        else:
+            row = self._conn.execute('SELECT df FROM terms WHERE token = ?', (token,)).fetchone()
+        return (row[0] or 0) if row else 0
+
+    def _filter_sql(self, conditions: List[str]) -> str:
+        """按筛选条件读取违规项的FROM/WHERE：有分析级条件时从 analyses 的索引出发"""
+        if any(c.startswith('a.') for c in conditions):
+            sql = 'FROM analyses a CROSS JOIN violations v WHERE v.analysis_id = a.id'
+        else:
+            sql = 'FROM violations v CROSS JOIN analyses a WHERE a.id = v.analysis_id'
+        return sql + ''.join(f' AND {c}' for c in conditions)
+
+    def _estimate_filtered(self, conditions: List[str], params: list, cap: int) -> int:
+        """估计筛选条件命中的违规项数量，只按索引计数、最多数到 cap，返回0表示确实没有命中
+
+        分析级条件按命中的分析数乘以每次分析的平均违规项数估计，违规项级条件直接计数，两者取小
+        """
+        estimates = []
+        for prefix, table in (('a.', 'analyses a'), ('v.', 'violations v')):
+            parts = [(c, v) for c, v in zip(conditions, params) if c.startswith(prefix)]
+            if not parts:
+                continue
+            scale = 1
+            if prefix == 'a.':
+                analyses, violations = self._conn.execute(
+                    'SELECT (SELECT MAX(id) FROM analyses), (SELECT MAX(id) FROM violations)').fetchone()
+                scale = -(-(violations or 0) // (analyses or 1)) or 1
+            where = ' AND '.join(c for c, _ in parts)
+            count = self._conn.execute(f'SELECT COUNT(*) FROM (SELECT 1 FROM {table} WHERE {where} LIMIT ?)',
+                                       [v for _, v in parts] + [cap // scale + 1]).fetchone()[0]
+            estimates.append(count * scale)
+        return min(estimates)
+
+    def search(self, query: str, limit: int = 100, category: Optional[str] = None,
+               site: Optional[str] = None, violation_type: Optional[str] = None,
+               since: Optional[str] = None, until: Optional[str] = None) -> List[Dict[str, Any]]:
+        """检索同时包含所有查询词（空格分隔）的违规项，按索引先后从新到旧返回至多 limit 条"""
+        terms = [normalize(t) for t in query.split() if _RUN.search(normalize(t))]
+        term_tokens = [query_tokens(term) for term in terms]
+        tokens = {}
+        for token, prefix in (item for items in term_tokens for item in items):
+            tokens[token] = tokens.get(token, True) and prefix
+        if not tokens or limit <= 0:
+            return []
+
+        conditions = []
+        filter_params = []
+        for column, value in (('v.category', category), ('a.site', site), ('v.type', violation_type)):
+            if value:
+                conditions.append(f'{column} = ?')
+                filter_params.append(value)
+        if since:
+            conditions.append('a.timestamp >= ?')
+            filter_params.append(since)
+        if until:
+            operator, bound = _until_bound(until)
+            conditions.append(f'a.timestamp {operator} ?')
+            filter_params.append(bound)
+
+        columns = 'SELECT v.id, v.data, a.site, a.timestamp, a.analysis_key, a.total_score '
+        with self._lock:
+            df = {token: self._df(token, prefix) for token, prefix in tokens.items()}
+            if min(df.values()) == 0:
+                return []
+            # 前缀词元只在原文核对时检查。精确词元中，每个查询词取出现次数最少的一个作为代表，
+            # 从所有代表中最少的出发，先核对其他查询词的代表（同一查询词的词元几乎总是同时出现，
+            # 多个查询词没有交集时尽早排除），再核对其余精确词元
+            exact = sorted((token for token, prefix in tokens.items() if not prefix), key=lambda t: (df[t], t))
+            representatives = []
+            for items in term_tokens:
+                candidates = [token for token, _ in items if token in exact]
+                if candidates:
+                    best = min(candidates, key=lambda t: (df[t], t))
+                    if best not in representatives:
+                        representatives.append(best)
+            representatives.sort(key=lambda t: (df[t], t))
+            exact = representatives + [token for token in exact if token not in representatives]
+            driver_df = df[exact[0]] if exact else min(df.values())
+
+            estimate = None
+            if conditions:
+                # 筛选条件没有命中时不必读取倒排表
+                estimate = self._estimate_filtered(conditions, filter_params, driver_df // 4)
+                if estimate == 0:
+                    return []
+
+            if estimate is not None and estimate <= driver_df // 4:
+                # 筛选条件更有选择性：按条件读取违规项，再核对各精确词元的倒排表
+                sql = columns + self._filter_sql(conditions)
+                for _ in exact:
+                    sql += ' AND EXISTS (SELECT 1 FROM postings p WHERE p.token = ? AND p.violation_id = v.id)'
+                sql += ' ORDER BY v.id DESC'
+                cursors = [self._conn.execute(sql, filter_params + exact)]
+                rows = cursors[0]
+            else:
+                if exact:
+                    drivers = exact[:1]
+                else:
+                    token = min(tokens, key=lambda t: (df[t], t))
+                    drivers = [r[0] for r in self._conn.execute(
+                        'SELECT token FROM terms WHERE token >= ? AND token < ?', (token, token + '\uffff'))]
+
+                sql = columns + ('FROM postings p0 CROSS JOIN violations v CROSS JOIN analyses a '
+                                 'WHERE p0.token = ? AND v.id = p0.violation_id AND a.id = v.analysis_id')
+                for _ in exact[1:]:
+                    sql += ' AND EXISTS (SELECT 1 FROM postings p WHERE p.token = ? AND p.violation_id = p0.violation_id)'
+                sql += ''.join(f' AND {c}' for c in conditions)
+                sql += ' ORDER BY p0.violation_id DESC'
+
+                # 每个驱动词元的倒排表已按违规项倒序，多路归并后逐条读取，取够即停
+                cursors = [self._conn.execute(sql, [token] + exact[1:] + filter_params) for token in drivers]
+                rows = heapq.merge(*cursors, key=lambda row: -row[0])
+
+            results = []
+            last_id = None
+            for violation_id, data, row_site, ts, key, score in rows:
+                # 前缀匹配时同一违规项可能来自多个词元
+                if violation_id == last_id:
+                    continue
+                last_id = violation_id
+                violation = json.loads(data)
+                text = normalize(searchable_text(violation))
+                if not all(term in text for term in terms):
+                    continue
+                results.append({'id': violation_id, 'site': row_site, 'timestamp': ts,
+                                'analysis_id': key, 'total_score': score, 'violation': violation})
+                if len(results) >= limit:
+                    break
+            for cursor in cursors:
+                cursor.close()
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                'analyses': self._conn.execute('SELECT COUNT(*) FROM analyses').fetchone()[0],
+                'violations': self._conn.execute('SELECT COUNT(*) FROM violations').fetchone()[0],
+                'terms': self._conn.execute('SELECT COUNT(*) FROM terms').fetchone()[0],
+            }
+
+
+def results_to_analysis(query: str, results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """把检索结果组装为报告生成器使用的分析数据
+
+    每个违规项描述前标注来源站点和检测时间，安全评分取所涉及检测的平均分
+    """
+    violations = []
+    scores = {}
+    suggestions = Counter()
+    for result in results:
+        violation = dict(result['violation'])
+        violation['description'] = f"[{result['site']} {result['timestamp']}] {violation.get('description', '')}"
+        violation['site'] = result['site']
+        violation['inspected_at'] = result['timestamp']
+        violations.append(violation)
+        if result['total_score'] is not None:
+            scores[result['analysis_id']] = result['total_score']
+        suggestions.update(result['violation'].get('suggestions') or [])
+
+    severe = sum(1 for v in violations if v.get('type') == '严重违规')
+    sites = len(set(r['site'] for r in results))
+    return {
+        'location': f"检索: {query}",
+        'timestamp': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'violations': violations,
+        'summary': {
+            'severe_count': severe,
+            'normal_count': len(violations) - severe,
+            'total_score': round(sum(scores.values()) / len(scores)) if scores else 0,
+            'overall_assessment': f"检索“{query}”命中 {len(violations)} 项违规，"
+                                  f"涉及 {len(set(r['analysis_id'] for r in results))} 次检测、{sites} 个站点",
+            'priority_actions': [s for s, _ in suggestions.most_common(5)],
+        },
+    }
+
+
+def search_report(query: str, formats: List[str], output_dir: str = './temp', limit: int = 500,
+                  db_path: str = SEARCH_DB, profile: Optional[str] = None, archive: bool = False, **filters):
+    """检索并生成筛选后的报告
+
+    单一PDF/Word格式返回是否成功，多种格式返回 generate_bundle 的输出清单（任一格式失败时为None）；没有命中时返回None
+    """
+    import simple_report
+
+    index = SearchIndex(db_path)
+    try:
+        results = index.search(query, limit=limit, **filters)
+    finally:
+        index.close()
+    if not results:
+        print(f"未检索到“{query}”相关的违规项")
+        return None
+    data = results_to_analysis(query, results)
+    # 结果来自不同检测，坐标不可比，不做重叠合并
+    if len(formats) == 1 and formats[0] in ('pdf', 'word'):
+        return simple_report.generate_report(data, formats[0], output_dir, dedupe=False, profile=profile)
+    return simple_report.generate_bundle(data, formats, output_dir, dedupe=False, profile=profile, archive=archive)
+
+
+def iter_records(paths: List[str]) -> Iterable[Tuple[Dict[str, Any], Optional[str], Any, Optional[str]]]:
+    """读取分析数据JSON文件（目录中的 *.json 也会读取）
+
+    兼容 {analysis: {...}} 的包装格式（bulk_reanalyze 的输出）
+    """
+    for path in paths:
+        files = [path]
+        if os.path.isdir(path):
+            files = sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith('.json'))
+        for file_path in files:
+            try:
+                with open(file_path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ 跳过 {file_path}: {e}")
+                continue
+            if not isinstance(data, dict):
+                continue
+            analysis = data.get('analysis', data)
+            timestamp = data.get('timestamp') or data.get('analyzed_at')
+            yield analysis, data.get('site') or data.get('location'), timestamp, None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='违规项全文检索')
+    parser.add_argument('--db', default=SEARCH_DB, help=f'索引库路径 (默认: {SEARCH_DB})')
+    sub = parser.add_subparsers(dest='command')
+
+    index_parser = sub.add_parser('index', help='索引分析结果')
+    index_parser.add_argument('paths', nargs='+', help='分析数据JSON文件或目录')
+    index_parser.add_argument('--replace', action='store_true', help='已索引的分析先删除再重新索引')
+    index_parser.add_argument('--site', help='站点名称，覆盖数据中的站点')
+    index_parser.add_argument('--timestamp', help='检测时间，覆盖数据中的时间')
+    index_parser.add_argument('--analysis-id', help='分析标识，同一标识只索引一次（用于索引单个文件）')
+
+    def add_filters(p):
+        p.add_argument('query', help='检索词，多个词用空格分隔（同时包含）')
+        p.add_argument('--category', help='违规类别')
+        p.add_argument('--site', help='站点名称')
+        p.add_argument('--type', dest='violation_type', choices=['严重违规', '一般违规'], help='违规类型')
+        p.add_argument('--since', help='检测时间下限，如 2025-08-01')
+        p.add_argument('--until', help='检测时间上限，只给日期时包含当天，如 2025-08-31')
+
+    query_parser = sub.add_parser('query', help='检索违规项')
+    add_filters(query_parser)
+    query_parser.add_argument('--limit', type=int, default=20, help='返回条数 (默认: 20)')
+
+    report_parser = sub.add_parser('report', help='按检索结果生成报告')
+    add_filters(report_parser)
+    report_parser.add_argument('--limit', type=int, default=500, help='报告最多包含的违规项 (默认: 500)')
+    report_parser.add_argument('--formats', default='pdf', help='报告格式，逗号分隔 (pdf,word,excel,json) 或 all')
+    report_parser.add_argument('--output', default='./temp', help='输出目录 (默认: ./temp)')
+    report_parser.add_argument('--profile', choices=['mobile', 'archive', 'print'], help='输出配置')
+    report_parser.add_argument('--zip', action='store_true', help='多种格式时打包为zip')
+
+    sub.add_parser('stats', help='索引统计')
+
+    args = parser.parse_args()
+    if args.command == 'report':
+        import simple_report
+
+        formats = list(simple_report.GENERATORS) if args.formats == 'all' else \
+            [f.strip() for f in args.formats.split(',') if f.strip()]
+        result = search_report(args.query, formats, args.output, args.limit, args.db, args.profile, args.zip,
+                               category=args.category, site=args.site, violation_type=args.violation_type,
+                               since=args.since, until=args.until)
+        if isinstance(result, dict):
+            print(f"清单文件: {result['manifest']}")
+        return 0 if result else 1
+
+    index = SearchIndex(args.db)
+    try:
+        if args.command == 'index':
+            records = ((analysis, args.site or site, args.timestamp or timestamp, args.analysis_id or key)
+                       for analysis, site, timestamp, key in iter_records(args.paths))
+            count = index.add_many(records, replace=args.replace)
+            print(f"✅ 新索引 {count} 项违规")
+        elif args.command == 'query':
+            import time
+
+            start = time.perf_counter()
+            results = index.search(args.query, limit=args.limit, category=args.category, site=args.site,
+                                   violation_type=args.violation_type, since=args.since, until=args.until)
+            elapsed = (time.perf_counter() - start) * 1000
+            for r in results:
+                v = r['violation']
+                print(f"[{r['timestamp']}] {r['site']} | {v.get('type', '')} | {v.get('category', '')} | "
+                      f"{v.get('description', '')}")
+            more = '（已达上限）' if len(results) >= args.limit else ''
+            print(f"🔍 命中 {len(results)} 项{more}，耗时 {elapsed:.1f}ms")
+        elif args.command == 'stats':
+            print(json.dumps(index.stats(), ensure_ascii=False, indent=2))
+        else:
+            parser.print_help()
+            return 1
+    finally:
+        index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
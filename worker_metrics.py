@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+报告与分析进程指标
+计数器、直方图、仪表盘，以Prometheus文本格式通过本地端口暴露或写入文件。
+
+报告进程通常是每次调用新启动的短进程，设置 WORKER_METRICS_FILE 后会在退出时
+把本进程的指标累加到该文件（配合node_exporter的textfile采集）。
+导入本模块不会开启端口；常驻进程（如批量分析）调用 start_http_server_from_env()
+按 WORKER_METRICS_PORT 开启 /metrics
+"""
+
+import os
+import json
+import atexit
+import bisect
+import threading
+from typing import Dict, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(key) + ([extra] if extra else [])
+    if not items:
+        return ''
+    body = ','.join('{}="{}"'.format(k, v.replace('\\', '\\\\').replace('"', '\\"')) for k, v in items)
+    return '{' + body + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ''
+
+    def __init__(self, name: str, help_text: str, lock: threading.Lock):
+        self.name = name
+        self.help = help_text
+        self._lock = lock
+        self._values = {}
+
+    def header(self) -> str:
+        return f"# HELP {self.name} {self.help}\n# TYPE {self.name} {self.kind}\n"
+
+    def _items(self):
+        """加锁复制当前值，渲染和导出时其他线程可能仍在写入"""
+        with self._lock:
+            return list(self._values.items())
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> str:
+        lines = [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in sorted(self._items())]
+        return self.header() + ''.join(line + '\n' for line in lines)
+
+    def snapshot(self):
+        return [[list(map(list, k)), v] for k, v in self._items()]
+
+    def merge(self, state):
+        with self._lock:
+            for key, value in state:
+                key = tuple(tuple(item) for item in key)
+                self._values[key] = self._values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    render = Counter.render
+    snapshot = Counter.snapshot
+
+    def merge(self, state):
+        # 仪表盘表示当前值，以最新进程为准，只补充本进程没有的标签
+        with self._lock:
+            for key, value in state:
+                self._values.setdefault(tuple(tuple(item) for item in key), value)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str, lock: threading.Lock, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, lock)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def _items(self):
+        # 桶计数列表会被原地修改，需一并复制
+        with self._lock:
+            return [(k, [list(counts), total, count]) for k, (counts, total, count) in self._values.items()]
+
+    def render(self) -> str:
+        out = [self.header()]
+        for key, (counts, total, count) in sorted(self._items()):
+            cumulative = 0
+            for bound, c in zip(self.buckets + (float('inf'),), counts):
+                cumulative += c
+                out.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}\n")
+            out.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}\n")
+            out.append(f"{self.name}_count{_format_labels(key)} {count}\n")
+        return ''.join(out)
+
+    snapshot = Counter.snapshot
+
+    def merge(self, state):
+        with self._lock:
+            for key, (counts, total, count) in state:
+                key = tuple(tuple(item) for item in key)
+                mine = self._values.get(key)
+                if mine is None or len(counts) != len(mine[0]):
+                    self._values[key] = [list(counts), total, count]
+                else:
+                    mine[0] = [a + b for a, b in zip(mine[0], counts)]
+                    mine[1] += total
+                    mine[2] += count
+
+
+class Registry:
+    """指标注册表"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}
+
+    def _get(self, cls, name, help_text, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, threading.Lock(), **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get(Counter, name, help_text)
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        return self._get(Gauge, name, help_text)
+
+    def histogram(self, name: str, help_text: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help_text, buckets=buckets)
+
+    def render(self) -> str:
+        """Prometheus文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return ''.join(m.render() for m in metrics)
+
+    def dump(self, path: str, accumulate: bool = True):
+        """写入Prometheus文本文件
+
+        accumulate为True时与文件中已有的指标（保存在同名 .json 状态文件中）累加，
+        多个短进程依次写入同一文件时计数不会相互覆盖
+        """
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        state_path = path + '.json'
+        with open(path + '.lock', 'a') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            if accumulate and os.path.exists(state_path):
+                try:
+                    with open(state_path, 'r', encoding='utf-8') as f:
+                        previous = json.load(f)
+                except ValueError:
+                    previous = {}
+                merged = Registry()
+                with self._lock:
+                    metrics = list(self._metrics.values())
+                for metric in metrics:
+                    copy = merged._get(type(metric), metric.name, metric.help,
+                                       **({'buckets': metric.buckets} if isinstance(metric, Histogram) else {}))
+                    copy.merge(metric.snapshot())
+                    copy.merge(previous.get(metric.name, {}).get('values', []))
+                _update_hit_ratio(merged)
+                target = merged
+            else:
+                target = self
+            snapshot = {m.name: {'values': m.snapshot()} for m in target._metrics.values()}
+            for out_path, text in ((state_path, json.dumps(snapshot)), (path, target.render())):
+                tmp_path = out_path + '.tmp'
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, out_path)
+
+
+REGISTRY = Registry()
+
+REPORTS_TOTAL = REGISTRY.counter('report_generated_total', '生成的报告数量（按格式和结果）')
+RENDER_SECONDS = REGISTRY.histogram('report_render_seconds', '报告生成耗时（秒）')
+INPUT_VIOLATIONS = REGISTRY.histogram('report_input_violations', '报告输入的违规项数量',
+                                      buckets=(0, 1, 2, 5, 10, 20, 50, 100, 500))
+OUTPUT_BYTES = REGISTRY.histogram('report_output_bytes', '报告文件大小（字节）',
+                                  buckets=(16e3, 64e3, 256e3, 1e6, 4e6, 16e6, 64e6))
+QUEUE_DEPTH = REGISTRY.gauge('worker_queue_depth', '等待处理的任务数')
+CACHE_REQUESTS = REGISTRY.counter('worker_cache_requests_total', '缓存访问次数（按缓存和是否命中）')
+CACHE_HIT_RATIO = REGISTRY.gauge('worker_cache_hit_ratio', '缓存命中率')
+
+_cache_counts = {}
+_cache_lock = threading.Lock()
+
+
+def observe_report(fmt: str, ok: bool, seconds: float, violation_count: int,
+                   output_path: Optional[str] = None):
+    """记录一次报告生成"""
+    REPORTS_TOTAL.inc(format=fmt, outcome='success' if ok else 'failure')
+    RENDER_SECONDS.observe(seconds, format=fmt)
+    INPUT_VIOLATIONS.observe(violation_count, format=fmt)
+    if ok and output_path:
+        try:
+            OUTPUT_BYTES.observe(os.path.getsize(output_path), format=fmt)
+        except OSError:
+            pass
+
+
+def record_cache(cache: str, hit: bool):
+    """记录一次缓存访问并更新命中率"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+    with _cache_lock:
+        hits, total = _cache_counts.get(cache, (0, 0))
+        hits, total = hits + (1 if hit else 0), total + 1
+        _cache_counts[cache] = (hits, total)
+    CACHE_HIT_RATIO.set(hits / total, cache=cache)
+
+
+def _update_hit_ratio(registry: Registry):
+    """按累加后的缓存访问计数重新计算命中率，避免沿用单个进程的命中率"""
+    requests = registry._metrics.get(CACHE_REQUESTS.name)
+    ratio = registry._metrics.get(CACHE_HIT_RATIO.name)
+    if requests is None or ratio is None:
+        return
+    counts = {}
+    for key, value in requests._items():
+        labels = dict(key)
+        hits, total = counts.get(labels.get('cache', ''), (0, 0))
+        counts[labels.get('cache', '')] = (hits + (value if labels.get('result') == 'hit' else 0), total + value)
+    for cache, (hits, total) in counts.items():
+        if total:
+            ratio.set(hits / total, cache=cache)
+
+
+def start_http_server(port: int = 9108, host: str = '127.0.0.1'):
+    """在后台线程通过 /metrics 暴露指标，返回 ThreadingHTTPServer"""
+    # 报告进程大多不开启端口，按需导入以免拖慢启动
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = REGISTRY.render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name='worker-metrics').start()
+    return server
+
+
+def _dump_at_exit():
+    path = os.environ.get('WORKER_METRICS_FILE')
+    if path and any(m._values for m in REGISTRY._metrics.values()):
+        try:
+            REGISTRY.dump(path)
+        except OSError as e:
+            print(f"指标写入失败: {e}")
+
+
+def start_http_server_from_env():
+    """设置了 WORKER_METRICS_PORT 时开启 /metrics，供常驻进程在启动时调用"""
+    port = os.environ.get('WORKER_METRICS_PORT')
+    if not port:
+        return None
+    try:
+        return start_http_server(int(port))
+    except (OSError, ValueError) as e:
+        print(f"指标端口启动失败: {e}")
+        return None
+
+
+atexit.register(_dump_at_exit)